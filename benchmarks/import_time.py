@@ -0,0 +1,44 @@
+"""Measure how long importing pyeconet takes in a fresh interpreter.
+
+Usage: python benchmarks/import_time.py [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+
+TARGETS = {
+    "pyeconet": "import pyeconet",
+    "pyeconet.equipment": "from pyeconet.equipment.water_heater import WaterHeaterOperationMode",
+    "pyeconet.api": "from pyeconet import EcoNetApiInterface",
+    "ssl context": "from pyeconet.api import _get_ssl_context; _get_ssl_context()",
+}
+
+TIMER = "import time; _start = time.perf_counter(); {}; print(time.perf_counter() - _start)"
+
+
+def measure(statement: str, runs: int) -> list:
+    env = dict(os.environ, PYTHONPATH=SRC, PYTHONDONTWRITEBYTECODE="1")
+    results = []
+    for _ in range(runs):
+        output = subprocess.check_output(
+            [sys.executable, "-c", TIMER.format(statement)], env=env
+        )
+        results.append(float(output) * 1000)
+    return results
+
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    for name, statement in TARGETS.items():
+        results = measure(statement, runs)
+        print(
+            f"{name:20} median {statistics.median(results):8.2f} ms"
+            f"  min {min(results):8.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,13 @@
 """Define module-level imports"""
-from .api import EcoNetApiInterface  # noqa
 from .equipment import EquipmentType
+
+__all__ = ["EcoNetApiInterface", "EquipmentType"]
+
+
+def __getattr__(name):
+    # The API pulls in aiohttp and paho, only import it once it's actually used
+    if name == "EcoNetApiInterface":
+        from .api import EcoNetApiInterface
+
+        return EcoNetApiInterface
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
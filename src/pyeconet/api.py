@@ -1,10 +1,17 @@
+import asyncio
+import itertools
+from collections import OrderedDict, deque
 from datetime import datetime
+from functools import lru_cache
 import time
+from time import perf_counter
 import ssl
 import json
-from typing import Type, TypeVar, List, Dict, Optional
+from typing import Callable, Type, TypeVar, List, Dict, Optional, Tuple
 import logging
+import threading
 
+from pyeconet.cache import ResponseCache
 from pyeconet.errors import (
     PyeconetError,
     InvalidCredentialsError,
@@ -14,10 +21,26 @@ from pyeconet.errors import (
 from pyeconet.equipment import Equipment, EquipmentType
 from pyeconet.equipment.water_heater import WaterHeater
 from pyeconet.equipment.thermostat import Thermostat
-
-import aiohttp
-from aiohttp.client_exceptions import ClientError
-import paho.mqtt.client as mqtt
+from pyeconet.events import (
+    CommandAckEvent,
+    ConnectionChangeEvent,
+    DialogEvent,
+    EventStream,
+    OverflowPolicy,
+    StateChangeEvent,
+)
+from pyeconet.interest import FieldInterest, InterestPolicy
+from pyeconet.interning import DEFAULT_METADATA_POOL, MetadataPool
+from pyeconet.location import Location
+from pyeconet.normalize import NormalizationPipeline, Normalizer
+from pyeconet.outbox import CommandOutbox, DeliveryStatus, OutboundCommand
+from pyeconet.polling import PollingPolicy, RestPoller
+from pyeconet.registry import EquipmentRegistry
+from pyeconet.reconnect import ConnectionState, ReconnectPolicy, ReconnectSupervisor
+from pyeconet.resilience import DEFAULT_REST_RESILIENCE, RestResilience
+from pyeconet.sharding import ShardedDispatcher
+from pyeconet.singleflight import SingleFlight
+from pyeconet.versioning import StalenessPolicy, UpdateSource
 
 HOST = "rheem.clearblade.com"
 REST_URL = f"https://{HOST}/api/v/1"
@@ -31,6 +54,14 @@ HEADERS = {
 
 _LOGGER = logging.getLogger(__name__)
 
+# Transaction ids of published commands remembered to report CommandAckEvents
+_MAX_PENDING_TRANSACTIONS = 1000
+# Seconds a transaction id waits for the cloud to echo it back
+_TRANSACTION_TIMEOUT = 300.0
+
+# Keeps transaction ids of commands published within the same millisecond apart
+_transaction_counter = itertools.count(1)
+
 ApiType = TypeVar("ApiType", bound="EcoNetApiInterface")
 
 # Via https://knowledge.digicert.com/general-information/digicert-trusted-root-authority-certificates
@@ -78,15 +109,35 @@ YSEY1QSteDwsOoBrp+uvFRTp2InBuThs4pFsiv9kuXclVzDAGySj4dzp30d8tbQk
 CAUw7C29C79Fv1C5qfPrmAESrciIxpg0X40KPMbp1ZWVbd4=
 -----END CERTIFICATE-----"""
 
-def _create_ssl_context() -> ssl.SSLContext:
-    """Create a SSL context for the MQTT connection."""
+@lru_cache(maxsize=None)
+def _get_ssl_context() -> ssl.SSLContext:
+    """Return the SSL context for the REST and MQTT connections.
+
+    Loading the system CA bundle is slow, so the context is only created the
+    first time a connection is made and shared afterwards.
+    """
     context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
     context.load_default_certs()
     context.load_verify_locations(cadata=CLEAR_BLADE_DIGICERT_DISTRUSTED_ROOT)
     return context
 
 
-_SSL_CONTEXT = _create_ssl_context()
+def _payload_key(payload: Dict) -> str:
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def _watched_changed(watched, update: Dict, before: Dict, after: Dict) -> bool:
+    """Return True if update changed the value of a watched field, always True if everything is watched"""
+    if watched is None:
+        return True
+    return any(before.get(field) != after.get(field) for field in watched if field in update)
+
+
+def _carries_constraints(update: Dict) -> bool:
+    for value in update.values():
+        if isinstance(value, dict) and "constraints" in value:
+            return True
+    return False
 
 
 class EcoNetApiInterface:
@@ -109,8 +160,41 @@ class EcoNetApiInterface:
         self._user_token: str = user_token
         self._account_id: str = account_id
         self._locations: List = []
-        self._equipment: Dict = {}
+        self._location_map: Dict[str, Location] = {}
+        self._normalization = NormalizationPipeline()
+        self._equipment: EquipmentRegistry = EquipmentRegistry()
         self._mqtt_client = None
+        self._recorder = None
+        self._replay = None
+        self._metrics = None
+        self._reconnect: Optional[ReconnectSupervisor] = None
+        self._connection_state = ConnectionState.DISCONNECTED
+        self._connection_callback = None
+        self._dispatcher: Optional[ShardedDispatcher] = None
+        self._update_listeners: List[Callable] = []
+        self._event_streams: List[EventStream] = []
+        self._history_settings: Optional[Dict] = None
+        self._runtime_settings: Optional[Dict] = None
+        self._metadata_pool: Optional[MetadataPool] = DEFAULT_METADATA_POOL
+        # transaction id -> (serial number, time.monotonic() it was published)
+        self._pending_transactions: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        # Added to on the event loop, popped on paho's thread
+        self._transactions_lock = threading.Lock()
+        self._poller: Optional[RestPoller] = None
+        self._reported_listeners: List[Callable] = []
+        self._publish_listeners: List[Callable] = []
+        self._flights = SingleFlight()
+        self._response_cache: Optional[ResponseCache] = ResponseCache()
+        self._optimistic = None
+        self._outbox = CommandOutbox()
+        self._outbox.add_listener(self._command_status)
+        self._interest: Optional[FieldInterest] = None
+        self._staleness: Optional[StalenessPolicy] = StalenessPolicy()
+        self._rest: RestResilience = DEFAULT_REST_RESILIENCE
+        # MQTT messages held back while start() is still loading equipment
+        self._early_lock = threading.Lock()
+        self._early_messages: Optional[deque] = None
+        self._early_dropped = 0
 
     @property
     def user_token(self) -> str:
@@ -122,6 +206,166 @@ class EcoNetApiInterface:
         """Return the current user token"""
         return self._account_id
 
+    def set_recorder(self, recorder) -> None:
+        """Capture REST responses and MQTT messages with an EcoNetRecorder (None to stop)"""
+        self._recorder = recorder
+
+    def set_replay(self, replay) -> None:
+        """Serve REST responses from an EcoNetReplay instead of the EcoNet cloud (None to stop)"""
+        self._replay = replay
+
+    @property
+    def connection_state(self) -> ConnectionState:
+        """Return the current MQTT connection state"""
+        return self._connection_state
+
+    def set_connection_callback(self, callback) -> None:
+        """Call callback(ConnectionState) whenever the MQTT connection state changes"""
+        self._connection_callback = callback
+
+    def _set_connection_state(self, state: ConnectionState) -> None:
+        if state == self._connection_state:
+            return
+        _LOGGER.debug("EcoNet MQTT connection state: %s", state.name)
+        self._connection_state = state
+        if self._poller is not None:
+            self._poller.connection_changed(state)
+        if self._connection_callback is not None:
+            self._connection_callback(state)
+        if self._event_streams:
+            self._emit(ConnectionChangeEvent(state, time.time()))
+
+    def events(
+            self,
+            maxsize: int = 1000,
+            policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+            event_types: Optional[List[type]] = None,
+            serial_numbers: Optional[List[str]] = None,
+            event_filter: Optional[Callable] = None,
+    ) -> EventStream:
+        """Return a new async iterator of StateChangeEvent, ConnectionChangeEvent,
+        CommandAckEvent and DialogEvent, must be called from the event loop consuming it.
+
+        Args:
+            maxsize (int): Number of events buffered before the overflow policy applies.
+            policy (OverflowPolicy): Drop the oldest event, coalesce state changes per
+                device or block the producer when the buffer is full.
+            event_types (list): Only deliver these event classes.
+            serial_numbers (list): Only deliver device events for these serial numbers.
+            event_filter (callable): Only deliver events for which this returns True.
+        """
+        stream = EventStream(
+            asyncio.get_running_loop(),
+            maxsize,
+            policy,
+            event_types,
+            serial_numbers,
+            event_filter,
+            on_close=self._remove_event_stream,
+        )
+        self._event_streams.append(stream)
+        return stream
+
+    def _remove_event_stream(self, stream: EventStream) -> None:
+        if stream in self._event_streams:
+            self._event_streams.remove(stream)
+
+    def _emit(self, event) -> None:
+        for stream in list(self._event_streams):
+            stream.offer(event)
+
+    def _energy_usage_updated(self, equipment: Equipment) -> None:
+        location = self._location_map.get(equipment.location_id)
+        if location is not None:
+            location.equipment_changed(equipment)
+
+    def _dialog_received(self, equipment: Equipment, dialog: Dict) -> None:
+        if self._event_streams:
+            self._emit(
+                DialogEvent(equipment.serial_number, equipment.device_id, dialog, time.time())
+            )
+
+    def add_update_listener(self, listener: Callable) -> Callable[[], None]:
+        """Call listener(equipment, fields) after fields of any equipment are updated.
+
+        Returns a function that removes the listener again.
+        """
+        self._update_listeners.append(listener)
+
+        def remove() -> None:
+            if listener in self._update_listeners:
+                self._update_listeners.remove(listener)
+
+        return remove
+
+    def _add_reported_listener(self, listener: Callable) -> Callable[[], None]:
+        """Call listener(equipment, update) after equipment reported its own state, over MQTT or REST"""
+        self._reported_listeners.append(listener)
+
+        def remove() -> None:
+            if listener in self._reported_listeners:
+                self._reported_listeners.remove(listener)
+
+        return remove
+
+    def _state_reported(self, equipment: Equipment, update: Dict) -> None:
+        for listener in self._reported_listeners:
+            try:
+                listener(equipment, update)
+            except Exception as err:
+                _LOGGER.exception(err)
+
+    def _add_publish_listener(self, listener: Callable) -> Callable[[], None]:
+        """Call listener(serial_number, payload) for every command published"""
+        self._publish_listeners.append(listener)
+
+        def remove() -> None:
+            if listener in self._publish_listeners:
+                self._publish_listeners.remove(listener)
+
+        return remove
+
+    def _equipment_updated(self, equipment: Equipment, fields: List[str]) -> None:
+        self._equipment.reindex(equipment, fields)
+        location = self._location_map.get(equipment.location_id)
+        if location is not None:
+            location.equipment_changed(equipment, fields)
+        if self._interest is not None:
+            watched = self._interest.fields_for(equipment.serial_number)
+            if watched is not None:
+                fields = [field for field in fields if field in watched]
+                if not fields:
+                    return
+        if self._event_streams:
+            self._emit(
+                StateChangeEvent(
+                    equipment.serial_number, equipment.device_id, tuple(fields), time.time()
+                )
+            )
+        for listener in self._update_listeners:
+            try:
+                listener(equipment, fields)
+            except Exception as err:
+                _LOGGER.exception(err)
+
+    @property
+    def metrics(self):
+        """Return the attached EcoNetMetrics, or None while metrics are disabled"""
+        return self._metrics
+
+    def enable_metrics(self, metrics=None):
+        """Start collecting metrics, optionally into a shared EcoNetMetrics registry"""
+        if metrics is None:
+            from pyeconet.metrics import EcoNetMetrics
+
+            metrics = EcoNetMetrics()
+        self._metrics = metrics
+        metrics.equipment.set(len(self._equipment))
+        return metrics
+
+    def disable_metrics(self) -> None:
+        self._metrics = None
+
     @classmethod
     async def login(cls: Type[ApiType], email: str, password: str) -> ApiType:
         """Create an EcoNetApiInterface object using email and password
@@ -134,6 +378,59 @@ class EcoNetApiInterface:
         await this_class._authenticate({"email": email, "password": password})
         return this_class
 
+    def watch_fields(
+            self,
+            fields: List[str],
+            serial_number: Optional[str] = None,
+            policy: Optional[InterestPolicy] = None,
+    ) -> FieldInterest:
+        """Only process and notify about updates touching fields, for one equipment or all of them
+
+        Update callbacks of equipment with watched fields only fire when one of
+        them changes value, update listeners and event streams only hear about
+        watched fields. Messages without any watched field are still applied,
+        without callbacks, or not even decoded with InterestPolicy.DROP.
+        """
+        if self._interest is None:
+            self._interest = FieldInterest()
+        if policy is not None:
+            self._interest.policy = policy
+        self._interest.watch(fields, serial_number)
+        return self._interest
+
+    def unwatch_fields(self, fields: Optional[List[str]] = None, serial_number: Optional[str] = None) -> None:
+        """Stop watching fields (all if None) of one equipment or the global ones"""
+        if self._interest is not None:
+            self._interest.unwatch(fields, serial_number)
+
+    @property
+    def staleness_policy(self) -> Optional[StalenessPolicy]:
+        return self._staleness
+
+    def set_staleness_policy(self, policy: Optional[StalenessPolicy]) -> None:
+        """Reject stale field writes according to policy, None applies every update as it arrives"""
+        self._staleness = policy
+        for equipment in self._equipment.values():
+            equipment._versions = None
+
+    def register_normalizer(self, normalizer: Normalizer) -> None:
+        """Add a fix-up applied to incoming updates of the normalizer's field"""
+        self._normalization.register(normalizer)
+        for equipment in self._equipment.values():
+            equipment._normalizer = None
+
+    def set_metadata_pool(self, pool: Optional[MetadataPool]) -> None:
+        """Share constraint metadata through pool, None keeps a private copy per equipment
+
+        Every interface uses a process wide pool by default.
+        """
+        for equipment in self._equipment.values():
+            if self._metadata_pool is not None:
+                self._metadata_pool.release_equipment(equipment)
+            if pool is not None:
+                pool.intern_equipment(equipment)
+        self._metadata_pool = pool
+
     def check_mode_enum(self, equip, enumtext=None):
         # Fix enumeration of Emergency Heat in Thermostat, maybe others?
         if "@MODE" in equip and isinstance(equip["@MODE"], Dict):
@@ -165,13 +462,97 @@ class EcoNetApiInterface:
         update, __ = self.check_mode_enum(update, enumtext)
         return equip, update
 
-    def subscribe(self):
-        """Subscribe to the MQTT updates"""
+    def subscribe(
+            self,
+            reconnect_policy: Optional[ReconnectPolicy] = None,
+            workers: int = 0,
+            polling_policy: Optional[PollingPolicy] = None,
+            fallback_polling: bool = True,
+    ):
+        """Subscribe to the MQTT updates
+
+        Args:
+            reconnect_policy (ReconnectPolicy): Backoff and resync settings used after
+                the connection drops.
+            workers (int): Process messages on this many worker threads, partitioned by
+                device name, instead of on paho's network thread.
+            polling_policy (PollingPolicy): Interval settings of the REST polling fallback.
+            fallback_polling (bool): Poll equipment over REST while MQTT is unavailable.
+        """
         if not self._equipment:
             _LOGGER.error(
                 "Equipment list is empty, did you call get_equipment before subscribing?"
             )
             return False
+        self._connect(reconnect_policy, workers, polling_policy, fallback_polling)
+
+    async def start(
+            self,
+            reconnect_policy: Optional[ReconnectPolicy] = None,
+            workers: int = 0,
+            polling_policy: Optional[PollingPolicy] = None,
+            fallback_polling: bool = True,
+            max_early_messages: int = 10000,
+    ) -> None:
+        """Log in if needed, then load the equipment and connect to MQTT at the same time
+
+        MQTT messages arriving before the equipment is loaded are held, up to
+        max_early_messages of them, and applied in arrival order once it is.
+        If more arrive, the oldest are dropped and the equipment is refreshed
+        over REST afterwards. Equipment already loaded is refreshed instead of
+        replaced, keeping its callbacks. Takes the same arguments as subscribe().
+        """
+        loop = asyncio.get_running_loop()
+        # Loading the CA certificates is slow, do it while logging in
+        context = loop.run_in_executor(None, _get_ssl_context)
+        if self._user_token is None:
+            await self._authenticate({"email": self.email, "password": self.password})
+        await context
+        if self._equipment:
+            if self._mqtt_client is None:
+                self._connect(reconnect_policy, workers, polling_policy, fallback_polling)
+            await self.refresh_equipment()
+            return
+        with self._early_lock:
+            self._early_messages = deque(maxlen=max_early_messages)
+            self._early_dropped = 0
+        self._connect(reconnect_policy, workers, polling_policy, fallback_polling)
+        try:
+            await self._get_equipment()
+        except BaseException:
+            self.unsubscribe()
+            with self._early_lock:
+                self._early_messages = None
+            raise
+        dropped = self._release_early_messages()
+        if dropped:
+            _LOGGER.warning(
+                "Dropped %s MQTT messages received before the equipment was loaded, refreshing it", dropped
+            )
+            await self.refresh_equipment()
+
+    def _release_early_messages(self) -> int:
+        """Apply the held messages in order, then let new ones through, returns how many were dropped"""
+        while True:
+            with self._early_lock:
+                if not self._early_messages:
+                    # Later messages go straight through, after all of the held ones
+                    self._early_messages = None
+                    return self._early_dropped
+                held = list(self._early_messages)
+                self._early_messages.clear()
+            _LOGGER.debug("Applying %s MQTT messages received before the equipment was loaded", len(held))
+            for msg in held:
+                self._route_message(msg)
+
+    def _connect(
+            self,
+            reconnect_policy: Optional[ReconnectPolicy],
+            workers: int,
+            polling_policy: Optional[PollingPolicy],
+            fallback_polling: bool,
+    ) -> None:
+        import paho.mqtt.client as mqtt
 
         self._mqtt_client = mqtt.Client(
             callback_api_version=mqtt.CallbackAPIVersion.VERSION1,
@@ -185,41 +566,130 @@ class EcoNetApiInterface:
         )
         self._mqtt_client.enable_logger()
 
-        self._mqtt_client.tls_set_context(_SSL_CONTEXT)
+        self._mqtt_client.tls_set_context(_get_ssl_context())
         self._mqtt_client.tls_insecure_set(False)
 
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if fallback_polling and loop is not None:
+            self._poller = RestPoller(self, polling_policy, loop)
+        self._reconnect = ReconnectSupervisor(self, reconnect_policy, loop)
+        self._reconnect.start(self._mqtt_client)
+        if workers:
+            self._dispatcher = ShardedDispatcher(self._process_message, workers)
+            self._dispatcher.start()
+
         self._mqtt_client.on_connect = self._on_connect
+        self._mqtt_client.on_connect_fail = self._on_connect_fail
         self._mqtt_client.on_message = self._on_message
         self._mqtt_client.on_disconnect = self._on_disconnect
+        self._mqtt_client.on_publish = self._on_publish
         self._mqtt_client.connect_async(HOST, 1884, 60)
         self._mqtt_client.loop_start()
 
-    def publish(self, payload: Dict, device_id: str, serial_number: str):
-        """Publish payload to the specified topic"""
-        date_time = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
-        transaction_id = f"ANDROID_{date_time}"
-        publish_payload = {
-            "transactionId": transaction_id,
-            "device_name": device_id,
-            "serial_number": serial_number,
-        }
-        publish_payload.update(payload)
-        self._mqtt_client.publish(
-            f"user/{self._account_id}/device/desired",
-            payload=json.dumps(publish_payload),
-        )
+    def publish(self, payload: Dict, device_id: str, serial_number: str) -> OutboundCommand:
+        """Queue payload for the equipment's desired topic and return the command to follow its delivery
+
+        Commands are sent with QoS 1 as soon as there is a connection, see CommandOutbox.
+        """
+        now = datetime.now()
+        date_time = now.strftime("%Y-%m-%dT%H:%M:%S")
+        transaction_id = f"ANDROID_{date_time}.{now.microsecond // 1000:03d}_{next(_transaction_counter)}"
+        if self._event_streams:
+            with self._transactions_lock:
+                self._expire_transactions(time.monotonic())
+                self._pending_transactions[transaction_id] = (serial_number, time.monotonic())
+                if len(self._pending_transactions) > _MAX_PENDING_TRANSACTIONS:
+                    self._pending_transactions.popitem(last=False)
+        if self._metrics is not None:
+            self._metrics.mqtt_publishes.inc()
+        if self._poller is not None:
+            self._poller.command_sent()
+        for listener in self._publish_listeners:
+            try:
+                listener(serial_number, payload)
+            except Exception as err:
+                _LOGGER.exception(err)
+        if self._mqtt_client is None:
+            _LOGGER.debug("Not subscribed yet, command for %s queued", serial_number)
+        command = self._outbox.enqueue(serial_number, device_id, payload, transaction_id)
+        if self._optimistic is not None:
+            equipment = self._equipment.get(serial_number)
+            if equipment is not None:
+                self._optimistic.command_published(equipment, payload, command)
+        return command
+
+    @property
+    def outbox(self) -> CommandOutbox:
+        """Return the queue commands are published from"""
+        return self._outbox
+
+    def set_command_outbox(self, outbox: CommandOutbox) -> None:
+        """Publish commands through outbox, e.g. one with a journal_path, before subscribing"""
+        self._outbox = outbox
+        outbox.add_listener(self._command_status)
+
+    def _command_status(self, command: OutboundCommand) -> None:
+        if command.status in (DeliveryStatus.SUPERSEDED, DeliveryStatus.EXPIRED, DeliveryStatus.DROPPED):
+            # Never sent, the cloud won't echo it
+            with self._transactions_lock:
+                self._pending_transactions.pop(command.transaction_id, None)
+        if self._optimistic is not None:
+            self._optimistic.command_status(command)
+
+    @property
+    def optimistic(self):
+        """Return the OptimisticUpdates tracker, or None while optimistic updates are disabled"""
+        return self._optimistic
+
+    def enable_optimistic_updates(self, timeout: float = 30.0, callback: Optional[Callable] = None):
+        """Apply commanded values locally straight away, pending confirmation by the equipment
+
+        callback(OptimisticChange) is called when a value becomes pending, is
+        confirmed or is rolled back. Unconfirmed values roll back timeout
+        seconds after the broker acknowledged their command. See OptimisticUpdates.
+        """
+        from pyeconet.optimistic import OptimisticUpdates
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        self._optimistic = OptimisticUpdates(self, timeout, callback, loop)
+        return self._optimistic
+
+    def disable_optimistic_updates(self) -> None:
+        """Stop applying commands locally, values still pending are kept as they are"""
+        self._optimistic = None
 
     def unsubscribe(self) -> None:
+        if self._reconnect is not None:
+            self._reconnect.stop()
         self._mqtt_client.loop_stop()
+        # Commands paho still held are lost with the client, send them again next time
+        self._outbox.connection_down(requeue=True)
+        self._mqtt_client = None
+        if self._poller is not None:
+            self._poller.stop()
+            self._poller = None
+        if self._dispatcher is not None:
+            self._dispatcher.stop()
+            self._dispatcher = None
 
     def _get_client_id(self) -> str:
         time_string = str(time.time()).replace(".", "")[:13]
         return f"{self.email}{time_string}_android"
 
     async def _get_equipment(self) -> None:
-        """Get a list of all the equipment for this user"""
+        """Get a list of all the equipment for this user, concurrent callers share one load"""
+        await self._flights.do("equipment", self._load_equipment)
+
+    async def _load_equipment(self) -> None:
         _locations: List = await self._get_location()
         for _location in _locations:
+            self._update_location(_location)
             # They spelled it wrong...
             for _equip in _location.get("equiptments"):
                 # Early exit if server returned error code
@@ -229,33 +699,156 @@ class EcoNetApiInterface:
                     continue
                 _equip, __ = self.check_mode_enum(_equip)
                 _equip_obj: Equipment = None
+                _location_id = _location.get("location_id")
                 if (
                         Equipment._coerce_type_from_string(_equip.get("device_type"))
                         == EquipmentType.WATER_HEATER
                 ):
                     _equip_obj = WaterHeater(_equip, self)
-                    self._equipment[_equip_obj.serial_number] = _equip_obj
+                    _equip_obj._location_id = _location_id
+                    self._add_equipment(_equip_obj)
                 elif (
                         Equipment._coerce_type_from_string(_equip.get("device_type"))
                         == EquipmentType.THERMOSTAT
                 ):
                     _equip_obj = Thermostat(_equip, self)
-                    self._equipment[_equip_obj.serial_number] = _equip_obj
+                    _equip_obj._location_id = _location_id
+                    self._add_equipment(_equip_obj)
                     for zoning_device in _equip.get("zoning_devices", []):
-                        _equip_obj = Thermostat(zoning_device, self)
-                        self._equipment[_equip_obj.serial_number] = _equip_obj
+                        _zone_obj = Thermostat(zoning_device, self)
+                        _zone_obj._location_id = _location_id
+                        _zone_obj._parent_serial_number = _equip_obj.serial_number
+                        self._add_equipment(_zone_obj)
+        if self._metrics is not None:
+            self._metrics.equipment.set(len(self._equipment))
+
+    def _update_location(self, location_info: Dict) -> Location:
+        """Create or update the Location object for a location from getUserDataForApp"""
+        location_id = location_info.get("location_id")
+        location = self._location_map.get(location_id)
+        if location is None:
+            location = Location(location_info)
+            self._location_map[location_id] = location
+        else:
+            location.update_location_info(location_info)
+        return location
+
+    @property
+    def locations(self) -> List[Location]:
+        """Return the loaded locations"""
+        return list(self._location_map.values())
+
+    def get_location(self, location_id: str) -> Optional[Location]:
+        return self._location_map.get(location_id)
+
+    def _add_equipment(self, equipment: Equipment) -> None:
+        """Store a newly built equipment and apply the API wide settings to it"""
+        if self._metadata_pool is not None:
+            self._metadata_pool.intern_equipment(equipment)
+        self._equipment[equipment.serial_number] = equipment
+        location = self._location_map.get(equipment.location_id)
+        if location is not None:
+            location.add_equipment(equipment)
+        if self._history_settings is not None:
+            equipment.enable_history(**self._history_settings)
+        if self._runtime_settings is not None:
+            equipment.enable_runtime_tracking(**self._runtime_settings)
+
+    def enable_history(
+            self, fields: Optional[List[str]] = None, depth: Optional[int] = None, dedupe: bool = True
+    ) -> None:
+        """Keep a bounded per-field history on all current and future equipment
+
+        See Equipment.enable_history.
+        """
+        self._history_settings = {"fields": fields, "depth": depth, "dedupe": dedupe}
+        for equipment in self._equipment.values():
+            equipment.enable_history(**self._history_settings)
+
+    def disable_history(self) -> None:
+        self._history_settings = None
+        for equipment in self._equipment.values():
+            equipment.disable_history()
+
+    def enable_runtime_tracking(self, short_cycle_seconds: float = 300, short_cycle_limit: int = 3) -> None:
+        """Accumulate runtime statistics on all current and future equipment
+
+        See Equipment.enable_runtime_tracking.
+        """
+        self._runtime_settings = {
+            "short_cycle_seconds": short_cycle_seconds,
+            "short_cycle_limit": short_cycle_limit,
+        }
+        for equipment in self._equipment.values():
+            equipment.enable_runtime_tracking(**self._runtime_settings)
 
-    async def refresh_equipment(self) -> None:
-        """Get a list of all the equipment for this user"""
+    def disable_runtime_tracking(self) -> None:
+        self._runtime_settings = None
+        for equipment in self._equipment.values():
+            equipment.disable_runtime_tracking()
+
+    @property
+    def polling(self) -> bool:
+        """Return True while equipment is polled over REST because MQTT is unavailable"""
+        return self._poller is not None and self._poller.active
+
+    async def refresh_equipment(self) -> int:
+        """Get a list of all the equipment for this user
+
+        Concurrent callers share one request. Returns the number of equipment
+        whose state changed.
+        """
+        return await self._flights.do("refresh", self._refresh_equipment)
+
+    async def _refresh_equipment(self) -> int:
+        changed = 0
+        # The snapshot is no newer than the request, MQTT updates received meanwhile win
+        requested = time.monotonic()
         _locations: List = await self._get_location()
         for _location in _locations:
+            self._update_location(_location)
             # They spelled it wrong...
             for _equip in _location.get("equiptments"):
                 serial = _equip.get("serial_number")
                 equipment = self._equipment.get(serial)
                 if equipment:
                     _equip, __ = self.check_mode_enum(_equip)
-                    equipment.update_equipment_info(_equip)
+                    if self._optimistic is not None:
+                        self._optimistic.reconcile(equipment, _equip, True)
+                    _info = equipment._equipment_info
+                    if any(_info.get(key) != value for key, value in _equip.items() if key[0] == "@"):
+                        changed += 1
+                    watched = (
+                        self._interest.fields_for(serial) if self._interest is not None else None
+                    )
+                    if equipment.update_equipment_info(
+                            _equip, False, UpdateSource.REST, requested
+                    ) and _watched_changed(watched, _equip, _info, equipment._equipment_info):
+                        equipment._notify_update()
+                    equipment._normalizer = None
+                    if self._metadata_pool is not None:
+                        self._metadata_pool.intern_equipment(equipment)
+                    if self._reported_listeners:
+                        self._state_reported(equipment, _equip)
+        return changed
+
+    def save_snapshot(self, compress: bool = True) -> bytes:
+        """Return the state of all equipment, including MQTT only fields, as a compact binary snapshot"""
+        from pyeconet.snapshot import snapshot_equipment
+
+        return snapshot_equipment(self, compress)
+
+    def restore_snapshot(self, data: bytes) -> int:
+        """Replace all equipment with the state saved by save_snapshot
+
+        Returns the number of equipment restored.
+        """
+        from pyeconet.snapshot import restore_equipment
+
+        count = restore_equipment(self, data)
+        if self._metrics is not None:
+            self._metrics.equipment.set(len(self._equipment))
+        return count
 
     async def get_equipment_by_type(self, equipment_type: List) -> Dict:
         """Get a list of equipment by the equipment EquipmentType"""
@@ -263,114 +856,348 @@ class EcoNetApiInterface:
             await self._get_equipment()
         _equipment = {}
         for _equip_type in equipment_type:
-            _equipment[_equip_type] = []
-        for value in self._equipment.values():
-            if value.type in equipment_type:
-                _equipment[value.type].append(value)
+            _equipment[_equip_type] = self._equipment.by_type(_equip_type)
         return _equipment
 
-    async def _get_location(self) -> List[Dict]:
-        _headers = HEADERS.copy()
-        _headers["ClearBlade-UserToken"] = self._user_token
-        payload = {"resource": "friedrich"}
-        # payload = {"location_only": False, "type": "com.econet.econetconsumerandroid", "version": "6.0.0-375-01b4870e"}
+    @property
+    def registry(self) -> EquipmentRegistry:
+        """Return the indexed registry of all loaded equipment"""
+        return self._equipment
 
-        async with aiohttp.request(
-                'POST',
-                f"{REST_URL}/code/{CLEAR_BLADE_SYSTEM_KEY}/getUserDataForApp",
-                ssl=_SSL_CONTEXT,
-                json=payload,
-                headers=_headers
-        ) as resp:
-            if resp.status == 200:
-                _json = await resp.json()
-                _LOGGER.debug(json.dumps(_json, indent=2))
-                if _json.get("success"):
-                    self._locations = _json["results"]["locations"]
-                    return self._locations
-                else:
-                    raise InvalidResponseFormat()
-            else:
+    def query_equipment(self, **criteria) -> List[Equipment]:
+        """Return loaded equipment matching every criterion
+
+        Criteria: type, location_id, generic_type, connected, active, device_id and
+        parent_serial_number. A list value matches any of its members.
+        """
+        return self._equipment.query(**criteria)
+
+    async def fan_out(
+            self,
+            command: Callable[[Equipment], None],
+            confirm: Callable[[Equipment], bool],
+            window: float = 60.0,
+            confirm_timeout: float = 60.0,
+            retries: int = 2,
+            retry_window: Optional[float] = None,
+            progress_callback: Optional[Callable] = None,
+            **criteria,
+    ):
+        """Send a command to every equipment matching criteria and verify it took effect
+
+        criteria are the same as for query_equipment, for example:
+
+            await api.fan_out(
+                lambda equipment: equipment.set_mode(WaterHeaterOperationMode.ENERGY_SAVING),
+                lambda equipment: equipment.mode is WaterHeaterOperationMode.ENERGY_SAVING,
+                window=600,
+                type=EquipmentType.WATER_HEATER,
+                connected=True,
+            )
+
+        See CommandFanout for the pacing and retry rules. Returns the FanoutReport.
+        """
+        from pyeconet.fanout import CommandFanout
+
+        fanout = CommandFanout(
+            self,
+            self._equipment.query(**criteria),
+            command,
+            confirm,
+            window=window,
+            confirm_timeout=confirm_timeout,
+            retries=retries,
+            retry_window=retry_window,
+            progress_callback=progress_callback,
+        )
+        return await fanout.run()
+
+    @property
+    def rest_resilience(self) -> RestResilience:
+        """Return the timeouts, retry budget and circuit breakers used for REST calls"""
+        return self._rest
+
+    def set_rest_resilience(self, resilience: RestResilience) -> None:
+        """Use resilience for REST calls instead of the process wide one, e.g. with another RestPolicy"""
+        self._rest = resilience
+
+    async def _post(self, url: str, payload: Dict, headers: Dict) -> Dict:
+        """POST payload to url and return the decoded JSON body
+
+        Failures of the cloud or network are retried and tracked per endpoint,
+        see RestResilience.
+        """
+        endpoint = url.rsplit("/", 1)[-1]
+        return await self._rest.call(
+            endpoint, lambda: self._post_once(url, payload, headers, endpoint)
+        )
+
+    async def _post_once(self, url: str, payload: Dict, headers: Dict, endpoint: str) -> Dict:
+        import aiohttp
+
+        policy = self._rest.policy
+        metrics = self._metrics
+        if metrics is not None:
+            started = perf_counter()
+        try:
+            async with aiohttp.request(
+                    'POST',
+                    url,
+                    ssl=_get_ssl_context(),
+                    json=payload,
+                    headers=headers,
+                    timeout=aiohttp.ClientTimeout(
+                        total=policy.timeout, connect=policy.connect_timeout
+                    ),
+            ) as resp:
+                if resp.status == 200:
+                    _json = await resp.json()
+                    _LOGGER.debug(json.dumps(_json, indent=2))
+                    return _json
                 raise GenericHTTPError(resp.status)
+        except Exception:
+            if metrics is not None:
+                metrics.http_errors.inc(endpoint)
+            raise
+        finally:
+            if metrics is not None:
+                metrics.http_request_seconds.observe(perf_counter() - started, endpoint)
+
+    async def _get_location(self) -> List[Dict]:
+        if self._replay is not None:
+            _json = self._replay.locations_response()
+        else:
+            _headers = HEADERS.copy()
+            _headers["ClearBlade-UserToken"] = self._user_token
+            payload = {"resource": "friedrich"}
+            # payload = {"location_only": False, "type": "com.econet.econetconsumerandroid", "version": "6.0.0-375-01b4870e"}
+            _json = await self._post(
+                f"{REST_URL}/code/{CLEAR_BLADE_SYSTEM_KEY}/getUserDataForApp",
+                payload,
+                _headers,
+            )
+        if self._recorder is not None:
+            self._recorder.record_locations(_json)
+        if _json.get("success"):
+            self._locations = _json["results"]["locations"]
+            return self._locations
+        else:
+            raise InvalidResponseFormat()
+
+    @property
+    def response_cache(self) -> Optional[ResponseCache]:
+        """Return the dynamicAction response cache, None if caching is disabled"""
+        return self._response_cache
+
+    def set_response_cache(self, cache: Optional[ResponseCache]) -> None:
+        """Cache dynamicAction responses in cache, None disables caching"""
+        self._response_cache = cache
 
     async def get_dynamic_action(self, payload: Dict) -> Dict:
-        _headers = HEADERS.copy()
-        _headers["ClearBlade-UserToken"] = self._user_token
+        """Call a dynamicAction
 
-        async with aiohttp.request(
-                'POST',
-                f"{REST_URL}/code/{CLEAR_BLADE_SYSTEM_KEY}/dynamicAction",
-                ssl=_SSL_CONTEXT,
-                json=payload,
-                headers=_headers,
-        ) as resp:
-            if resp.status == 200:
-                _json = await resp.json()
-                _LOGGER.debug(json.dumps(_json, indent=2))
-                if _json.get("success"):
-                    return _json
+        Responses are served from the response cache while fresh, concurrent
+        calls with an identical payload share one request.
+        """
+        key = _payload_key(payload)
+        cache = self._response_cache
+        if cache is not None:
+            _json = cache.get(key)
+            if _json is not None:
+                return _json
+        _json = await self._flights.do(
+            ("dynamicAction", key), lambda: self._get_dynamic_action(payload)
+        )
+        if cache is not None:
+            cache.put(key, payload, _json)
+        return _json
 
-                raise InvalidResponseFormat()
+    async def _get_dynamic_action(self, payload: Dict) -> Dict:
+        if self._replay is not None:
+            _json = self._replay.dynamic_action_response(payload)
+        else:
+            _headers = HEADERS.copy()
+            _headers["ClearBlade-UserToken"] = self._user_token
+            _json = await self._post(
+                f"{REST_URL}/code/{CLEAR_BLADE_SYSTEM_KEY}/dynamicAction",
+                payload,
+                _headers,
+            )
+        if self._recorder is not None:
+            self._recorder.record_dynamic_action(payload, _json)
+        if _json.get("success"):
+            return _json
 
-            raise GenericHTTPError(resp.status)
+        raise InvalidResponseFormat()
 
     async def _authenticate(self, payload: dict) -> None:
+        _json = await self._post(f"{REST_URL}/user/auth", payload, HEADERS)
+        if _json.get("options")["success"]:
+            self._user_token = _json.get("user_token")
+            self._account_id = _json.get("options").get("account_id")
+        else:
+            raise InvalidCredentialsError(_json.get("options")["message"])
 
-        async with aiohttp.request(
-                'POST',
-                f"{REST_URL}/user/auth",
-                ssl=_SSL_CONTEXT,
-                json=payload,
-                headers=HEADERS
-        ) as resp:
-            if resp.status == 200:
-                _json = await resp.json()
-                _LOGGER.debug(json.dumps(_json, indent=2))
-                if _json.get("options")["success"]:
-                    self._user_token = _json.get("user_token")
-                    self._account_id = _json.get("options").get("account_id")
-                else:
-                    raise InvalidCredentialsError(_json.get("options")["message"])
-            else:
-                raise GenericHTTPError(resp.status)
+    def _check_command_ack(self, update: Dict, equipment: Optional[Equipment]) -> None:
+        """Emit a CommandAckEvent if update echoes one of our transactions back
+
+        The cloud echoes a command on the desired topic with our transactionId,
+        reported messages carry the device's own (WIFI_...) instead.
+        """
+        transaction_id = update.get("transactionId")
+        with self._transactions_lock:
+            self._expire_transactions(time.monotonic())
+            if transaction_id is None or self._pending_transactions.pop(transaction_id, None) is None:
+                return
+        self._emit(
+            CommandAckEvent(
+                update.get("serial_number"),
+                equipment.device_id if equipment is not None else update.get("device_name"),
+                transaction_id,
+                tuple(key for key in update if key[:1] == "@"),
+                time.time(),
+            )
+        )
+
+    def _expire_transactions(self, now: float) -> None:
+        """Forget transactions never echoed back, called with _transactions_lock held"""
+        pending = self._pending_transactions
+        while pending and now - next(iter(pending.values()))[1] > _TRANSACTION_TIMEOUT:
+            pending.popitem(last=False)
 
     def _on_connect(self, client, userdata, flags, rc):
         _LOGGER.debug(f"Connected with result code: {str(rc)}")
+        if self._metrics is not None:
+            self._metrics.mqtt_connected.set(1 if rc == 0 else 0)
         client.subscribe(f"user/{self._account_id}/device/reported")
         client.subscribe(f"user/{self._account_id}/device/desired")
+        if rc == 0:
+            self._outbox.connection_up(client, f"user/{self._account_id}/device/desired")
+        if self._reconnect is not None:
+            self._reconnect.on_connect(client, rc)
+
+    def _on_connect_fail(self, client, userdata):
+        _LOGGER.debug("EcoNet MQTT connection attempt failed")
+        if self._reconnect is not None:
+            self._reconnect.on_connect_fail(client)
 
     def _on_disconnect(self, client, userdata, rc):
         _LOGGER.debug(f"Disconnected with result code: {str(rc)}")
+        if self._metrics is not None:
+            self._metrics.mqtt_connected.set(0)
+            self._metrics.mqtt_disconnects.inc("true" if rc == 0 else "false")
         if rc != 0:
+            # paho's network thread retries on its own, the supervisor picks the delay
             _LOGGER.error("EcoNet MQTT unexpected disconnect. Attempting to reconnect.")
-            client.reconnect()
+        self._outbox.connection_down()
+        if self._reconnect is not None:
+            self._reconnect.on_disconnect(client, rc)
+
+    def _on_publish(self, client, userdata, mid):
+        self._outbox.published(mid)
 
     def _on_message(self, client, userdata, msg):
         """When a MQTT message comes in push that update to the specified equipment"""
+        if self._recorder is not None:
+            self._recorder.record_mqtt(msg.topic, msg.payload)
+        if self._early_messages is not None:
+            with self._early_lock:
+                if self._early_messages is not None:
+                    if len(self._early_messages) == self._early_messages.maxlen:
+                        if not self._early_dropped:
+                            _LOGGER.warning(
+                                "Too many MQTT messages before the equipment was loaded, dropping the oldest"
+                            )
+                        self._early_dropped += 1
+                    self._early_messages.append(msg)
+                    return
+        self._route_message(msg)
+
+    def _route_message(self, msg) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.dispatch(msg)
+        else:
+            self._process_message(msg)
+
+    def _process_message(self, msg):
+        """Decode a MQTT message and apply it to the equipment it belongs to"""
+        metrics = self._metrics
+        if metrics is not None:
+            started = mark = perf_counter()
         try:
+            interest = self._interest
+            if interest is not None and not interest.wants_payload(
+                    msg.payload, self._pending_transactions
+            ):
+                if metrics is not None:
+                    metrics.mqtt_skipped.inc()
+                return
+            # paho stamps messages with time.monotonic() on receipt, before any worker queue
+            observed = getattr(msg, "timestamp", None) or time.monotonic()
+            source = UpdateSource.REPORTED if msg.topic.endswith("/reported") else UpdateSource.DESIRED
             unpacked_json = json.loads(msg.payload)
-            _LOGGER.debug("MQTT message from topic: %s", msg.topic)
-            _LOGGER.debug(json.dumps(unpacked_json, indent=2))
+            if metrics is not None:
+                mark = metrics.stage("decode", mark)
+            if _LOGGER.isEnabledFor(logging.DEBUG):
+                _LOGGER.debug("MQTT message from topic: %s", msg.topic)
+                _LOGGER.debug(json.dumps(unpacked_json, indent=2))
             _name = unpacked_json.get("device_name")
             _serial = unpacked_json.get("serial_number")
             key = _serial
             _equipment = self._equipment.get(key)
+            if self._pending_transactions:
+                self._check_command_ack(unpacked_json, _equipment)
+            watched = interest.fields_for(_serial) if interest is not None else None
             if _equipment is not None:
-                _equipment._equipment_info, unpacked_json = self.check_update_enum(_equipment._equipment_info,
-                                                                                   unpacked_json)
-                _equipment.update_equipment_info(unpacked_json)
+                normalizer = _equipment._normalizer
+                if normalizer is None:
+                    normalizer = self._normalization.compile(_equipment._equipment_info)
+                    _equipment._normalizer = normalizer
+                normalizer.apply(unpacked_json)
+                if metrics is not None:
+                    mark = metrics.stage("enum", mark)
+                if self._optimistic is not None:
+                    self._optimistic.reconcile(
+                        _equipment, unpacked_json, msg.topic.endswith("/reported")
+                    )
+                before = _equipment._equipment_info
+                updated = _equipment.update_equipment_info(unpacked_json, False, source, observed)
+                if normalizer.invalidated_by(unpacked_json):
+                    _equipment._normalizer = None
+                if self._metadata_pool is not None and _carries_constraints(unpacked_json):
+                    # New constraints replaced the shared block, share the new one instead
+                    self._metadata_pool.intern_equipment(_equipment)
+                if metrics is not None:
+                    mark = metrics.stage("update", mark)
+                if updated and _watched_changed(watched, unpacked_json, before, _equipment._equipment_info):
+                    _equipment._notify_update()
+                    if metrics is not None:
+                        mark = metrics.stage("callback", mark)
+                if self._reported_listeners and msg.topic.endswith("/reported"):
+                    self._state_reported(_equipment, unpacked_json)
             # Nasty hack to push signal updates to the device it belongs to
             elif "@SIGNAL" in str(unpacked_json):
-                for _equipment in self._equipment.values():
-                    if _equipment.device_id == _name:
-                        # Don't break after update for multi zone HVAC systems
-                        _equipment.update_equipment_info(unpacked_json)
+                # Multi zone HVAC systems share one device name
+                for _equipment in self._equipment.query(device_id=_name):
+                    watched = interest.fields_for(_equipment.serial_number) if interest is not None else None
+                    before = _equipment._equipment_info
+                    if _equipment.update_equipment_info(unpacked_json, False, source, observed) and _watched_changed(
+                            watched, unpacked_json, before, _equipment._equipment_info
+                    ):
+                        _equipment._notify_update()
+                if metrics is not None:
+                    mark = metrics.stage("update", mark)
             else:
                 _LOGGER.debug(
                     "Received update for non-existent equipment with device name: %s and serial number %s",
                     _name,
                     _serial,
                 )
+            if metrics is not None:
+                metrics.mqtt_messages.inc(str(_serial))
+                metrics.mqtt_message_seconds.observe(perf_counter() - started)
         except Exception as e:
+            if metrics is not None:
+                metrics.mqtt_errors.inc()
             _LOGGER.exception(e)
             _LOGGER.error("Failed to parse the following MQTT message: %s", msg.payload)
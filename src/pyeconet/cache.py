@@ -0,0 +1,122 @@
+"""TTL and LRU bounded cache for dynamicAction responses"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+# Seconds a response stays fresh, by ACTION. Actions not listed use default_ttl.
+DEFAULT_TTLS: Dict[str, float] = {
+    "waterheaterUsageReportView": 300.0,
+}
+
+
+def _parse_date(value) -> Optional[datetime]:
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def is_past_range(payload: Dict, now: Optional[datetime] = None) -> bool:
+    """Return True if payload asks about a date range that has fully ended"""
+    end = _parse_date(payload.get("end_date"))
+    if end is None:
+        return False
+    if now is None:
+        now = datetime.now(end.tzinfo) if end.tzinfo is not None else datetime.now()
+    return end < now
+
+
+class ResponseCache:
+    """Cache dynamicAction responses by normalized payload.
+
+    Responses expire after the TTL of their ACTION, except those about a date
+    range that is entirely in the past, which can't change any more and are
+    only evicted when the cache is full (least recently used first). Cached
+    responses are shared between callers and must not be modified.
+
+    Args:
+        max_entries (int): Responses kept at most.
+        ttls (dict): Seconds a response stays fresh, by ACTION.
+        default_ttl (float): TTL of actions not in ttls, 0 disables caching them.
+    """
+
+    def __init__(
+            self,
+            max_entries: int = 512,
+            ttls: Optional[Dict[str, float]] = None,
+            default_ttl: float = 0.0,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def ttl_for(self, payload: Dict) -> float:
+        ttl = self.ttls.get(payload.get("ACTION"), self.default_ttl)
+        if ttl > 0 and is_past_range(payload):
+            return math.inf
+        return ttl
+
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, response = entry
+            if expires <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return response
+
+    def put(self, key: str, payload: Dict, response: Dict) -> None:
+        ttl = self.ttl_for(payload)
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, serial_number: Optional[str] = None) -> None:
+        """Drop every response, or only those about serial_number"""
+        with self._lock:
+            if serial_number is None:
+                self._entries.clear()
+                return
+            needle = f'"serial_number":"{serial_number}"'
+            for key in [key for key in self._entries if needle in key]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, float]:
+        """Return the hit, miss, expiration and eviction counts, size and hit ratio"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
@@ -1,8 +1,13 @@
 """Define an EcoNet equipment"""
+import copy
 import logging
+import threading
+import time
 
 from enum import Enum
-from typing import Dict, Tuple, Union
+from typing import Dict, Iterable, Tuple, Union
+
+from pyeconet.versioning import FieldVersions, UpdateSource, device_time
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -21,17 +26,119 @@ class EquipmentType(Enum):
 class Equipment:
     """Define an equipment"""
 
+    # Field whose transitions drive the runtime accumulator
+    _RUNNING_FIELD = None
+
     def __init__(self, equipment_info: dict, api_interface) -> None:
         self._api = api_interface
         self._equipment_info = equipment_info
         self._update_callback = None
         self._awaiting_resume_confirmation = False
+        self._history = None
+        self._runtime = None
+        self._location_id = None
+        self._parent_serial_number = None
+        # Compiled update normalizer, built by the API on the first update
+        self._normalizer = None
+        # Published state is never mutated, updates swap in a new dict
+        self._write_lock = threading.Lock()
+        self._snapshot = None
+        self._frozen = False
+        # Per field versions, created on the first update with a source
+        self._versions = None
+
+    def snapshot(self):
+        """Return a read-only copy of this equipment frozen at its current state.
+
+        All properties of the copy read one consistent state, e.g. mode and
+        its constraints from the same update. The copy is shared until the
+        next update, so taking it is cheap.
+        """
+        info = self._equipment_info
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot._equipment_info is info:
+            return snapshot
+        snapshot = self._frozen_copy(info)
+        self._snapshot = snapshot
+        return snapshot
+
+    def _frozen_copy(self, info: Dict):
+        """Return a read-only copy of this equipment reading info as its state"""
+        frozen = copy.copy(self)
+        frozen._equipment_info = info
+        frozen._update_callback = None
+        frozen._snapshot = None
+        frozen._frozen = True
+        return frozen
 
     def set_update_callback(self, callback):
         self._update_callback = callback
 
-    def update_equipment_info(self, update: dict):
-        """Take a dictionary and update the stored _equipment_info based on the present dict fields"""
+    def watch_fields(self, fields):
+        """Only call the update callback when one of fields changes, see EcoNetApiInterface.watch_fields"""
+        self._api.watch_fields(fields, self.serial_number)
+
+    @property
+    def history(self):
+        """Return the EquipmentHistory of this equipment, or None if history isn't enabled"""
+        return self._history
+
+    def enable_history(
+        self, fields: Union[Iterable[str], Dict[str, int], None] = None, depth: int = None, dedupe: bool = True
+    ):
+        """Start keeping a bounded (timestamp, value) history of fields.
+
+        fields can be a list of field names or a mapping of field name to depth.
+        The current values are recorded straight away.
+        """
+        from pyeconet.history import DEFAULT_DEPTH, DEFAULT_HISTORY_FIELDS, EquipmentHistory
+
+        self._history = EquipmentHistory(
+            fields if fields is not None else DEFAULT_HISTORY_FIELDS,
+            depth if depth is not None else DEFAULT_DEPTH,
+            dedupe,
+        )
+        self._history.record(self._equipment_info, self._history.fields)
+        return self._history
+
+    def disable_history(self):
+        self._history = None
+
+    @property
+    def runtime(self):
+        """Return the RuntimeAccumulator of this equipment, or None if runtime tracking isn't enabled"""
+        return self._runtime
+
+    def enable_runtime_tracking(self, short_cycle_seconds: float = 300, short_cycle_limit: int = 3):
+        """Start accumulating runtime, cycles and duty cycle from running state changes"""
+        from pyeconet.runtime import RuntimeAccumulator
+
+        self._runtime = RuntimeAccumulator(short_cycle_seconds, short_cycle_limit)
+        running = self._reported_running()
+        if running is not None:
+            self._runtime.update(running)
+        return self._runtime
+
+    def disable_runtime_tracking(self):
+        self._runtime = None
+
+    def _reported_running(self) -> Union[bool, None]:
+        """Return the running state, None if the equipment doesn't report one"""
+        if self._RUNNING_FIELD is None or self._equipment_info.get(self._RUNNING_FIELD) is None:
+            return None
+        return bool(self.running)
+
+    def update_equipment_info(
+        self, update: dict, notify: bool = True, source: UpdateSource = None, observed: float = None
+    ) -> bool:
+        """Take a dictionary and update the stored _equipment_info based on the present dict fields
+
+        Returns True if any field was updated. When notify is False the caller is
+        responsible for calling _notify_update itself. With a source (and the
+        time.monotonic() it was observed at), fields holding a newer version
+        are left alone, see StalenessPolicy. Reported updates are also ordered
+        by the device timestamp in their transactionId.
+        """
         # Some real-world actions (observed: ending a genuine Away/Vacation
         # event via @SCHEDULERESUME) don't apply immediately - the cloud
         # instead sends back a confirmation dialog and waits for the exact
@@ -40,6 +147,7 @@ class Equipment:
         # for, not any dialog that happens to arrive.
         dialog = update.get("dialog")
         if dialog is not None:
+            self._api._dialog_received(self, dialog)
             if self._awaiting_resume_confirmation:
                 self._awaiting_resume_confirmation = False
                 message = dialog.get("message")
@@ -53,56 +161,101 @@ class Equipment:
                     "Received unexpected confirmation dialog, not auto-accepting: %s",
                     dialog,
                 )
-            return
+            return False
+
+        if self._frozen:
+            _LOGGER.error("Can't update an equipment snapshot: %s", self.serial_number)
+            return False
 
         # Make sure this update is for this device, should probably check this before sending updates however
         _set = False
+        _fields = []
         if update.get("device_name") == self.device_id:
-            for key, value in update.items():
-                if key[0] == "@":
-                    _LOGGER.debug(
-                        "Before update %s : %s", key, self._equipment_info.get(key)
-                    )
-                    try:
-                        if isinstance(value, Dict):
-                            if not isinstance(self._equipment_info.get(key), Dict):
-                                # First time this dict-valued field has been seen
-                                # for this equipment (e.g. @AWAY_MSG only appears
-                                # once away/vacation messaging becomes relevant).
-                                self._equipment_info[key] = {}
-                            for _key, _value in value.items():
-                                self._equipment_info[key][_key] = _value
-                                _LOGGER.debug(
-                                    "Updating [%s][%s] = %s", key, _key, _value
-                                )
-                        else:
-                            if isinstance(self._equipment_info.get(key), Dict):
-                                if self._equipment_info[key].get("value") is not None:
-                                    self._equipment_info[key]["value"] = value
+            _versions = None
+            if source is not None and self._api._staleness is not None:
+                if self._versions is None:
+                    self._versions = FieldVersions(self._api._staleness)
+                _versions = self._versions
+                if observed is None:
+                    observed = time.monotonic()
+                _device_time = (
+                    device_time(update.get("transactionId")) if source is UpdateSource.REPORTED else None
+                )
+            with self._write_lock:
+                # Copy-on-write: build the next state aside and publish it in one
+                # reference swap, so readers never see a half applied update.
+                # Only the top level and the field dicts being changed are copied.
+                _info = dict(self._equipment_info)
+                for key, value in update.items():
+                    if key[0] == "@":
+                        if _versions is not None and not _versions.accept(key, source, observed, _device_time):
+                            _LOGGER.debug("Ignoring stale %s update of %s", source.name, key)
+                            continue
+                        _LOGGER.debug(
+                            "Before update %s : %s", key, _info.get(key)
+                        )
+                        try:
+                            if isinstance(value, Dict):
+                                if not isinstance(_info.get(key), Dict):
+                                    # First time this dict-valued field has been seen
+                                    # for this equipment (e.g. @AWAY_MSG only appears
+                                    # once away/vacation messaging becomes relevant).
+                                    _field = {}
+                                else:
+                                    _field = dict(_info[key])
+                                for _key, _value in value.items():
+                                    _field[_key] = _value
                                     _LOGGER.debug(
-                                        "Updating [%s][value] = %s", key, value
+                                        "Updating [%s][%s] = %s", key, _key, _value
                                     )
+                                _info[key] = _field
                             else:
-                                self._equipment_info[key] = value
-                                _LOGGER.debug("Updating [%s] = %s", key, value)
-                    except Exception:
-                        _LOGGER.error("Failed to update with message: %s", update)
-                    _LOGGER.debug(
-                        "After update %s : %s", key, self._equipment_info.get(key)
-                    )
-                    _set = True
-                else:
-                    _LOGGER.debug(
-                        "Not updating field because it isn't editable: %s, %s",
-                        key,
-                        value,
-                    )
-                    pass
+                                if isinstance(_info.get(key), Dict):
+                                    if _info[key].get("value") is not None:
+                                        _field = dict(_info[key])
+                                        _field["value"] = value
+                                        _info[key] = _field
+                                        _LOGGER.debug(
+                                            "Updating [%s][value] = %s", key, value
+                                        )
+                                else:
+                                    _info[key] = value
+                                    _LOGGER.debug("Updating [%s] = %s", key, value)
+                        except Exception:
+                            _LOGGER.error("Failed to update with message: %s", update)
+                        _LOGGER.debug(
+                            "After update %s : %s", key, _info.get(key)
+                        )
+                        _fields.append(key)
+                        _set = True
+                    else:
+                        _LOGGER.debug(
+                            "Not updating field because it isn't editable: %s, %s",
+                            key,
+                            value,
+                        )
+                        pass
+                if _set:
+                    self._equipment_info = _info
 
         else:
             _LOGGER.debug("Invalid update for device: %s", update)
 
-        if self._update_callback is not None and _set:
+        if _set:
+            if self._history is not None:
+                self._history.record(self._equipment_info, _fields, time.time())
+            if self._runtime is not None and self._RUNNING_FIELD in _fields:
+                running = self._reported_running()
+                if running is not None:
+                    self._runtime.update(running)
+            self._api._equipment_updated(self, _fields)
+        if notify and _set:
+            self._notify_update()
+        return _set
+
+    def _notify_update(self):
+        """Let the registered callback know updates have occurred"""
+        if self._update_callback is not None:
             _LOGGER.debug("Calling the call back to notify updates have occurred")
             self._update_callback()
 
@@ -194,6 +347,16 @@ class Equipment:
         """Return the generic name of the equipment"""
         return self._equipment_info.get("@NAME")["value"]
 
+    @property
+    def location_id(self) -> Union[str, None]:
+        """Return the id of the location this equipment belongs to"""
+        return self._location_id
+
+    @property
+    def parent_serial_number(self) -> Union[str, None]:
+        """Return the serial number of the thermostat a zoning device belongs to"""
+        return self._parent_serial_number
+
     @property
     def device_id(self) -> str:
         """Return the number name of the equipment"""
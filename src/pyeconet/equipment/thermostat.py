@@ -101,6 +101,8 @@ class ThermostatFanMode(Enum):
             return ThermostatFanMode.UNKNOWN
 
 class Thermostat(Equipment):
+    _RUNNING_FIELD = "@RUNNINGSTATUS"
+
     @property
     def running(self) -> bool | None:
         """Return if the thermostat is running or not"""
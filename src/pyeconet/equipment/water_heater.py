@@ -81,6 +81,8 @@ class UsageFormat(StrEnum):
 
 
 class WaterHeater(Equipment):
+    _RUNNING_FIELD = "@RUNNING"
+
     def __init__(self, equipment_info: dict, api_interface) -> None:
         """Initialize."""
         super().__init__(equipment_info, api_interface)
@@ -311,6 +313,7 @@ class WaterHeater(Equipment):
             else:
                 self._energy_type = "KWH"
 
+        self._api._energy_usage_updated(self)
         _LOGGER.debug(self._energy_usage)
 
     async def get_water_usage(self,
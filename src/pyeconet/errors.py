@@ -23,3 +23,18 @@ class GenericHTTPError(PyeconetError):
     """An error related to invalid requests."""
 
     pass
+
+
+class InvalidSnapshotError(PyeconetError):
+    """An error related to reading a state snapshot."""
+
+    pass
+
+
+class CircuitOpenError(PyeconetError):
+    """An error raised without a request while an endpoint keeps failing.
+
+    Its args are the endpoint and the seconds until a trial request is allowed.
+    """
+
+    pass
@@ -0,0 +1,198 @@
+"""Typed events and bounded async event streams"""
+import asyncio
+import enum
+import itertools
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+from pyeconet.reconnect import ConnectionState
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class StateChangeEvent(NamedTuple):
+    """Fields of a device were updated"""
+
+    serial_number: str
+    device_id: str
+    fields: Tuple[str, ...]
+    timestamp: float
+
+
+class ConnectionChangeEvent(NamedTuple):
+    """The MQTT connection changed state"""
+
+    state: ConnectionState
+    timestamp: float
+
+
+class CommandAckEvent(NamedTuple):
+    """The cloud echoed a published command back on the desired topic with its transaction id"""
+
+    serial_number: str
+    device_id: str
+    transaction_id: str
+    fields: Tuple[str, ...]
+    timestamp: float
+
+
+class DialogEvent(NamedTuple):
+    """A device sent a confirmation dialog"""
+
+    serial_number: str
+    device_id: str
+    dialog: Dict
+    timestamp: float
+
+
+@enum.unique
+class OverflowPolicy(enum.Enum):
+    """Define what a full event stream does with a new event"""
+
+    DROP_OLDEST = 1
+    COALESCE = 2
+    BLOCK = 3
+
+
+class EventStream:
+    """Bounded stream of events consumed with async for.
+
+    Events can be offered from any thread. With OverflowPolicy.COALESCE state
+    changes of the same device merge into the one already queued, and with
+    OverflowPolicy.BLOCK a producer thread waits for the consumer to catch up.
+    """
+
+    def __init__(
+            self,
+            loop: asyncio.AbstractEventLoop,
+            maxsize: int = 1000,
+            policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+            event_types: Optional[Iterable[type]] = None,
+            serial_numbers: Optional[Iterable[str]] = None,
+            event_filter: Optional[Callable[[Any], bool]] = None,
+            on_close: Optional[Callable[["EventStream"], None]] = None,
+    ) -> None:
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.policy = policy
+        self._loop = loop
+        self._event_types = tuple(event_types) if event_types else None
+        self._serial_numbers = frozenset(serial_numbers) if serial_numbers else None
+        self._event_filter = event_filter
+        self._on_close = on_close
+        self._queue: "OrderedDict[Any, Any]" = OrderedDict()
+        self._keys = itertools.count()
+        self._waiter: Optional[asyncio.Future] = None
+        self._space = threading.Semaphore(maxsize) if policy == OverflowPolicy.BLOCK else None
+        self._closed = False
+        self.dropped = 0
+
+    def wants(self, event) -> bool:
+        """Return True if event passes this stream's filters"""
+        if self._event_types is not None and not isinstance(event, self._event_types):
+            return False
+        if self._serial_numbers is not None:
+            serial = getattr(event, "serial_number", None)
+            if serial is not None and serial not in self._serial_numbers:
+                return False
+        if self._event_filter is not None and not self._event_filter(event):
+            return False
+        return True
+
+    def offer(self, event) -> None:
+        """Queue event from any thread, applying the overflow policy"""
+        if self._closed or not self.wants(event):
+            return
+        on_loop = self._on_loop_thread()
+        if self._space is not None:
+            if on_loop:
+                # Blocking the event loop would deadlock the consumer
+                if not self._space.acquire(blocking=False):
+                    self._put(event, True)
+                    return
+            else:
+                while not self._space.acquire(timeout=1):
+                    if self._closed:
+                        return
+            if on_loop:
+                self._put(event, False)
+            else:
+                self._loop.call_soon_threadsafe(self._put, event, False)
+            return
+        if on_loop:
+            self._put(event, True)
+        else:
+            self._loop.call_soon_threadsafe(self._put, event, True)
+
+    def close(self) -> None:
+        """Stop the stream, pending iterations end once the queue is drained"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._on_close is not None:
+            self._on_close(self)
+        if self._on_loop_thread():
+            self._wake()
+        elif not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake)
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def __aiter__(self) -> "EventStream":
+        return self
+
+    async def __anext__(self):
+        while not self._queue:
+            if self._closed:
+                raise StopAsyncIteration
+            self._waiter = self._loop.create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        _, event = self._queue.popitem(last=False)
+        if self._space is not None:
+            self._space.release()
+        return event
+
+    async def __aenter__(self) -> "EventStream":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    def _on_loop_thread(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _put(self, event, may_drop: bool) -> None:
+        if self._closed:
+            if self._space is not None and not may_drop:
+                self._space.release()
+            return
+        queue = self._queue
+        if self.policy == OverflowPolicy.COALESCE and isinstance(event, StateChangeEvent):
+            key = ("state", event.serial_number)
+            queued = queue.get(key)
+            if queued is not None:
+                fields = queued.fields + tuple(f for f in event.fields if f not in queued.fields)
+                queue[key] = event._replace(fields=fields)
+                self._wake()
+                return
+        else:
+            key = next(self._keys)
+        if may_drop and len(queue) >= self.maxsize:
+            queue.popitem(last=False)
+            self.dropped += 1
+        queue[key] = event
+        self._wake()
+
+    def _wake(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
@@ -0,0 +1,280 @@
+"""Send one command to many equipment, paced and verified against reported state"""
+import asyncio
+import enum
+import logging
+import random
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+from pyeconet.equipment import Equipment
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _merged(current, value):
+    """Return field value current after applying value, as Equipment.update_equipment_info does"""
+    if isinstance(value, dict):
+        merged = dict(current) if isinstance(current, dict) else {}
+        merged.update(value)
+        return merged
+    if isinstance(current, dict):
+        if current.get("value") is None:
+            return current
+        merged = dict(current)
+        merged["value"] = value
+        return merged
+    return value
+
+
+@enum.unique
+class FanoutStatus(enum.Enum):
+    """Define the state of one equipment in a fan-out"""
+
+    PENDING = 1
+    SENT = 2
+    CONFIRMED = 3
+    ALREADY_SET = 4
+    FAILED = 5
+    UNCONFIRMED = 6
+
+
+class FanoutReport:
+    """Progress and outcome of a fan-out, updated while it runs"""
+
+    def __init__(self, serial_numbers: List[str]) -> None:
+        self.statuses: Dict[str, FanoutStatus] = {
+            serial_number: FanoutStatus.PENDING for serial_number in serial_numbers
+        }
+        self.attempts: Dict[str, int] = {serial_number: 0 for serial_number in serial_numbers}
+        self.errors: Dict[str, str] = {}
+        self.started = time.time()
+        self.finished: Optional[float] = None
+
+    @property
+    def total(self) -> int:
+        return len(self.statuses)
+
+    def count(self, *statuses: FanoutStatus) -> int:
+        return sum(1 for status in self.statuses.values() if status in statuses)
+
+    @property
+    def done(self) -> bool:
+        return self.finished is not None
+
+    @property
+    def progress(self) -> float:
+        """Return the fraction of equipment that is confirmed or given up on"""
+        if not self.statuses:
+            return 1.0
+        settled = self.count(
+            FanoutStatus.CONFIRMED, FanoutStatus.ALREADY_SET, FanoutStatus.FAILED, FanoutStatus.UNCONFIRMED
+        )
+        return settled / len(self.statuses)
+
+    @property
+    def succeeded(self) -> List[str]:
+        return [
+            serial_number
+            for serial_number, status in self.statuses.items()
+            if status in (FanoutStatus.CONFIRMED, FanoutStatus.ALREADY_SET)
+        ]
+
+    @property
+    def failed(self) -> List[str]:
+        return [
+            serial_number
+            for serial_number, status in self.statuses.items()
+            if status in (FanoutStatus.FAILED, FanoutStatus.UNCONFIRMED)
+        ]
+
+    def summary(self) -> Dict:
+        """Return the counts per status, the publish count and the elapsed time in one dict"""
+        result = {status.name.lower(): self.count(status) for status in FanoutStatus}
+        result["total"] = self.total
+        result["publishes"] = sum(self.attempts.values())
+        result["progress"] = self.progress
+        result["elapsed"] = (self.finished or time.time()) - self.started
+        return result
+
+    def __repr__(self) -> str:
+        return f"<FanoutReport {self.summary()}>"
+
+
+class CommandFanout:
+    """Apply command to every target, spreading the publishes over window seconds.
+
+    Publish times are spread evenly with each one jittered inside its slot.
+    An equipment is confirmed once it reports (MQTT reported topic or a REST
+    refresh) a commanded field and confirm(equipment) holds on the state it
+    reported itself. Echoes of our own command on the desired topic and
+    optimistic local values are not part of that state. Equipment still
+    unconfirmed confirm_timeout seconds after the last publish of a round are
+    sent the command again, up to retries more times, spread over
+    retry_window seconds.
+
+    Args:
+        command (Callable): Called with each equipment to publish the command,
+            e.g. lambda equipment: equipment.set_away_mode(True).
+        confirm (Callable): Returns True once an equipment reports the wanted
+            state, e.g. lambda equipment: equipment.away. Equipment already in
+            that state are not sent the command.
+        progress_callback (Callable): Called with the FanoutReport whenever it changes.
+    """
+
+    def __init__(
+            self,
+            api,
+            targets: List[Equipment],
+            command: Callable[[Equipment], None],
+            confirm: Callable[[Equipment], bool],
+            window: float = 60.0,
+            confirm_timeout: float = 60.0,
+            retries: int = 2,
+            retry_window: Optional[float] = None,
+            progress_callback: Optional[Callable[[FanoutReport], None]] = None,
+    ) -> None:
+        self._api = api
+        self._targets: Dict[str, Equipment] = {
+            equipment.serial_number: equipment for equipment in targets
+        }
+        self._command = command
+        self._confirm = confirm
+        self.window = window
+        self.confirm_timeout = confirm_timeout
+        self.retries = retries
+        self.retry_window = retry_window if retry_window is not None else window / 4
+        self._progress_callback = progress_callback
+        self.report = FanoutReport(list(self._targets))
+        self._loop = None
+        self._settled: Optional[asyncio.Event] = None
+        # Fields each target was commanded, and the state it reported since
+        self._fields: Dict[str, Set[str]] = {}
+        self._reported_state: Dict[str, Dict] = {}
+        self._sending: Optional[str] = None
+
+    async def run(self) -> FanoutReport:
+        self._loop = asyncio.get_running_loop()
+        self._settled = asyncio.Event()
+        remove = self._api._add_reported_listener(self._reported)
+        remove_published = self._api._add_publish_listener(self._published)
+        try:
+            serial_numbers = list(self._targets)
+            random.shuffle(serial_numbers)
+            await self._send_round(serial_numbers, self.window)
+            for attempt in range(self.retries + 1):
+                await self._wait_settled(self.confirm_timeout)
+                stragglers = self._unconfirmed()
+                if not stragglers or attempt == self.retries:
+                    break
+                _LOGGER.debug("Retrying %s unconfirmed equipment", len(stragglers))
+                await self._send_round(stragglers, self.retry_window)
+        finally:
+            remove()
+            remove_published()
+        for serial_number in self._unconfirmed():
+            self.report.statuses[serial_number] = FanoutStatus.UNCONFIRMED
+        self.report.finished = time.time()
+        self._notify()
+        return self.report
+
+    def _unconfirmed(self) -> List[str]:
+        return [
+            serial_number
+            for serial_number, status in self.report.statuses.items()
+            if status is FanoutStatus.SENT
+        ]
+
+    async def _send_round(self, serial_numbers: List[str], window: float) -> None:
+        count = len(serial_numbers)
+        started = self._loop.time()
+        for index, serial_number in enumerate(serial_numbers):
+            delay = started + window * (index + random.random()) / count - self._loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._send(serial_number)
+
+    def _send(self, serial_number: str) -> None:
+        statuses = self.report.statuses
+        if statuses[serial_number] not in (FanoutStatus.PENDING, FanoutStatus.SENT):
+            return
+        equipment = self._targets[serial_number]
+        if statuses[serial_number] is FanoutStatus.PENDING and self._is_confirmed(equipment):
+            statuses[serial_number] = FanoutStatus.ALREADY_SET
+            self._notify()
+            return
+        self.report.attempts[serial_number] += 1
+        # State before the command, only reported updates are applied to it from here on
+        self._reported_state.setdefault(serial_number, equipment._equipment_info)
+        self._sending = serial_number
+        try:
+            self._command(equipment)
+        except Exception as err:
+            _LOGGER.error("Failed to send command to %s: %s", serial_number, err)
+            statuses[serial_number] = FanoutStatus.FAILED
+            self.report.errors[serial_number] = str(err)
+        else:
+            statuses[serial_number] = FanoutStatus.SENT
+        finally:
+            self._sending = None
+        self._notify()
+
+    async def _wait_settled(self, timeout: float) -> None:
+        if not self._unconfirmed():
+            return
+        self._settled.clear()
+        try:
+            await asyncio.wait_for(self._settled.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _is_confirmed(self, equipment: Equipment) -> bool:
+        try:
+            return bool(self._confirm(equipment))
+        except Exception as err:
+            _LOGGER.debug("Confirmation check failed for %s: %s", equipment.serial_number, err)
+            return False
+
+    def _published(self, serial_number: str, payload: Dict) -> None:
+        """Remember the fields the command published for the target being sent to"""
+        if serial_number == self._sending:
+            self._fields.setdefault(serial_number, set()).update(
+                field for field in payload if field[:1] == "@"
+            )
+
+    def _reported(self, equipment: Equipment, update: Dict) -> None:
+        """Called from any thread with equipment that just reported update"""
+        if equipment.serial_number in self._targets:
+            self._loop.call_soon_threadsafe(self._apply_reported, equipment, update)
+
+    def _apply_reported(self, equipment: Equipment, update: Dict) -> None:
+        serial_number = equipment.serial_number
+        state = self._reported_state.get(serial_number)
+        if state is None:
+            # Not sent to yet
+            return
+        state = dict(state)
+        for field, value in update.items():
+            if field[:1] == "@":
+                state[field] = _merged(state.get(field), value)
+        self._reported_state[serial_number] = state
+        if self.report.statuses[serial_number] is not FanoutStatus.SENT:
+            return
+        fields = self._fields.get(serial_number)
+        if fields and fields.isdisjoint(update):
+            # e.g. @SIGNAL or @RUNNING, says nothing about our command
+            return
+        if self._is_confirmed(equipment._frozen_copy(state)):
+            self._confirmed(serial_number)
+
+    def _confirmed(self, serial_number: str) -> None:
+        self.report.statuses[serial_number] = FanoutStatus.CONFIRMED
+        self._notify()
+        if not self._unconfirmed():
+            self._settled.set()
+
+    def _notify(self) -> None:
+        if self._progress_callback is not None:
+            try:
+                self._progress_callback(self.report)
+            except Exception as err:
+                _LOGGER.exception(err)
@@ -0,0 +1,161 @@
+"""Fixed size per-field history of equipment state"""
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+DEFAULT_DEPTH = 256
+
+DEFAULT_HISTORY_FIELDS = (
+    "@RUNNING",
+    "@RUNNINGSTATUS",
+    "@SETPOINT",
+    "@COOLSETPOINT",
+    "@HEATSETPOINT",
+    "@MODE",
+    "@SIGNAL",
+    "@ALERTCOUNT",
+    "@CONNECTED",
+)
+
+_MISSING = object()
+
+
+def _field_value(value):
+    """Return the part of a field worth keeping: its value for dict fields with one"""
+    if isinstance(value, dict):
+        if "value" in value:
+            return value["value"]
+        return dict(value)
+    return value
+
+
+class FieldHistory:
+    """Ring buffer of (timestamp, value) pairs for one field.
+
+    Timestamps live in a flat array of doubles so each entry costs 8 bytes
+    plus a reference to the value.
+    """
+
+    __slots__ = ("depth", "_times", "_values", "_next", "_count")
+
+    def __init__(self, depth: int = DEFAULT_DEPTH) -> None:
+        if depth < 1:
+            raise ValueError("depth must be at least 1")
+        self.depth = depth
+        self._times = array("d", bytes(8 * depth))
+        self._values: List[Any] = [None] * depth
+        self._next = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, timestamp: float, value) -> None:
+        index = self._next
+        self._times[index] = timestamp
+        self._values[index] = value
+        self._next = (index + 1) % self.depth
+        if self._count < self.depth:
+            self._count += 1
+
+    def latest(self) -> Optional[Tuple[float, Any]]:
+        """Return the most recent (timestamp, value) or None if empty"""
+        if not self._count:
+            return None
+        index = (self._next - 1) % self.depth
+        return self._times[index], self._values[index]
+
+    def items(self, since: Optional[float] = None, until: Optional[float] = None) -> List[Tuple[float, Any]]:
+        """Return (timestamp, value) pairs oldest first, optionally limited to [since, until]"""
+        depth = self.depth
+        first = (self._next - self._count) % depth
+        result = []
+        for offset in range(self._count):
+            index = (first + offset) % depth
+            timestamp = self._times[index]
+            if since is not None and timestamp < since:
+                continue
+            if until is not None and timestamp > until:
+                break
+            result.append((timestamp, self._values[index]))
+        return result
+
+
+class EquipmentHistory:
+    """Per-field history for one equipment.
+
+    Args:
+        fields: Field names to track, or a mapping of field name to depth.
+        depth (int): Entries kept per field when fields doesn't say otherwise.
+        dedupe (bool): Skip updates that repeat the last recorded value.
+    """
+
+    def __init__(
+            self,
+            fields: Union[Iterable[str], Dict[str, int]] = DEFAULT_HISTORY_FIELDS,
+            depth: int = DEFAULT_DEPTH,
+            dedupe: bool = True,
+    ) -> None:
+        if not isinstance(fields, dict):
+            fields = {field: depth for field in fields}
+        self.dedupe = dedupe
+        self._fields: Dict[str, FieldHistory] = {
+            field: FieldHistory(field_depth) for field, field_depth in fields.items()
+        }
+
+    @property
+    def fields(self) -> Tuple[str, ...]:
+        return tuple(self._fields)
+
+    def field(self, name: str) -> Optional[FieldHistory]:
+        return self._fields.get(name)
+
+    def record(self, equipment_info: Dict, fields: Iterable[str], timestamp: Optional[float] = None) -> None:
+        """Append the current value of every tracked field in fields"""
+        if timestamp is None:
+            timestamp = time.time()
+        for name in fields:
+            history = self._fields.get(name)
+            if history is None:
+                continue
+            value = equipment_info.get(name, _MISSING)
+            if value is _MISSING:
+                continue
+            value = _field_value(value)
+            if self.dedupe:
+                latest = history.latest()
+                if latest is not None and latest[1] == value:
+                    continue
+            history.append(timestamp, value)
+
+    def items(
+            self,
+            name: str,
+            hours: Optional[float] = None,
+            since: Optional[float] = None,
+            until: Optional[float] = None,
+    ) -> List[Tuple[float, Any]]:
+        """Return (timestamp, value) pairs of name, optionally over the last hours"""
+        history = self._fields.get(name)
+        if history is None:
+            return []
+        if hours is not None:
+            since = time.time() - hours * 3600
+        return history.items(since, until)
+
+    def values(
+            self,
+            name: str,
+            hours: Optional[float] = None,
+            since: Optional[float] = None,
+            until: Optional[float] = None,
+    ) -> List[Any]:
+        """Return the values of name oldest first, e.g. values("@SETPOINT", hours=6)"""
+        return [value for _, value in self.items(name, hours, since, until)]
+
+    def value_at(self, name: str, timestamp: float):
+        """Return the value name had at timestamp, or None if it's older than the history"""
+        result = None
+        for recorded, value in self.items(name, until=timestamp):
+            result = value
+        return result
@@ -0,0 +1,84 @@
+"""Field interest: which updates are worth processing and notifying about"""
+import enum
+import re
+import threading
+from typing import Container, Dict, FrozenSet, Iterable, Optional
+
+from pyeconet.sharding import partition_key
+
+_FIELD_RE = re.compile(rb'"(@[^"]+)"\s*:')
+_TRANSACTION_RE = re.compile(rb'"transactionId"\s*:\s*"([^"]*)"')
+
+
+@enum.unique
+class InterestPolicy(enum.Enum):
+    """Define what happens to messages carrying only fields nobody watches"""
+
+    # Apply them to the equipment state without callbacks
+    STORE = 1
+    # Ignore them, without even decoding the JSON
+    DROP = 2
+
+
+class FieldInterest:
+    """Watched fields, globally and per serial number.
+
+    Equipment with watched fields only get their update callback when one of
+    them changes value. Equipment without any (no global fields and none of
+    their own) behave as if nothing was registered.
+    """
+
+    def __init__(self, policy: InterestPolicy = InterestPolicy.STORE) -> None:
+        self.policy = policy
+        self._lock = threading.Lock()
+        self._global: FrozenSet[str] = frozenset()
+        self._devices: Dict[str, FrozenSet[str]] = {}
+
+    def watch(self, fields: Iterable[str], serial_number: Optional[str] = None) -> None:
+        """Add fields to the watched fields of serial_number, or of every equipment if None"""
+        with self._lock:
+            if serial_number is None:
+                self._global = self._global.union(fields)
+            else:
+                self._devices[serial_number] = self._devices.get(serial_number, frozenset()).union(fields)
+
+    def unwatch(self, fields: Optional[Iterable[str]] = None, serial_number: Optional[str] = None) -> None:
+        """Remove fields (all of them if None) from the watched fields of serial_number or the global ones"""
+        with self._lock:
+            if serial_number is None:
+                self._global = frozenset() if fields is None else self._global.difference(fields)
+            elif fields is None:
+                self._devices.pop(serial_number, None)
+            elif serial_number in self._devices:
+                self._devices[serial_number] = self._devices[serial_number].difference(fields)
+
+    def fields_for(self, serial_number: Optional[str]) -> Optional[FrozenSet[str]]:
+        """Return the watched fields of an equipment, None if it watches everything"""
+        device = self._devices.get(serial_number)
+        if device:
+            return device | self._global
+        return self._global or None
+
+    def wants_payload(self, payload, transaction_ids: Container[str] = ()) -> bool:
+        """Return False for a raw message that DROP allows skipping before decoding it
+
+        Messages echoing one of transaction_ids, the commands awaiting an ack,
+        are always wanted.
+        """
+        if self.policy is not InterestPolicy.DROP:
+            return True
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        if b'"dialog"' in payload:
+            return True
+        if transaction_ids:
+            match = _TRANSACTION_RE.search(payload)
+            if match and match.group(1).decode("utf-8", "replace") in transaction_ids:
+                return True
+        fields = _FIELD_RE.findall(payload)
+        if not fields:
+            return True
+        watched = self.fields_for(partition_key(payload).decode("utf-8", "replace"))
+        if watched is None:
+            return True
+        return any(field.decode("utf-8", "replace") in watched for field in fields)
@@ -0,0 +1,137 @@
+"""Share identical constraint metadata between equipment"""
+import json
+import sys
+import threading
+import weakref
+from collections import deque
+from typing import Deque, Dict, List
+
+from pyeconet.equipment import Equipment
+
+
+def _intern_value(value):
+    """Return a copy of value with every string interned"""
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, dict):
+        return {
+            (sys.intern(key) if isinstance(key, str) else key): _intern_value(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_intern_value(item) for item in value]
+    return value
+
+
+class MetadataPool:
+    """Reference counted pool of constraint blocks.
+
+    Equipment of the same model carry byte identical "constraints" (enumText,
+    icons, limits...) in many fields. Interning replaces each of them with one
+    shared instance. Shared blocks are never modified: an update bringing new
+    constraints replaces the reference, which is re-interned (copy-on-write)
+    and releases the old block once nothing uses it.
+
+    References are held per equipment object, not per serial number, so two
+    interfaces loading the same equipment each hold their own. An equipment
+    that is garbage collected without release_equipment() releases its
+    references on the next call into the pool.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # canonical JSON -> [shared constraints, reference count]
+        self._entries: Dict[str, List] = {}
+        # equipment -> field -> canonical JSON of the block it references
+        self._owned: "weakref.WeakKeyDictionary[Equipment, Dict[str, str]]" = weakref.WeakKeyDictionary()
+        # References of collected equipment, released under the lock by the next caller
+        self._collected: Deque[Dict[str, str]] = deque()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._release_collected()
+            return len(self._entries)
+
+    def intern_equipment(self, equipment: Equipment) -> int:
+        """Point every constraints block of equipment at the pooled copy, returns the blocks shared
+
+        Published equipment state is immutable, so the fields that change are
+        copied and the new state swapped in, like any other update.
+        """
+        shared = 0
+        with equipment._write_lock, self._lock:
+            self._release_collected()
+            owned = self._owned.get(equipment)
+            if owned is None:
+                owned = self._owned[equipment] = {}
+                # Runs from the garbage collector, possibly with the lock held, so only queue it
+                weakref.finalize(equipment, self._collected.append, owned)
+            info = equipment._equipment_info
+            replaced = {}
+            for field, value in info.items():
+                if not isinstance(value, dict):
+                    continue
+                changes = {
+                    key: sys.intern(item)
+                    for key, item in value.items()
+                    if type(item) is str and sys.intern(item) is not item
+                }
+                constraints = value.get("constraints")
+                if isinstance(constraints, dict):
+                    current = owned.get(field)
+                    if current is None or self._entries[current][0] is not constraints:
+                        canonical = json.dumps(constraints, sort_keys=True, separators=(",", ":"))
+                        entry = self._entries.get(canonical)
+                        if entry is None:
+                            entry = self._entries[canonical] = [_intern_value(constraints), 0]
+                        entry[1] += 1
+                        if current is not None:
+                            self._release(current)
+                        owned[field] = canonical
+                        if entry[0] is not constraints:
+                            changes["constraints"] = entry[0]
+                        shared += 1
+                if changes:
+                    replaced[field] = {**value, **changes}
+            if replaced:
+                equipment._equipment_info = {**info, **replaced}
+        return shared
+
+    def release_equipment(self, equipment: Equipment) -> None:
+        """Drop every reference held by equipment"""
+        with self._lock:
+            self._release_collected()
+            owned = self._owned.pop(equipment, None)
+            if owned:
+                for canonical in owned.values():
+                    self._release(canonical)
+                # Nothing left for the finalizer to release
+                owned.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of distinct blocks and of references to them"""
+        with self._lock:
+            self._release_collected()
+            return {
+                "blocks": len(self._entries),
+                "references": sum(entry[1] for entry in self._entries.values()),
+            }
+
+    def _release_collected(self) -> None:
+        while self._collected:
+            owned = self._collected.popleft()
+            for canonical in owned.values():
+                self._release(canonical)
+            owned.clear()
+
+    def _release(self, canonical: str) -> None:
+        entry = self._entries.get(canonical)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del self._entries[canonical]
+
+
+# Shared by every EcoNetApiInterface so identical models dedupe across accounts
+DEFAULT_METADATA_POOL = MetadataPool()
@@ -0,0 +1,166 @@
+"""Define an EcoNet location"""
+import logging
+import threading
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+from pyeconet.equipment import Equipment
+
+_LOGGER = logging.getLogger(__name__)
+
+# Equipment fields feeding the location aggregates
+AGGREGATE_FIELDS = frozenset(
+    ("@RUNNING", "@RUNNINGSTATUS", "@CONNECTED", "@ALERTCOUNT", "@AWAY")
+)
+
+# (running, disconnected, in alert, away, today's energy usage)
+Contribution = Tuple[bool, bool, bool, bool, float]
+
+_EMPTY: Contribution = (False, False, False, False, 0.0)
+
+
+def _contribution(equipment: Equipment) -> Contribution:
+    energy = getattr(equipment, "todays_energy_usage", None) or 0.0
+    return (
+        bool(equipment._reported_running()),
+        not equipment.connected,
+        bool(equipment.alert_count),
+        bool(equipment.away),
+        float(energy),
+    )
+
+
+class Location:
+    """Define a location and the equipment installed there.
+
+    Aggregates over the equipment are kept as running totals: each equipment's
+    last contribution is remembered so a change only applies its difference.
+    """
+
+    def __init__(self, location_info: dict) -> None:
+        self._location_info = {
+            key: value for key, value in location_info.items() if key != "equiptments"
+        }
+        self._equipment: Dict[str, Equipment] = {}
+        self._contributions: Dict[str, Contribution] = {}
+        self._lock = threading.Lock()
+        self._running = 0
+        self._disconnected = 0
+        self._in_alert = 0
+        self._away = 0
+        self._energy = 0.0
+
+    def update_location_info(self, location_info: dict) -> None:
+        """Take a location from getUserDataForApp and update the stored fields"""
+        for key, value in location_info.items():
+            if key != "equiptments":
+                self._location_info[key] = value
+
+    @property
+    def location_id(self) -> str:
+        return self._location_info.get("location_id")
+
+    @property
+    def name(self) -> Union[str, None]:
+        """Return the location name"""
+        return self._location_info.get("@LOCATION_NAME")
+
+    @property
+    def info(self) -> Union[str, None]:
+        """Return the location's city and state"""
+        return self._location_info.get("@LOCATION_INFO")
+
+    @property
+    def status(self) -> Union[str, None]:
+        """Return the location status, e.g. I'm Home"""
+        return self._location_info.get("@LOCATION_STATUS")
+
+    @property
+    def away(self) -> bool:
+        """Return if the location has been set to away mode"""
+        return bool(self._location_info.get("@AWAY", False))
+
+    @property
+    def vacation(self) -> bool:
+        return bool(self._location_info.get("@VACATION", False))
+
+    @property
+    def equipment(self) -> Dict[str, Equipment]:
+        """Return the equipment at this location keyed by serial number"""
+        return dict(self._equipment)
+
+    @property
+    def running_count(self) -> int:
+        """Return the number of units currently running"""
+        return self._running
+
+    @property
+    def disconnected_count(self) -> int:
+        return self._disconnected
+
+    @property
+    def alert_count(self) -> int:
+        """Return the number of units with active alerts"""
+        return self._in_alert
+
+    @property
+    def away_count(self) -> int:
+        """Return the number of units in away mode"""
+        return self._away
+
+    @property
+    def all_away(self) -> bool:
+        """Return True if the location or every unit at it is away"""
+        return self.away or (bool(self._equipment) and self._away == len(self._equipment))
+
+    @property
+    def todays_energy_usage(self) -> float:
+        """Return the sum of today's energy usage fetched for the units at this location"""
+        return self._energy
+
+    def add_equipment(self, equipment: Equipment) -> None:
+        self._equipment[equipment.serial_number] = equipment
+        self.equipment_changed(equipment)
+
+    def remove_equipment(self, serial_number: str) -> None:
+        with self._lock:
+            self._equipment.pop(serial_number, None)
+            self._apply(self._contributions.pop(serial_number, _EMPTY), _EMPTY)
+
+    def equipment_changed(self, equipment: Equipment, fields: Optional[Iterable[str]] = None) -> None:
+        """Update the aggregates after equipment changed, fields limits it to relevant updates"""
+        if fields is not None and AGGREGATE_FIELDS.isdisjoint(fields):
+            return
+        serial_number = equipment.serial_number
+        if serial_number not in self._equipment:
+            return
+        new = _contribution(equipment)
+        with self._lock:
+            old = self._contributions.get(serial_number, _EMPTY)
+            if new == old:
+                return
+            self._contributions[serial_number] = new
+            self._apply(old, new)
+
+    def _apply(self, old: Contribution, new: Contribution) -> None:
+        self._running += new[0] - old[0]
+        self._disconnected += new[1] - old[1]
+        self._in_alert += new[2] - old[2]
+        self._away += new[3] - old[3]
+        self._energy += new[4] - old[4]
+
+    def summary(self) -> Dict:
+        """Return the location aggregates in one dict"""
+        return {
+            "location_id": self.location_id,
+            "name": self.name,
+            "equipment": len(self._equipment),
+            "running": self._running,
+            "disconnected": self._disconnected,
+            "in_alert": self._in_alert,
+            "away": self.away,
+            "away_equipment": self._away,
+            "todays_energy_usage": self._energy,
+        }
+
+    def __repr__(self) -> str:
+        return f"<Location {self.location_id} {self.name!r} equipment={len(self._equipment)}>"
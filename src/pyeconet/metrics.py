@@ -0,0 +1,243 @@
+"""Counters, gauges and histograms describing EcoNet API activity"""
+import bisect
+import threading
+from time import perf_counter
+from typing import Dict, List, Sequence, Tuple
+
+# Upper bounds in seconds, tuned for per-message work and REST round trips
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base metric keeping one value per combination of label values"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, object] = {}
+        self._lock = threading.Lock()
+
+    def collect(self) -> Dict[LabelValues, object]:
+        """Return a copy of the current values keyed by label values"""
+        with self._lock:
+            return {labels: self._copy(value) for labels, value in self._values.items()}
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def expose(self) -> List[str]:
+        """Return the OpenMetrics text lines for this metric"""
+        lines = [f"# TYPE {self.name} {self.type_name}"]
+        if self.documentation:
+            lines.append(f"# HELP {self.name} {self.documentation}")
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """A monotonically increasing value"""
+
+    type_name = "counter"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}_total{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in self.collect().items()
+        ]
+
+
+class Gauge(_Metric):
+    """A value that can go up and down"""
+
+    type_name = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in self.collect().items()
+        ]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    type_name = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # [per-bucket counts..., +Inf count, sum]
+                state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    @staticmethod
+    def _copy(value):
+        return list(value)
+
+    def collect(self) -> Dict[LabelValues, Dict]:
+        """Return count, sum and cumulative bucket counts keyed by label values"""
+        result = {}
+        for labels, state in super().collect().items():
+            cumulative = []
+            running = 0
+            for count in state[:-1]:
+                running += count
+                cumulative.append(running)
+            result[labels] = {
+                "count": running,
+                "sum": state[-1],
+                "buckets": dict(zip(self.buckets + (float("inf"),), cumulative)),
+            }
+        return result
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for labels, state in self.collect().items():
+            for bound, count in state["buckets"].items():
+                le = 'le="{}"'.format(_format_value(bound))
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {count}"
+                )
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_count{label_text} {state['count']}")
+            lines.append(f"{self.name}_sum{label_text} {_format_value(state['sum'])}")
+        return lines
+
+
+class EcoNetMetrics:
+    """Metrics registry attached to an EcoNetApiInterface with enable_metrics()"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self.mqtt_messages = self.counter(
+            "econet_mqtt_messages", "MQTT messages processed.", ["serial_number"]
+        )
+        self.mqtt_message_seconds = self.histogram(
+            "econet_mqtt_message_seconds", "Time spent handling one MQTT message.", buckets=buckets
+        )
+        self.mqtt_stage_seconds = self.histogram(
+            "econet_mqtt_stage_seconds",
+            "Time spent in each MQTT message handling stage.",
+            ["stage"],
+            buckets=buckets,
+        )
+        self.mqtt_errors = self.counter(
+            "econet_mqtt_errors", "MQTT messages that failed to parse or apply."
+        )
+        self.mqtt_skipped = self.counter(
+            "econet_mqtt_skipped", "MQTT messages dropped without decoding, no watched fields."
+        )
+        self.mqtt_publishes = self.counter("econet_mqtt_publishes", "Commands published.")
+        self.mqtt_disconnects = self.counter(
+            "econet_mqtt_disconnects", "MQTT disconnects.", ["expected"]
+        )
+        self.mqtt_connected = self.gauge(
+            "econet_mqtt_connected", "1 while the MQTT connection is up."
+        )
+        self.http_request_seconds = self.histogram(
+            "econet_http_request_seconds",
+            "REST request latency.",
+            ["endpoint"],
+            buckets=buckets,
+        )
+        self.http_errors = self.counter(
+            "econet_http_errors", "REST requests that failed.", ["endpoint"]
+        )
+        self.equipment = self.gauge("econet_equipment", "Equipment known to the API.")
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def stage(self, stage: str, started: float) -> float:
+        """Record the time since started against a message handling stage and return now"""
+        now = perf_counter()
+        self.mqtt_stage_seconds.observe(now - started, stage)
+        return now
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Return every metric's current values for pull based consumers"""
+        return {
+            name: {
+                "type": metric.type_name,
+                "labels": metric.labelnames,
+                "values": metric.collect(),
+            }
+            for name, metric in self._metrics.items()
+        }
+
+    def to_openmetrics(self) -> str:
+        """Return all metrics in the OpenMetrics text exposition format"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.expose())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,174 @@
+"""Per device model normalization of incoming updates"""
+import json
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+_LOGGER = logging.getLogger(__name__)
+
+FieldFixer = Callable[[object], object]
+
+
+class Normalizer:
+    """Base class for a fix-up applied to one field of every update.
+
+    compile() runs once per device model with the stored field (including its
+    constraints) and returns the function applied to that field of each
+    update, or None if the model doesn't need it.
+    """
+
+    field: str = ""
+
+    def compile(self, field_info) -> Optional[FieldFixer]:
+        raise NotImplementedError
+
+
+def _status_aliases(text: str) -> List[str]:
+    """Return the spellings a status may arrive in for an enumText entry"""
+    cleaned = text.strip().lower()
+    aliases = [cleaned]
+    # Friedrich units report "cool" for an enumText of "cooling", "heat" for "heating"...
+    if cleaned.endswith("ing") and len(cleaned) > 5:
+        aliases.append(cleaned[:-3])
+    return aliases
+
+
+class EnumStatusNormalizer(Normalizer):
+    """Make the value of an enum field agree with its status text.
+
+    Updates carry both the index (value) and the text (status); some units
+    send an index that doesn't match the text, e.g. for Emergency Heat.
+    The status to index map is built once per model instead of searching
+    enumText on every message.
+    """
+
+    def __init__(self, field: str = "@MODE") -> None:
+        self.field = field
+        self._reported = set()
+        self._lock = threading.Lock()
+
+    def compile(self, field_info) -> Optional[FieldFixer]:
+        if not isinstance(field_info, dict):
+            return None
+        enumtext = field_info.get("constraints", {}).get("enumText")
+        if not enumtext:
+            return None
+        exact: Dict[str, int] = {}
+        fuzzy: Dict[str, int] = {}
+        for index, text in enumerate(enumtext):
+            exact.setdefault(text, index)
+            for alias in _status_aliases(text):
+                fuzzy.setdefault(alias, index)
+        field = self.field
+
+        def fix(update_value):
+            if not isinstance(update_value, dict):
+                return update_value
+            status = update_value.get("status")
+            if not status:
+                return update_value
+            index = exact.get(status)
+            if index is None:
+                index = fuzzy.get(status.strip().lower())
+            if index is None:
+                self._report(field, status, enumtext)
+                return update_value
+            if update_value.get("value") != index:
+                _LOGGER.debug("Enum value mismatch: %s != %s", update_value.get("value"), status)
+                update_value["value"] = index
+            return update_value
+
+        return fix
+
+    def _report(self, field: str, status: str, enumtext: List[str]) -> None:
+        """Log an unknown status once instead of on every message"""
+        key = (field, status)
+        with self._lock:
+            if key in self._reported:
+                return
+            self._reported.add(key)
+        _LOGGER.debug("Unknown %s status %s, expected one of %s", field, status, enumtext)
+
+
+DEFAULT_NORMALIZERS = (EnumStatusNormalizer("@MODE"),)
+
+
+class CompiledNormalizer:
+    """The fixers one device model needs, keyed by field"""
+
+    __slots__ = ("_fixers",)
+
+    def __init__(self, fixers: Dict[str, FieldFixer]) -> None:
+        self._fixers = fixers
+
+    @property
+    def fields(self) -> Tuple[str, ...]:
+        return tuple(self._fixers)
+
+    def apply(self, update: Dict) -> Dict:
+        """Fix the fields of update in place, only fields present in update are touched"""
+        for field, fixer in self._fixers.items():
+            if field in update:
+                update[field] = fixer(update[field])
+        return update
+
+    def invalidated_by(self, update: Dict) -> bool:
+        """Return True if update carries new constraints for a normalized field"""
+        for field in self._fixers:
+            value = update.get(field)
+            if isinstance(value, dict) and "constraints" in value:
+                return True
+        return False
+
+
+_NOTHING = CompiledNormalizer({})
+
+
+def _constraints_key(field_info) -> str:
+    if isinstance(field_info, dict):
+        return json.dumps(field_info.get("constraints"), sort_keys=True, default=str)
+    return ""
+
+
+class NormalizationPipeline:
+    """Compile normalizers per device model and cache the result.
+
+    Models are identified by the constraints of the normalized fields, so
+    every device with identical constraints shares one CompiledNormalizer.
+    """
+
+    def __init__(self, normalizers=DEFAULT_NORMALIZERS) -> None:
+        self._normalizers: List[Normalizer] = list(normalizers)
+        self._cache: Dict[Tuple, CompiledNormalizer] = {}
+        self._lock = threading.Lock()
+
+    def register(self, normalizer: Normalizer) -> None:
+        with self._lock:
+            self._normalizers.append(normalizer)
+            self._cache.clear()
+
+    def compile(self, equipment_info: Dict) -> CompiledNormalizer:
+        signature = tuple(
+            (index, _constraints_key(equipment_info[normalizer.field]))
+            for index, normalizer in enumerate(self._normalizers)
+            if normalizer.field in equipment_info
+        )
+        compiled = self._cache.get(signature)
+        if compiled is not None:
+            return compiled
+        fixers = {}
+        for normalizer in self._normalizers:
+            if normalizer.field not in equipment_info:
+                continue
+            fixer = normalizer.compile(equipment_info[normalizer.field])
+            if fixer is None:
+                continue
+            previous = fixers.get(normalizer.field)
+            if previous is not None:
+                fixers[normalizer.field] = lambda value, first=previous, second=fixer: second(first(value))
+            else:
+                fixers[normalizer.field] = fixer
+        compiled = CompiledNormalizer(fixers) if fixers else _NOTHING
+        with self._lock:
+            self._cache[signature] = compiled
+        return compiled
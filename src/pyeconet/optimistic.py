@@ -0,0 +1,248 @@
+"""Apply commands locally before the equipment confirms them"""
+import asyncio
+import enum
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from pyeconet.outbox import DeliveryStatus
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@enum.unique
+class OptimisticState(enum.Enum):
+    """Define the state of a locally applied command value"""
+
+    PENDING = 1
+    CONFIRMED = 2
+    ROLLED_BACK = 3
+
+
+class OptimisticChange(NamedTuple):
+    """A field value applied ahead of confirmation changed state"""
+
+    serial_number: str
+    field: str
+    state: OptimisticState
+    desired: Any
+    previous: Any
+    # "timeout", "conflict" or "undelivered" for ROLLED_BACK, None otherwise
+    reason: Optional[str]
+
+
+class _Pending:
+    __slots__ = ("desired", "previous", "command_id", "deadline")
+
+    def __init__(self, desired, previous, command_id: Optional[int], deadline: Optional[float]) -> None:
+        self.desired = desired
+        self.previous = previous
+        self.command_id = command_id
+        # None until the command is delivered to the broker
+        self.deadline = deadline
+
+
+def _value_of(field_value):
+    if isinstance(field_value, dict):
+        return field_value.get("value")
+    return field_value
+
+
+class OptimisticUpdates:
+    """Track command values applied locally until the equipment reports them.
+
+    publish() applies each commanded field right away and marks it pending.
+    A reported update with the desired value confirms it. One still showing
+    the previous value is stale (the equipment hasn't acted yet) and is kept
+    from overwriting the pending value. Any other reported value, or a desired
+    update from another client, wins and rolls the pending value back, as does
+    no confirmation within timeout seconds of the broker acknowledging the
+    command, or the command never being delivered.
+    """
+
+    def __init__(self, api, timeout: float = 30.0, callback: Optional[Callable] = None, loop=None) -> None:
+        self._api = api
+        self.timeout = timeout
+        self._callback = callback
+        self._loop = loop
+        self._pending: Dict[str, Dict[str, _Pending]] = {}
+        self._lock = threading.Lock()
+
+    def pending(self, serial_number: str) -> Dict[str, Any]:
+        """Return the desired value of every pending field of an equipment"""
+        with self._lock:
+            fields = self._pending.get(serial_number, {})
+            return {field: pending.desired for field, pending in fields.items()}
+
+    def is_pending(self, serial_number: str, field: Optional[str] = None) -> bool:
+        with self._lock:
+            fields = self._pending.get(serial_number)
+            if not fields:
+                return False
+            return field is None or field in fields
+
+    def command_published(self, equipment, payload: Dict, command=None) -> None:
+        """Apply the @ fields of a published payload locally and mark them pending
+
+        With the OutboundCommand carrying payload, the timeout only starts once
+        it is delivered, commands queued while offline aren't rolled back.
+        """
+        self.expire()
+        if command is not None and command.done and command.status is not DeliveryStatus.DELIVERED:
+            return
+        info = equipment._equipment_info
+        local = {}
+        changes = []
+        with self._lock:
+            if command is None or command.status is DeliveryStatus.DELIVERED:
+                deadline = time.monotonic() + self.timeout
+            else:
+                deadline = None
+            fields = self._pending.setdefault(equipment.serial_number, {})
+            for field, desired in payload.items():
+                if field[:1] != "@" or field not in info:
+                    continue
+                current = info[field]
+                existing = fields.get(field)
+                # A second command keeps the last confirmed value to roll back to
+                previous = existing.previous if existing is not None else current
+                fields[field] = _Pending(
+                    desired, previous, command.id if command is not None else None, deadline
+                )
+                local[field] = self._local_value(current, desired)
+                changes.append(
+                    OptimisticChange(
+                        equipment.serial_number, field, OptimisticState.PENDING, desired, _value_of(previous), None
+                    )
+                )
+        if not local:
+            return
+        equipment.update_equipment_info({"device_name": equipment.device_id, **local})
+        for change in changes:
+            self._notify(change)
+        if deadline is not None:
+            self._schedule_expire()
+
+    def command_status(self, command) -> None:
+        """Start the timeout of fields a delivered command set, roll back those of a command that won't be"""
+        if command.status is DeliveryStatus.DELIVERED:
+            started = False
+            with self._lock:
+                for pending in self._pending_of(command):
+                    if pending.deadline is None:
+                        pending.deadline = time.monotonic() + self.timeout
+                        started = True
+            if started:
+                self._schedule_expire()
+        elif command.status in (DeliveryStatus.EXPIRED, DeliveryStatus.DROPPED):
+            with self._lock:
+                undelivered = self._take(lambda pending: pending.command_id == command.id)
+            self._roll_back(undelivered, "undelivered")
+
+    def _pending_of(self, command):
+        fields = self._pending.get(command.serial_number, {})
+        return [pending for pending in fields.values() if pending.command_id == command.id]
+
+    def _schedule_expire(self) -> None:
+        """Run expire() once the timeout has passed, on the event loop if there is one"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(loop.call_later, self.timeout, self.expire)
+        else:
+            timer = threading.Timer(self.timeout, self.expire)
+            timer.daemon = True
+            timer.start()
+
+    def reconcile(self, equipment, update: Dict, reported: bool) -> None:
+        """Check an incoming update against the pending fields of equipment, called before it is applied
+
+        Stale values of pending fields are removed from update.
+        """
+        serial_number = equipment.serial_number
+        if serial_number not in self._pending:
+            return
+        changes = []
+        with self._lock:
+            fields = self._pending.get(serial_number)
+            if not fields:
+                return
+            for field in [field for field in fields if field in update]:
+                pending = fields[field]
+                value = _value_of(update[field])
+                if value == pending.desired:
+                    if reported:
+                        del fields[field]
+                        changes.append(self._change(serial_number, field, pending, OptimisticState.CONFIRMED))
+                elif reported and value == _value_of(pending.previous):
+                    # Reported before the equipment acted on the command
+                    del update[field]
+                else:
+                    del fields[field]
+                    changes.append(
+                        self._change(serial_number, field, pending, OptimisticState.ROLLED_BACK, "conflict")
+                    )
+            if not fields:
+                del self._pending[serial_number]
+        for change in changes:
+            self._notify(change)
+
+    def expire(self) -> None:
+        """Roll back every pending value whose confirmation timed out"""
+        now = time.monotonic()
+        with self._lock:
+            expired = self._take(lambda pending: pending.deadline is not None and pending.deadline <= now)
+        self._roll_back(expired, "timeout")
+
+    def _take(self, predicate) -> List[Tuple[str, str, _Pending]]:
+        """Remove and return the pending fields matching predicate, called with the lock held"""
+        taken = []
+        for serial_number, fields in list(self._pending.items()):
+            for field, pending in list(fields.items()):
+                if predicate(pending):
+                    del fields[field]
+                    taken.append((serial_number, field, pending))
+            if not fields:
+                del self._pending[serial_number]
+        return taken
+
+    def _roll_back(self, expired: List[Tuple[str, str, _Pending]], reason: str) -> None:
+        for serial_number, field, pending in expired:
+            equipment = self._api._equipment.get(serial_number)
+            if equipment is not None:
+                _LOGGER.debug("No confirmation for %s of %s, rolling back", field, serial_number)
+                previous = pending.previous
+                if isinstance(previous, dict):
+                    previous = {key: previous[key] for key in ("value", "status") if key in previous}
+                equipment.update_equipment_info({"device_name": equipment.device_id, field: previous})
+            self._notify(self._change(serial_number, field, pending, OptimisticState.ROLLED_BACK, reason))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pending.clear()
+
+    @staticmethod
+    def _local_value(current, desired):
+        if not isinstance(current, dict):
+            return desired
+        local = {"value": desired}
+        enumtext = current.get("constraints", {}).get("enumText")
+        if enumtext and isinstance(desired, int) and 0 <= desired < len(enumtext):
+            # Keep the status text in step with the index, e.g. for @MODE
+            local["status"] = enumtext[desired]
+        return local
+
+    @staticmethod
+    def _change(serial_number: str, field: str, pending: _Pending, state: OptimisticState, reason=None):
+        return OptimisticChange(serial_number, field, state, pending.desired, _value_of(pending.previous), reason)
+
+    def _notify(self, change: OptimisticChange) -> None:
+        if self._callback is None:
+            return
+        try:
+            self._callback(change)
+        except Exception as err:
+            _LOGGER.exception(err)
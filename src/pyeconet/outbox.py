@@ -0,0 +1,389 @@
+"""Outbound command queue: QoS1 delivery, compaction and an optional journal"""
+import enum
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+# paho keeps QoS 1 messages published while the connection is down and sends them on reconnect
+_MQTT_ERR_NO_CONN = 4
+
+
+@enum.unique
+class DeliveryStatus(enum.Enum):
+    """Define the delivery state of a command"""
+
+    QUEUED = 1
+    IN_FLIGHT = 2
+    DELIVERED = 3
+    SUPERSEDED = 4
+    EXPIRED = 5
+    DROPPED = 6
+
+
+class OutboundCommand:
+    """A command waiting for, or done with, delivery to the broker"""
+
+    __slots__ = (
+        "id", "serial_number", "device_id", "fields", "transaction_id",
+        "created", "status", "mid", "sent_at", "delivered_at",
+    )
+
+    def __init__(
+            self, command_id: int, serial_number: str, device_id: str, fields: Dict,
+            transaction_id: str, created: float,
+    ) -> None:
+        self.id = command_id
+        self.serial_number = serial_number
+        self.device_id = device_id
+        self.fields = fields
+        self.transaction_id = transaction_id
+        self.created = created
+        self.status = DeliveryStatus.QUEUED
+        self.mid: Optional[int] = None
+        self.sent_at: Optional[float] = None
+        self.delivered_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status not in (DeliveryStatus.QUEUED, DeliveryStatus.IN_FLIGHT)
+
+    def message(self) -> Dict:
+        """Return the payload published on the desired topic"""
+        message = {
+            "transactionId": self.transaction_id,
+            "device_name": self.device_id,
+            "serial_number": self.serial_number,
+        }
+        message.update(self.fields)
+        return message
+
+    def _compactable(self) -> bool:
+        return all(field[:1] == "@" for field in self.fields)
+
+    def __repr__(self) -> str:
+        return f"<OutboundCommand {self.id} {self.serial_number} {self.fields} {self.status.name}>"
+
+
+class CommandOutbox:
+    """Queue commands and publish them with QoS 1 while connected.
+
+    Commands are held while there is no connection and sent in order once
+    there is one, with at most max_in_flight of them unacknowledged by the
+    broker. A queued command loses the fields a newer command to the same
+    equipment sets again, and is dropped as SUPERSEDED once it has none left.
+    A command unacknowledged ack_timeout seconds after it was sent, e.g.
+    because the session it was sent in is gone, is queued again (at least
+    once delivery). With a journal_path, queued and unacknowledged commands
+    are appended to a file and sent after a restart unless older than max_age
+    seconds, so they survive a crash of the process or machine. A background
+    thread fsyncs the journal, one fsync covering every record written since
+    the last one, so neither the event loop nor paho's thread waits on disk.
+
+    Args:
+        max_in_flight (int): Commands published but not yet acknowledged at most.
+        max_queued (int): Commands queued at most, the oldest are DROPPED beyond it.
+        journal_path (str): File keeping undelivered commands across restarts.
+        max_age (float): Commands older than this are EXPIRED instead of sent, in seconds.
+        status_callback (Callable): Called with each OutboundCommand whose status changed.
+        ack_timeout (float): Seconds a command may stay unacknowledged before being sent again.
+    """
+
+    def __init__(
+            self,
+            max_in_flight: int = 10,
+            max_queued: int = 1000,
+            journal_path: Optional[str] = None,
+            max_age: float = 3600.0,
+            status_callback: Optional[Callable[[OutboundCommand], None]] = None,
+            ack_timeout: float = 60.0,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self.ack_timeout = ack_timeout
+        self.max_queued = max_queued
+        self.max_age = max_age
+        self._status_callback = status_callback
+        self._listeners: List[Callable[[OutboundCommand], None]] = []
+        self._lock = threading.RLock()
+        self._ids = itertools.count(1)
+        self._queued: "OrderedDict[int, OutboundCommand]" = OrderedDict()
+        self._in_flight: Dict[int, OutboundCommand] = {}
+        self._early_acks: "OrderedDict[int, bool]" = OrderedDict()
+        self._client = None
+        self._topic: Optional[str] = None
+        self._journal_path = journal_path
+        self._journal = None
+        self._journal_done = 0
+        self._journal_dirty = threading.Event()
+        self._journal_syncer: Optional[threading.Thread] = None
+        if journal_path is not None:
+            self._load_journal()
+
+    @property
+    def connected(self) -> bool:
+        return self._client is not None
+
+    def add_listener(self, listener: Callable[[OutboundCommand], None]) -> Callable[[], None]:
+        """Also call listener with each OutboundCommand whose status changed, returns a remover"""
+        self._listeners.append(listener)
+
+        def remove() -> None:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return remove
+
+    def pending(self) -> List[OutboundCommand]:
+        """Return the commands not delivered yet, in flight first"""
+        with self._lock:
+            return list(self._in_flight.values()) + list(self._queued.values())
+
+    def enqueue(self, serial_number: str, device_id: str, fields: Dict, transaction_id: str) -> OutboundCommand:
+        changed = []
+        with self._lock:
+            command = OutboundCommand(
+                next(self._ids), serial_number, device_id, dict(fields), transaction_id, time.time()
+            )
+            if command._compactable():
+                for queued in list(self._queued.values()):
+                    if queued.serial_number != serial_number or not queued._compactable():
+                        continue
+                    overlap = [field for field in queued.fields if field in command.fields]
+                    if not overlap:
+                        continue
+                    for field in overlap:
+                        del queued.fields[field]
+                    if not queued.fields:
+                        changed.append(self._finish(queued, DeliveryStatus.SUPERSEDED))
+                    else:
+                        self._journal_write({"op": "add", **self._entry(queued)})
+            self._queued[command.id] = command
+            self._journal_write({"op": "add", **self._entry(command)})
+            while len(self._queued) > self.max_queued:
+                changed.append(self._finish(next(iter(self._queued.values())), DeliveryStatus.DROPPED))
+        self._notify(changed)
+        self._pump()
+        return command
+
+    def connection_up(self, client, topic: str) -> None:
+        """Start sending on client, called once the connection is established"""
+        with self._lock:
+            self._client = client
+            self._topic = topic
+        self._pump()
+
+    def connection_down(self, requeue: bool = False) -> None:
+        """Stop sending, requeue in flight commands if the client that held them is gone"""
+        with self._lock:
+            self._client = None
+            if requeue and self._in_flight:
+                # The broker may or may not have them, at least once means sending again
+                requeued = OrderedDict((command.id, command) for command in self._in_flight.values())
+                for command in requeued.values():
+                    command.status = DeliveryStatus.QUEUED
+                    command.mid = None
+                requeued.update(self._queued)
+                self._queued = requeued
+                self._in_flight = {}
+
+    def published(self, mid: int) -> None:
+        """Handle the broker acknowledging message mid"""
+        changed = []
+        with self._lock:
+            for command in self._in_flight.values():
+                if command.mid == mid:
+                    command.delivered_at = time.time()
+                    changed.append(self._finish(command, DeliveryStatus.DELIVERED))
+                    break
+            else:
+                # Acknowledged before _send recorded the mid
+                self._early_acks[mid] = True
+                while len(self._early_acks) > self.max_in_flight:
+                    self._early_acks.popitem(last=False)
+        self._notify(changed)
+        self._pump()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._journal is not None:
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+                self._journal.close()
+                self._journal = None
+        # Let the syncer see the journal is gone
+        self._journal_dirty.set()
+
+    def _pump(self) -> None:
+        """Publish queued commands while the in flight window has room.
+
+        paho holds its own lock while calling on_publish, so client.publish is
+        never called with our lock held.
+        """
+        while True:
+            changed = []
+            with self._lock:
+                client, topic = self._client, self._topic
+                batch = self._reserve(changed) if client is not None else []
+            self._notify(changed)
+            if not batch:
+                return
+            self._notify(self._send(client, topic, batch))
+
+    def _reserve(self, changed: List[OutboundCommand]) -> List[OutboundCommand]:
+        batch = []
+        now = time.time()
+        self._requeue_unacknowledged(now)
+        while self._queued and len(self._in_flight) < self.max_in_flight:
+            command = next(iter(self._queued.values()))
+            if now - command.created > self.max_age:
+                changed.append(self._finish(command, DeliveryStatus.EXPIRED))
+                continue
+            del self._queued[command.id]
+            command.status = DeliveryStatus.IN_FLIGHT
+            self._in_flight[command.id] = command
+            batch.append(command)
+        return batch
+
+    def _requeue_unacknowledged(self, now: float) -> None:
+        """Queue again, in front, in flight commands the broker never acknowledged"""
+        stale = [
+            command for command in self._in_flight.values()
+            if command.sent_at is not None and now - command.sent_at > self.ack_timeout
+        ]
+        for command in reversed(stale):
+            _LOGGER.debug("No acknowledgement for command %s, sending it again", command.id)
+            del self._in_flight[command.id]
+            command.status = DeliveryStatus.QUEUED
+            command.mid = None
+            command.sent_at = None
+            self._queued[command.id] = command
+            self._queued.move_to_end(command.id, last=False)
+
+    def _send(self, client, topic: str, batch: List[OutboundCommand]) -> List[OutboundCommand]:
+        changed = []
+        for index, command in enumerate(batch):
+            info = client.publish(topic, payload=json.dumps(command.message()), qos=1)
+            with self._lock:
+                if info.rc not in (0, _MQTT_ERR_NO_CONN):
+                    _LOGGER.debug("Failed to publish command %s: %s", command.id, info.rc)
+                    # Put the rest back in front of the queue, in order
+                    for unsent in reversed(batch[index:]):
+                        self._in_flight.pop(unsent.id, None)
+                        unsent.status = DeliveryStatus.QUEUED
+                        self._queued[unsent.id] = unsent
+                        self._queued.move_to_end(unsent.id, last=False)
+                    break
+                command.mid = info.mid
+                command.sent_at = time.time()
+                changed.append(command)
+                if self._early_acks.pop(info.mid, None) is not None:
+                    command.delivered_at = command.sent_at
+                    changed.append(self._finish(command, DeliveryStatus.DELIVERED))
+        return changed
+
+    def _finish(self, command: OutboundCommand, status: DeliveryStatus) -> OutboundCommand:
+        self._queued.pop(command.id, None)
+        self._in_flight.pop(command.id, None)
+        command.status = status
+        self._journal_write({"op": "done", "id": command.id})
+        return command
+
+    def _notify(self, commands: List[OutboundCommand]) -> None:
+        if self._status_callback is None and not self._listeners:
+            return
+        for command in commands:
+            for callback in [self._status_callback, *self._listeners]:
+                if callback is None:
+                    continue
+                try:
+                    callback(command)
+                except Exception as err:
+                    _LOGGER.exception(err)
+
+    @staticmethod
+    def _entry(command: OutboundCommand) -> Dict:
+        return {
+            "id": command.id,
+            "serial_number": command.serial_number,
+            "device_id": command.device_id,
+            "fields": command.fields,
+            "transaction_id": command.transaction_id,
+            "created": command.created,
+        }
+
+    def _journal_write(self, record: Dict) -> None:
+        if self._journal is None:
+            return
+        self._journal.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._journal_dirty.set()
+        if record["op"] == "done":
+            self._journal_done += 1
+            if self._journal_done > 1000 and self._journal_done > 4 * len(self._queued):
+                self._rewrite_journal()
+
+    def _load_journal(self) -> None:
+        """Queue the undelivered commands of a previous run, then compact the journal"""
+        entries: "OrderedDict[int, Dict]" = OrderedDict()
+        if os.path.exists(self._journal_path):
+            with open(self._journal_path, encoding="utf-8") as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A write cut short by a crash
+                        continue
+                    if record.get("op") == "add":
+                        entries[record["id"]] = record
+                    elif record.get("op") == "done":
+                        entries.pop(record.get("id"), None)
+        for entry in entries.values():
+            command = OutboundCommand(
+                next(self._ids), entry["serial_number"], entry["device_id"], entry["fields"],
+                entry["transaction_id"], entry["created"],
+            )
+            self._queued[command.id] = command
+        if entries:
+            _LOGGER.debug("Loaded %s undelivered commands from %s", len(entries), self._journal_path)
+        self._rewrite_journal()
+
+    def _rewrite_journal(self) -> None:
+        if self._journal is not None:
+            self._journal.close()
+        temporary = f"{self._journal_path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as journal:
+            for command in itertools.chain(self._in_flight.values(), self._queued.values()):
+                journal.write(json.dumps({"op": "add", **self._entry(command)}, separators=(",", ":")) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(temporary, self._journal_path)
+        self._journal = open(self._journal_path, "a", encoding="utf-8")
+        self._journal_done = 0
+        if self._journal_syncer is None or not self._journal_syncer.is_alive():
+            self._journal_syncer = threading.Thread(
+                target=self._sync_journal, name="econet-outbox-journal", daemon=True
+            )
+            self._journal_syncer.start()
+
+    def _sync_journal(self) -> None:
+        """Flush and fsync records as they are written, until the outbox is closed"""
+        while True:
+            self._journal_dirty.wait()
+            self._journal_dirty.clear()
+            with self._lock:
+                if self._journal is None:
+                    return
+                self._journal.flush()
+                # The journal may be rewritten and closed while the fsync runs
+                fd = os.dup(self._journal.fileno())
+            try:
+                os.fsync(fd)
+            except OSError as err:
+                _LOGGER.error("Failed to sync the command journal: %s", err)
+            finally:
+                os.close(fd)
@@ -0,0 +1,145 @@
+"""Poll equipment over REST while the MQTT connection is unavailable"""
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from pyeconet.reconnect import ConnectionState
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class PollingPolicy:
+    """Interval settings for a RestPoller.
+
+    Args:
+        grace_period (float): How long MQTT must be unavailable before polling starts, in seconds.
+        initial_interval (float): Interval of the first polls, in seconds.
+        min_interval (float): Shortest interval while equipment keeps changing, in seconds.
+        max_interval (float): Longest interval while nothing changes, in seconds.
+        command_interval (float): Interval used shortly after a command was published, in seconds.
+        command_window (float): How long after a command command_interval applies, in seconds.
+    """
+
+    def __init__(
+            self,
+            grace_period: float = 30.0,
+            initial_interval: float = 60.0,
+            min_interval: float = 30.0,
+            max_interval: float = 600.0,
+            command_interval: float = 10.0,
+            command_window: float = 60.0,
+    ) -> None:
+        self.grace_period = grace_period
+        self.initial_interval = initial_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.command_interval = command_interval
+        self.command_window = command_window
+
+    def next_interval(self, interval: float, changed: Optional[int]) -> float:
+        """Return the interval after a poll that changed changed equipment (None if it failed)"""
+        if changed is None:
+            interval *= 2
+        elif changed:
+            interval /= 2
+        else:
+            interval *= 1.5
+        return max(self.min_interval, min(self.max_interval, interval))
+
+
+class RestPoller:
+    """Refresh equipment over REST while MQTT is down and stop once it's back.
+
+    The interval shrinks while polls keep finding changes, grows while they
+    don't, and drops to command_interval after a command so its result shows
+    up quickly. Connection state changes and commands may come from any
+    thread, polling itself runs on the event loop that called subscribe().
+    """
+
+    def __init__(self, api, policy: Optional[PollingPolicy] = None, loop=None) -> None:
+        self._api = api
+        self.policy = policy or PollingPolicy()
+        self._loop = loop
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._interval = self.policy.initial_interval
+        self._last_poll: Optional[float] = None
+        self._last_command: Optional[float] = None
+        self.polls = 0
+
+    @property
+    def active(self) -> bool:
+        """Return True while MQTT is unavailable and polling is scheduled"""
+        return self._task is not None and not self._task.done()
+
+    @property
+    def interval(self) -> float:
+        """Return the current polling interval in seconds"""
+        if (
+                self._last_command is not None
+                and time.monotonic() - self._last_command < self.policy.command_window
+        ):
+            return min(self._interval, self.policy.command_interval)
+        return self._interval
+
+    def connection_changed(self, state: ConnectionState) -> None:
+        self._call(self._connection_changed, state)
+
+    def command_sent(self) -> None:
+        self._last_command = time.monotonic()
+        self._call(self._wake_up)
+
+    def stop(self) -> None:
+        self._call(self._stop_polling)
+
+    def _call(self, callback, *args) -> None:
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(callback, *args)
+
+    def _connection_changed(self, state: ConnectionState) -> None:
+        if state in (ConnectionState.CONNECTED, ConnectionState.DISCONNECTED):
+            self._stop_polling()
+        elif self._task is None:
+            self._task = self._loop.create_task(self._run())
+
+    def _stop_polling(self) -> None:
+        if self._task is not None:
+            if self.polls:
+                _LOGGER.debug("Stopped polling equipment after %s polls", self.polls)
+            self._task.cancel()
+            self._task = None
+
+    def _wake_up(self) -> None:
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self) -> None:
+        await asyncio.sleep(self.policy.grace_period)
+        _LOGGER.debug("EcoNet MQTT unavailable, polling equipment over REST")
+        self._wake = asyncio.Event()
+        self._interval = self.policy.initial_interval
+        self._last_poll = None
+        while True:
+            if self._last_poll is not None:
+                delay = self._last_poll + self.interval - time.monotonic()
+                if delay > 0:
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    # A command may have shortened the interval
+                    continue
+            self._last_poll = time.monotonic()
+            try:
+                changed = await self._api.refresh_equipment()
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                _LOGGER.error("Failed to poll equipment: %s", err)
+                changed = None
+            self.polls += 1
+            self._interval = self.policy.next_interval(self._interval, changed)
+            _LOGGER.debug("Polled equipment, %s changed, next poll in %.0f seconds", changed, self.interval)
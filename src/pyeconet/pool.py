@@ -0,0 +1,211 @@
+"""Run many EcoNet accounts across a pool of worker processes"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+
+_LOGGER = logging.getLogger(__name__)
+
+# Messages from workers to the parent
+MSG_STATE = "S"  # (MSG_STATE, email, serial, equipment info)
+MSG_UPDATE = "U"  # (MSG_UPDATE, serial, {field: value})
+MSG_READY = "R"  # (MSG_READY, email)
+MSG_ERROR = "E"  # (MSG_ERROR, email, message)
+
+# Messages from the parent to workers
+CMD_PUBLISH = "P"  # (CMD_PUBLISH, serial, payload)
+CMD_STOP = "X"  # (CMD_STOP,)
+
+
+def _worker_main(accounts: List[Tuple[str, str]], commands, updates, workers: int) -> None:
+    """Entry point of a worker process"""
+    asyncio.run(_worker(accounts, commands, updates, workers))
+
+
+async def _worker(accounts: List[Tuple[str, str]], commands, updates, workers: int) -> None:
+    from pyeconet.api import EcoNetApiInterface
+    from pyeconet.equipment import EquipmentType
+
+    def send_update(equipment, fields):
+        info = equipment._equipment_info
+        updates.put((MSG_UPDATE, equipment.serial_number, {field: info.get(field) for field in fields}))
+
+    apis = []
+    owners = {}
+    for email, password in accounts:
+        try:
+            api = await EcoNetApiInterface.login(email, password)
+            await api.get_equipment_by_type(
+                [EquipmentType.WATER_HEATER, EquipmentType.THERMOSTAT]
+            )
+        except Exception as err:
+            updates.put((MSG_ERROR, email, str(err)))
+            continue
+        for serial, equipment in api._equipment.items():
+            owners[serial] = equipment
+            updates.put((MSG_STATE, email, serial, equipment._equipment_info))
+        api.add_update_listener(send_update)
+        api.subscribe(workers=workers)
+        apis.append(api)
+        updates.put((MSG_READY, email))
+
+    loop = asyncio.get_running_loop()
+    while True:
+        command = await loop.run_in_executor(None, commands.get)
+        if command[0] == CMD_STOP:
+            break
+        if command[0] == CMD_PUBLISH:
+            _, serial, payload = command
+            equipment = owners.get(serial)
+            if equipment is None:
+                _LOGGER.error("No equipment with serial number %s in this worker", serial)
+                continue
+            equipment._api.publish(payload, equipment.device_id, serial)
+
+    for api in apis:
+        api.unsubscribe()
+
+
+class AccountPool:
+    """Spread EcoNetApiInterface accounts across worker processes.
+
+    Every worker runs its own event loop and MQTT connections. Equipment state
+    flows back over a queue into a merged, read-only view in the parent and
+    commands are routed to the worker that owns the device.
+
+    Args:
+        processes (int): Number of worker processes, defaults to the CPU count.
+        workers (int): MQTT processing threads per account inside each worker,
+            see EcoNetApiInterface.subscribe.
+    """
+
+    def __init__(self, processes: Optional[int] = None, workers: int = 0) -> None:
+        self.processes = processes or os.cpu_count() or 1
+        self.workers = workers
+        self._context = multiprocessing.get_context("spawn")
+        self._accounts: List[Tuple[str, str]] = []
+        self._procs = []
+        self._commands = []
+        self._updates = None
+        self._pump_thread: Optional[threading.Thread] = None
+        self._equipment: Dict[str, Dict] = {}
+        self._views: Dict[str, Mapping] = {}
+        self._owner: Dict[str, int] = {}
+        self._account_of: Dict[str, str] = {}
+        self._worker_of_account: Dict[str, int] = {}
+        self._errors: Dict[str, str] = {}
+        self._pending = 0
+        self._ready = threading.Condition()
+        self._update_callback: Optional[Callable] = None
+
+    def add_account(self, email: str, password: str) -> None:
+        """Add an account, must be called before start()"""
+        if self._procs:
+            raise RuntimeError("Accounts must be added before the pool is started")
+        self._accounts.append((email, password))
+
+    def set_update_callback(self, callback: Callable) -> None:
+        """Call callback(serial_number, fields) from the pool's receiver thread on every update"""
+        self._update_callback = callback
+
+    @property
+    def equipment(self) -> Mapping[str, Mapping]:
+        """Return a read-only view of every equipment's info keyed by serial number"""
+        return MappingProxyType(self._views)
+
+    @property
+    def errors(self) -> Mapping[str, str]:
+        """Return login or load errors keyed by account email"""
+        return MappingProxyType(self._errors)
+
+    def account_of(self, serial_number: str) -> Optional[str]:
+        return self._account_of.get(serial_number)
+
+    def start(self) -> None:
+        processes = min(self.processes, len(self._accounts)) or 1
+        assignments: List[List[Tuple[str, str]]] = [[] for _ in range(processes)]
+        for index, account in enumerate(self._accounts):
+            assignments[index % processes].append(account)
+            self._worker_of_account[account[0]] = index % processes
+        self._updates = self._context.Queue()
+        self._pending = len(self._accounts)
+        for index, accounts in enumerate(assignments):
+            commands = self._context.Queue()
+            proc = self._context.Process(
+                target=_worker_main,
+                args=(accounts, commands, self._updates, self.workers),
+                name=f"pyeconet-pool-{index}",
+                daemon=True,
+            )
+            proc.start()
+            self._procs.append(proc)
+            self._commands.append(commands)
+        self._pump_thread = threading.Thread(target=self._pump, name="pyeconet-pool", daemon=True)
+        self._pump_thread.start()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until every account has loaded or failed"""
+        with self._ready:
+            return self._ready.wait_for(lambda: self._pending <= 0, timeout)
+
+    def publish(self, serial_number: str, payload: Dict) -> None:
+        """Send payload to the device through the worker that owns it"""
+        worker = self._owner.get(serial_number)
+        if worker is None:
+            _LOGGER.error("Unknown serial number: %s", serial_number)
+            return
+        self._commands[worker].put((CMD_PUBLISH, serial_number, payload))
+
+    def stop(self, timeout: Optional[float] = 10) -> None:
+        for commands in self._commands:
+            commands.put((CMD_STOP,))
+        for proc in self._procs:
+            proc.join(timeout)
+            if proc.is_alive():
+                proc.terminate()
+        if self._updates is not None:
+            self._updates.put(None)
+        if self._pump_thread is not None:
+            self._pump_thread.join(timeout)
+        self._procs = []
+        self._commands = []
+        self._pump_thread = None
+
+    def _pump(self) -> None:
+        """Apply worker messages to the merged view"""
+        while True:
+            try:
+                message = self._updates.get()
+            except (EOFError, OSError, queue.Empty):
+                return
+            if message is None:
+                return
+            kind = message[0]
+            if kind == MSG_UPDATE:
+                _, serial, fields = message
+                info = self._equipment.get(serial)
+                if info is None:
+                    continue
+                info.update(fields)
+                if self._update_callback is not None:
+                    try:
+                        self._update_callback(serial, fields)
+                    except Exception as err:
+                        _LOGGER.exception(err)
+            elif kind == MSG_STATE:
+                _, email, serial, info = message
+                self._equipment[serial] = info
+                self._views[serial] = MappingProxyType(info)
+                self._owner[serial] = self._worker_of_account[email]
+                self._account_of[serial] = email
+            elif kind in (MSG_READY, MSG_ERROR):
+                if kind == MSG_ERROR:
+                    _LOGGER.error("EcoNet account %s failed to load: %s", message[1], message[2])
+                    self._errors[message[1]] = message[2]
+                with self._ready:
+                    self._pending -= 1
+                    self._ready.notify_all()
@@ -0,0 +1,147 @@
+"""Supervise the MQTT connection: backoff, connection state and resync after gaps"""
+import asyncio
+import enum
+import logging
+import random
+import threading
+import time
+from typing import Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@enum.unique
+class ConnectionState(enum.Enum):
+    """Define the MQTT connection state"""
+
+    DISCONNECTED = 1
+    CONNECTING = 2
+    CONNECTED = 3
+    RECONNECTING = 4
+
+
+class ReconnectPolicy:
+    """Backoff and resync settings for a ReconnectSupervisor.
+
+    Args:
+        base_delay (float): Delay before the first reconnect attempt, in seconds.
+        max_delay (float): Upper bound for the exponential backoff, in seconds.
+        resync_min_interval (float): Minimum time between two resyncs, in seconds. A
+            reconnect sooner than that after the last resync postpones the next one.
+        resync_max_delay (float): Resyncs start after a random delay up to this many
+            seconds so accounts that lost the broker together don't re-fetch together.
+    """
+
+    def __init__(
+            self,
+            base_delay: float = 1.0,
+            max_delay: float = 300.0,
+            resync_min_interval: float = 300.0,
+            resync_max_delay: float = 30.0,
+    ) -> None:
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.resync_min_interval = resync_min_interval
+        self.resync_max_delay = resync_max_delay
+
+    def backoff(self, attempt: int) -> float:
+        """Return the delay before reconnect attempt number attempt (0 based), with equal jitter"""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** min(attempt, 32)))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+class ReconnectSupervisor:
+    """Track the MQTT connection of an EcoNetApiInterface.
+
+    Reconnecting is left to paho's network thread; the supervisor only tunes the
+    delay before each attempt, so nothing here ever blocks inside a paho callback.
+    Once a connection comes back after a gap, the equipment state is refreshed
+    over REST on the event loop that called subscribe().
+    """
+
+    def __init__(self, api, policy: Optional[ReconnectPolicy] = None, loop=None) -> None:
+        self._api = api
+        self.policy = policy or ReconnectPolicy()
+        self._loop = loop
+        self._lock = threading.Lock()
+        self._attempt = 0
+        self._has_connected = False
+        self._stopped = False
+        self._last_resync: Optional[float] = None
+        self._resync_future = None
+
+    @property
+    def attempts(self) -> int:
+        """Return the number of consecutive failed connection attempts"""
+        return self._attempt
+
+    def start(self, client) -> None:
+        self._stopped = False
+        self._set_delay(client)
+        self._api._set_connection_state(ConnectionState.CONNECTING)
+
+    def stop(self) -> None:
+        self._stopped = True
+        if self._resync_future is not None:
+            self._resync_future.cancel()
+            self._resync_future = None
+        self._api._set_connection_state(ConnectionState.DISCONNECTED)
+
+    def on_connect(self, client, rc) -> None:
+        if rc != 0:
+            self.on_connect_fail(client)
+            return
+        with self._lock:
+            reconnected = self._has_connected
+            self._has_connected = True
+            self._attempt = 0
+        self._set_delay(client)
+        self._api._set_connection_state(ConnectionState.CONNECTED)
+        if reconnected:
+            self._schedule_resync()
+
+    def on_disconnect(self, client, rc) -> None:
+        if rc == 0 or self._stopped:
+            self._api._set_connection_state(ConnectionState.DISCONNECTED)
+            return
+        self._set_delay(client)
+        self._api._set_connection_state(ConnectionState.RECONNECTING)
+
+    def on_connect_fail(self, client) -> None:
+        with self._lock:
+            self._attempt += 1
+        self._set_delay(client)
+        self._api._set_connection_state(ConnectionState.RECONNECTING)
+
+    def _set_delay(self, client) -> None:
+        """Make paho wait exactly our jittered backoff before its next attempt"""
+        delay = self.policy.backoff(self._attempt)
+        _LOGGER.debug("Next EcoNet MQTT connection attempt in %.1f seconds", delay)
+        client.reconnect_delay_set(min_delay=delay, max_delay=delay)
+
+    def _schedule_resync(self) -> None:
+        """Refresh equipment over REST, postponed to keep resyncs resync_min_interval apart"""
+        if self._loop is None or self._loop.is_closed():
+            _LOGGER.debug("No event loop to resync equipment on after reconnecting")
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self._resync_future is not None and not self._resync_future.done():
+                # Still waiting, it will pick up this gap as well
+                return
+            delay = random.uniform(0, self.policy.resync_max_delay)
+            if self._last_resync is not None:
+                delay = max(delay, self._last_resync + self.policy.resync_min_interval - now)
+                _LOGGER.debug("Resyncing equipment in %.0f seconds", delay)
+            self._last_resync = now + delay
+            self._resync_future = asyncio.run_coroutine_threadsafe(self._resync(delay), self._loop)
+
+    async def _resync(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        if self._stopped:
+            return
+        _LOGGER.debug("Refreshing equipment after MQTT reconnect")
+        try:
+            await self._api.refresh_equipment()
+        except Exception as err:
+            _LOGGER.error("Failed to refresh equipment after reconnecting: %s", err)
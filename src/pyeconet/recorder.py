@@ -0,0 +1,186 @@
+"""Record and replay EcoNet REST and MQTT traffic"""
+import asyncio
+import gzip
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from pyeconet.errors import GenericHTTPError
+
+_LOGGER = logging.getLogger(__name__)
+
+CAPTURE_VERSION = 1
+
+# Every line of a capture file is a compact JSON array: [timestamp, kind, key, data]
+RECORD_HEADER = "H"
+RECORD_LOCATIONS = "L"
+RECORD_DYNAMIC_ACTION = "D"
+RECORD_MQTT = "M"
+
+Record = Tuple[float, str, object, object]
+
+
+def _open_capture(path: str, mode: str):
+    """Open a capture file, transparently handling gzip compressed captures"""
+    if str(path).endswith(".gz"):
+        return gzip.open(path, f"{mode}t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _payload_key(payload: Dict) -> str:
+    """Return a stable key for a dynamicAction request payload"""
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"))
+
+
+def read_capture(path: str) -> Iterator[Record]:
+    """Yield every (timestamp, kind, key, data) record in a capture file"""
+    with _open_capture(path, "r") as capture:
+        for line in capture:
+            if not line.strip():
+                continue
+            timestamp, kind, key, data = json.loads(line)
+            if kind == RECORD_HEADER:
+                if key != CAPTURE_VERSION:
+                    _LOGGER.warning("Unsupported capture version: %s", key)
+                continue
+            yield timestamp, kind, key, data
+
+
+class EcoNetRecorder:
+    """Append REST responses and MQTT messages seen by an EcoNetApiInterface to a capture file.
+
+    Files ending in .gz are gzip compressed. Records are written from both the
+    event loop and paho's network thread so every write is serialized. The
+    file is flushed at most every flush_interval seconds and on close, as
+    each gzip flush ends a deflate block and costs compression.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 5.0) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._file = _open_capture(path, "a")
+        self._flushed = time.monotonic()
+        self._write(RECORD_HEADER, CAPTURE_VERSION, None)
+
+    def record_locations(self, response: Dict) -> None:
+        """Record a getUserDataForApp response"""
+        self._write(RECORD_LOCATIONS, None, response)
+
+    def record_dynamic_action(self, payload: Dict, response: Dict) -> None:
+        """Record a dynamicAction request payload and its response"""
+        self._write(RECORD_DYNAMIC_ACTION, payload, response)
+
+    def record_mqtt(self, topic: str, payload) -> None:
+        """Record a raw MQTT message"""
+        if isinstance(payload, (bytes, bytearray)):
+            payload = payload.decode("utf-8", "replace")
+        self._write(RECORD_MQTT, topic, payload)
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                self._flushed = time.monotonic()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _write(self, kind: str, key, data) -> None:
+        line = json.dumps([time.time(), kind, key, data], separators=(",", ":"))
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line)
+            self._file.write("\n")
+            now = time.monotonic()
+            if now - self._flushed >= self.flush_interval:
+                self._file.flush()
+                self._flushed = now
+
+
+class _ReplayMessage:
+    """Minimal stand-in for a paho MQTTMessage"""
+
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic: str, payload: bytes) -> None:
+        self.topic = topic
+        self.payload = payload
+
+
+class EcoNetReplay:
+    """Drive an EcoNetApiInterface from a capture file written by EcoNetRecorder.
+
+    speed scales the recorded timing: 1.0 is real time, 2.0 twice as fast and
+    None replays as fast as possible.
+    """
+
+    def __init__(self, path: str, speed: Optional[float] = 1.0) -> None:
+        self.speed = speed
+        self._records: List[Record] = list(read_capture(path))
+        self._locations: Optional[Dict] = None
+        self._dynamic_actions: Dict[str, Deque[Dict]] = {}
+        for _, kind, key, data in self._records:
+            if kind == RECORD_LOCATIONS and self._locations is None:
+                self._locations = data
+            elif kind == RECORD_DYNAMIC_ACTION:
+                self._dynamic_actions.setdefault(_payload_key(key), deque()).append(data)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def attach(self, api) -> None:
+        """Serve this capture's REST responses to api"""
+        api.set_replay(self)
+
+    def locations_response(self) -> Dict:
+        """Return the getUserDataForApp response current at this point of the replay"""
+        if self._locations is None:
+            raise GenericHTTPError(404)
+        return self._locations
+
+    def dynamic_action_response(self, payload: Dict) -> Dict:
+        """Return the recorded responses for payload in the order they were captured"""
+        responses = self._dynamic_actions.get(_payload_key(payload))
+        if not responses:
+            _LOGGER.debug("No recorded dynamicAction response for: %s", payload)
+            raise GenericHTTPError(404)
+        if len(responses) > 1:
+            return responses.popleft()
+        return responses[0]
+
+    async def run(self, api) -> int:
+        """Replay every captured location snapshot and MQTT message into api.
+
+        Returns the number of records replayed.
+        """
+        self.attach(api)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        first = self._records[0][0] if self._records else 0.0
+        count = 0
+        for timestamp, kind, key, data in self._records:
+            if self.speed:
+                delay = started + (timestamp - first) / self.speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if kind == RECORD_LOCATIONS:
+                self._locations = data
+                if api._equipment:
+                    await api.refresh_equipment()
+                else:
+                    await api._get_equipment()
+            elif kind == RECORD_MQTT:
+                api._on_message(None, None, _ReplayMessage(key, data.encode("utf-8")))
+            else:
+                # dynamicAction responses are only served on request
+                continue
+            count += 1
+        return count
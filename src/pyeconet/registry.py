@@ -0,0 +1,171 @@
+"""Equipment registry with secondary indexes"""
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from pyeconet.equipment import Equipment, EquipmentType
+
+# Index name -> how to read the key from an equipment
+INDEXES: Dict[str, Callable[[Equipment], Any]] = {
+    "type": lambda equipment: equipment.type,
+    "location_id": lambda equipment: equipment.location_id,
+    "generic_type": lambda equipment: equipment.generic_type,
+    "connected": lambda equipment: equipment.connected,
+    "active": lambda equipment: equipment.active,
+    "device_id": lambda equipment: equipment.device_id,
+    "parent_serial_number": lambda equipment: equipment.parent_serial_number,
+}
+
+# Equipment fields that feed an index, only these trigger a re-index on update
+INDEXED_FIELDS: Dict[str, str] = {
+    "@TYPE": "generic_type",
+    "@CONNECTED": "connected",
+    "@ACTIVE": "active",
+    "device_name": "device_id",
+    "device_type": "type",
+}
+
+
+class EquipmentRegistry(dict):
+    """Equipment keyed by serial number with indexes kept up to date on every change.
+
+    It is a plain dict to existing code, adding query() for filtering on
+    several attributes without scanning every equipment.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._lock = threading.RLock()
+        self._indexes: Dict[str, Dict[Any, Dict[str, Equipment]]] = {name: {} for name in INDEXES}
+        self._keys: Dict[str, Dict[str, Any]] = {}
+
+    def __setitem__(self, serial_number: str, equipment: Equipment) -> None:
+        with self._lock:
+            if serial_number in self:
+                self._unindex(serial_number)
+            super().__setitem__(serial_number, equipment)
+            self._index(serial_number, equipment)
+
+    def __delitem__(self, serial_number: str) -> None:
+        with self._lock:
+            super().__delitem__(serial_number)
+            self._unindex(serial_number)
+
+    def pop(self, serial_number: str, *default):
+        with self._lock:
+            if serial_number in self:
+                self._unindex(serial_number)
+            return super().pop(serial_number, *default)
+
+    def popitem(self):
+        with self._lock:
+            serial_number, equipment = super().popitem()
+            self._unindex(serial_number)
+            return serial_number, equipment
+
+    def setdefault(self, serial_number: str, default: Equipment = None) -> Equipment:
+        with self._lock:
+            if serial_number not in self:
+                self[serial_number] = default
+            return self[serial_number]
+
+    def update(self, *args, **kwargs) -> None:
+        with self._lock:
+            for serial_number, equipment in dict(*args, **kwargs).items():
+                self[serial_number] = equipment
+
+    def clear(self) -> None:
+        with self._lock:
+            super().clear()
+            self._indexes = {name: {} for name in INDEXES}
+            self._keys = {}
+
+    def reindex(self, equipment: Equipment, fields: Optional[Iterable[str]] = None) -> None:
+        """Refresh the indexes fed by fields (all of them if None) after equipment changed"""
+        if fields is None:
+            names = INDEXES.keys()
+        else:
+            names = {INDEXED_FIELDS[field] for field in fields if field in INDEXED_FIELDS}
+            if not names:
+                return
+        serial_number = equipment.serial_number
+        with self._lock:
+            keys = self._keys.get(serial_number)
+            if keys is None:
+                return
+            for name in names:
+                new_key = INDEXES[name](equipment)
+                old_key = keys.get(name)
+                if new_key == old_key:
+                    continue
+                self._remove_from(name, old_key, serial_number)
+                self._indexes[name].setdefault(new_key, {})[serial_number] = equipment
+                keys[name] = new_key
+
+    def keys_of(self, index: str) -> List[Any]:
+        """Return the distinct values present in an index"""
+        with self._lock:
+            return list(self._indexes[index])
+
+    def by_type(self, equipment_type: EquipmentType) -> List[Equipment]:
+        return self.query(type=equipment_type)
+
+    def query(self, **criteria) -> List[Equipment]:
+        """Return equipment matching every criterion, e.g. query(type=EquipmentType.THERMOSTAT, connected=False)
+
+        Criteria are index names; a list, tuple or set value matches any of its members.
+        """
+        return list(self.iter_query(**criteria))
+
+    def count(self, **criteria) -> int:
+        return len(self._match(criteria))
+
+    def iter_query(self, **criteria) -> Iterator[Equipment]:
+        with self._lock:
+            matched = self._match(criteria)
+        return iter(matched)
+
+    def _match(self, criteria: Dict[str, Any]) -> List[Equipment]:
+        if not criteria:
+            return list(self.values())
+        with self._lock:
+            candidates = []
+            for name, wanted in criteria.items():
+                index = self._indexes.get(name)
+                if index is None:
+                    raise ValueError(f"Unknown equipment index: {name}")
+                if isinstance(wanted, (list, tuple, set, frozenset)):
+                    merged: Dict[str, Equipment] = {}
+                    for key in wanted:
+                        merged.update(index.get(key, {}))
+                    candidates.append(merged)
+                else:
+                    candidates.append(index.get(wanted, {}))
+            candidates.sort(key=len)
+            smallest, others = candidates[0], candidates[1:]
+            return [
+                equipment
+                for serial_number, equipment in smallest.items()
+                if all(serial_number in other for other in others)
+            ]
+
+    def _index(self, serial_number: str, equipment: Equipment) -> None:
+        keys = {}
+        for name, key_of in INDEXES.items():
+            key = key_of(equipment)
+            self._indexes[name].setdefault(key, {})[serial_number] = equipment
+            keys[name] = key
+        self._keys[serial_number] = keys
+
+    def _unindex(self, serial_number: str) -> None:
+        keys = self._keys.pop(serial_number, None)
+        if keys is None:
+            return
+        for name, key in keys.items():
+            self._remove_from(name, key, serial_number)
+
+    def _remove_from(self, name: str, key, serial_number: str) -> None:
+        bucket = self._indexes[name].get(key)
+        if bucket is not None:
+            bucket.pop(serial_number, None)
+            if not bucket:
+                del self._indexes[name][key]
@@ -0,0 +1,263 @@
+"""Timeouts, retries and circuit breaking for the EcoNet REST calls"""
+import asyncio
+import enum
+import logging
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from pyeconet.errors import CircuitOpenError, GenericHTTPError
+
+_LOGGER = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# HTTP statuses worth retrying, anything else in the 4xx range is our fault
+RETRYABLE_STATUSES = frozenset((408, 425, 429, 500, 502, 503, 504))
+
+
+class RestPolicy:
+    """Settings for RestResilience.
+
+    Args:
+        timeout (float): Total time allowed for one request attempt, in seconds.
+        connect_timeout (float): Time allowed to connect, in seconds.
+        retries (int): Retries after the first attempt of a request.
+        base_delay (float): Delay before the first retry, doubled for each following one, in seconds.
+        max_delay (float): Upper bound for the retry delay, in seconds.
+        budget_ratio (float): Retries allowed per request made, across every endpoint.
+        budget_min_per_second (float): Retries allowed per second regardless of traffic.
+        failure_threshold (int): Consecutive failures that open the circuit of an endpoint.
+        reset_timeout (float): How long an open circuit fails fast before letting one
+            trial request through, in seconds.
+    """
+
+    def __init__(
+            self,
+            timeout: float = 30.0,
+            connect_timeout: float = 10.0,
+            retries: int = 2,
+            base_delay: float = 0.5,
+            max_delay: float = 10.0,
+            budget_ratio: float = 0.2,
+            budget_min_per_second: float = 0.5,
+            failure_threshold: int = 5,
+            reset_timeout: float = 30.0,
+    ) -> None:
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.budget_min_per_second = budget_min_per_second
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    def backoff(self, retry: int) -> float:
+        """Return the delay before retry number retry (0 based), with full jitter"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** min(retry, 32))))
+
+
+def is_retryable(err: BaseException) -> bool:
+    """Return True for failures of the cloud or the network rather than of the request"""
+    if isinstance(err, GenericHTTPError):
+        return bool(err.args) and err.args[0] in RETRYABLE_STATUSES
+    if isinstance(err, asyncio.TimeoutError):
+        return True
+    try:
+        import aiohttp
+    except ImportError:
+        return False
+    return isinstance(err, aiohttp.ClientError)
+
+
+class RetryBudget:
+    """Token bucket limiting retries to a fraction of the requests made.
+
+    Each request deposits budget_ratio tokens, each retry withdraws one, and
+    budget_min_per_second tokens trickle in so a quiet client can still retry.
+    When the cloud fails everything, retries stay a bounded share of the load
+    instead of multiplying it.
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, max_tokens: float = 10.0) -> None:
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Return True and take a token if a retry is allowed"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+@enum.unique
+class CircuitState(enum.Enum):
+    """Define the state of a circuit breaker"""
+
+    CLOSED = 1
+    OPEN = 2
+    HALF_OPEN = 3
+
+
+class CircuitBreaker:
+    """Fail fast on an endpoint after failure_threshold consecutive failures.
+
+    After reset_timeout seconds one trial request is let through; its success
+    closes the circuit again, its failure keeps it open for another period.
+    """
+
+    def __init__(self, endpoint: str, failure_threshold: int, reset_timeout: float) -> None:
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> CircuitState:
+        with self._lock:
+            if (
+                    self._state is CircuitState.OPEN
+                    and time.monotonic() - self._opened_at >= self.reset_timeout
+            ):
+                return CircuitState.HALF_OPEN
+            return self._state
+
+    def before_request(self) -> None:
+        """Raise CircuitOpenError unless a request may be sent now"""
+        with self._lock:
+            if self._state is CircuitState.CLOSED:
+                return
+            if self._state is CircuitState.OPEN:
+                remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    raise CircuitOpenError(self.endpoint, remaining)
+                # Let this one request through as the trial
+                self._state = CircuitState.HALF_OPEN
+                return
+            raise CircuitOpenError(self.endpoint, 0.0)
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state is not CircuitState.CLOSED:
+                _LOGGER.debug("EcoNet %s circuit closed", self.endpoint)
+            self._state = CircuitState.CLOSED
+            self._failures = 0
+
+    def abandon(self) -> None:
+        """Give back the trial slot of a request that ended without an outcome, e.g. cancelled"""
+        with self._lock:
+            if self._state is CircuitState.HALF_OPEN:
+                # _opened_at is past reset_timeout already, the next request is the trial
+                self._state = CircuitState.OPEN
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state is CircuitState.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state is not CircuitState.OPEN:
+                    _LOGGER.warning(
+                        "EcoNet %s failing, rejecting requests for %s seconds",
+                        self.endpoint,
+                        self.reset_timeout,
+                    )
+                self._state = CircuitState.OPEN
+                self._opened_at = time.monotonic()
+
+
+class RestResilience:
+    """Retry budget and per endpoint circuit breakers shared by REST calls.
+
+    Every EcoNetApiInterface uses DEFAULT_REST_RESILIENCE unless given its
+    own, so the retry budget covers all of them.
+    """
+
+    def __init__(self, policy: Optional[RestPolicy] = None) -> None:
+        self.policy = policy or RestPolicy()
+        self.budget = RetryBudget(self.policy.budget_ratio, self.policy.budget_min_per_second)
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.rejected = 0
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = self._breakers[endpoint] = CircuitBreaker(
+                    endpoint, self.policy.failure_threshold, self.policy.reset_timeout
+                )
+            return breaker
+
+    def circuits(self) -> Dict[str, CircuitState]:
+        """Return the circuit state of every endpoint called so far"""
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.endpoint: breaker.state for breaker in breakers}
+
+    async def call(self, endpoint: str, attempt: Callable[[], Awaitable[T]]) -> T:
+        """Await attempt(), retrying retryable failures within the policy and budget"""
+        breaker = self.breaker(endpoint)
+        self.budget.deposit()
+        retry = 0
+        while True:
+            try:
+                breaker.before_request()
+            except CircuitOpenError:
+                self.rejected += 1
+                raise
+            try:
+                result = await attempt()
+            except Exception as err:
+                if not is_retryable(err):
+                    # The cloud answered, the request itself was wrong
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                if retry >= self.policy.retries or not self.budget.withdraw():
+                    raise
+                delay = self.policy.backoff(retry)
+                retry += 1
+                self.retries += 1
+                _LOGGER.debug(
+                    "EcoNet %s failed (%r), retry %s in %.1f seconds", endpoint, err, retry, delay
+                )
+                await asyncio.sleep(delay)
+            except BaseException:
+                # Cancelled, the endpoint didn't fail
+                breaker.abandon()
+                raise
+            else:
+                breaker.record_success()
+                return result
+
+
+# Shared by every EcoNetApiInterface so many pollers can't multiply the load on the cloud
+DEFAULT_REST_RESILIENCE = RestResilience()
@@ -0,0 +1,172 @@
+"""Incremental runtime, cycle and duty cycle tracking from running state transitions"""
+import time
+from array import array
+from typing import Dict, Optional, Tuple
+
+HOUR = 3600
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+
+WINDOWS = {"hour": HOUR, "day": DAY, "week": WEEK}
+
+
+class _Buckets:
+    """Ring of fixed width time buckets holding runtime seconds, cycles and short cycles"""
+
+    __slots__ = ("width", "count", "_epochs", "_runtime", "_cycles", "_short")
+
+    def __init__(self, width: int, count: int) -> None:
+        self.width = width
+        self.count = count
+        self._epochs = array("q", [-1] * count)
+        self._runtime = array("d", bytes(8 * count))
+        self._cycles = array("l", [0] * count)
+        self._short = array("l", [0] * count)
+
+    def _slot(self, epoch: int) -> int:
+        index = epoch % self.count
+        if self._epochs[index] != epoch:
+            self._epochs[index] = epoch
+            self._runtime[index] = 0.0
+            self._cycles[index] = 0
+            self._short[index] = 0
+        return index
+
+    def add_runtime(self, start: float, end: float) -> None:
+        # Anything older than the ring would be overwritten anyway
+        start = max(start, end - self.width * self.count)
+        width = self.width
+        while start < end:
+            epoch = int(start // width)
+            segment_end = min(end, (epoch + 1) * width)
+            self._runtime[self._slot(epoch)] += segment_end - start
+            start = segment_end
+
+    def add_cycle(self, timestamp: float, short: bool) -> None:
+        index = self._slot(int(timestamp // self.width))
+        self._cycles[index] += 1
+        if short:
+            self._short[index] += 1
+
+    def totals(self, now: float, window: float) -> Tuple[float, int, int]:
+        """Return (runtime, cycles, short cycles) recorded in the buckets covering the last window seconds"""
+        last = int(now // self.width)
+        runtime = 0.0
+        cycles = 0
+        short = 0
+        for epoch in range(last - int(window // self.width) + 1, last + 1):
+            index = epoch % self.count
+            if self._epochs[index] == epoch:
+                runtime += self._runtime[index]
+                cycles += self._cycles[index]
+                short += self._short[index]
+        return runtime, cycles, short
+
+
+class RuntimeAccumulator:
+    """Runtime statistics for one equipment, updated in O(1) per running state change.
+
+    Completed runs are spread over minute buckets for the last hour and hour
+    buckets for the last week, so window queries never replay message history.
+
+    Args:
+        short_cycle_seconds (float): Runs shorter than this count as short cycles.
+        short_cycle_limit (int): Short cycles within an hour that flag short cycling.
+    """
+
+    def __init__(self, short_cycle_seconds: float = 300, short_cycle_limit: int = 3) -> None:
+        self.short_cycle_seconds = short_cycle_seconds
+        self.short_cycle_limit = short_cycle_limit
+        self._minutes = _Buckets(60, 60)
+        self._hours = _Buckets(HOUR, 168)
+        self._started_at: Optional[float] = None
+        self._run_started: Optional[float] = None
+        self.total_runtime = 0.0
+        self.total_cycles = 0
+        self.total_short_cycles = 0
+        self.last_cycle_seconds: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._run_started is not None
+
+    def update(self, running: bool, timestamp: Optional[float] = None) -> None:
+        """Feed the current running state, only transitions change anything"""
+        if timestamp is None:
+            timestamp = time.time()
+        if self._started_at is None:
+            self._started_at = timestamp
+        if running:
+            if self._run_started is None:
+                self._run_started = timestamp
+            return
+        if self._run_started is None:
+            return
+        started = self._run_started
+        self._run_started = None
+        duration = max(0.0, timestamp - started)
+        short = duration < self.short_cycle_seconds
+        self._minutes.add_runtime(started, timestamp)
+        self._hours.add_runtime(started, timestamp)
+        self._minutes.add_cycle(timestamp, short)
+        self._hours.add_cycle(timestamp, short)
+        self.total_runtime += duration
+        self.total_cycles += 1
+        self.last_cycle_seconds = duration
+        if short:
+            self.total_short_cycles += 1
+
+    def _totals(self, window: float, now: float) -> Tuple[float, int, int]:
+        buckets = self._minutes if window <= HOUR else self._hours
+        runtime, cycles, short = buckets.totals(now, window)
+        if self._run_started is not None:
+            runtime += now - max(self._run_started, now - window)
+        return runtime, cycles, short
+
+    def runtime(self, window: float = HOUR, now: Optional[float] = None) -> float:
+        """Return the seconds spent running during the last window seconds"""
+        return self._totals(window, now if now is not None else time.time())[0]
+
+    def cycles(self, window: float = HOUR, now: Optional[float] = None) -> int:
+        """Return the number of runs completed during the last window seconds"""
+        return self._totals(window, now if now is not None else time.time())[1]
+
+    def short_cycles(self, window: float = HOUR, now: Optional[float] = None) -> int:
+        return self._totals(window, now if now is not None else time.time())[2]
+
+    def duty_cycle(self, window: float = HOUR, now: Optional[float] = None) -> Optional[float]:
+        """Return the fraction of the last window spent running, or None before any data"""
+        if now is None:
+            now = time.time()
+        if self._started_at is None:
+            return None
+        observed = min(window, now - self._started_at)
+        if observed <= 0:
+            return None
+        return min(1.0, self._totals(window, now)[0] / observed)
+
+    def is_short_cycling(self, now: Optional[float] = None) -> bool:
+        """Return True if the last hour had at least short_cycle_limit short cycles"""
+        return self.short_cycles(HOUR, now) >= self.short_cycle_limit
+
+    def stats(self, now: Optional[float] = None) -> Dict:
+        """Return runtime, cycles, short cycles and duty cycle for the hour, day and week windows"""
+        if now is None:
+            now = time.time()
+        result = {
+            "running": self.running,
+            "total_runtime": self.total_runtime,
+            "total_cycles": self.total_cycles,
+            "total_short_cycles": self.total_short_cycles,
+            "last_cycle_seconds": self.last_cycle_seconds,
+            "short_cycling": self.is_short_cycling(now),
+        }
+        for name, window in WINDOWS.items():
+            runtime, cycles, short = self._totals(window, now)
+            result[name] = {
+                "runtime": runtime,
+                "cycles": cycles,
+                "short_cycles": short,
+                "duty_cycle": self.duty_cycle(window, now),
+            }
+        return result
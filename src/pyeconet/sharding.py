@@ -0,0 +1,97 @@
+"""Spread MQTT message processing across worker threads partitioned by device"""
+import logging
+import queue
+import re
+import threading
+import zlib
+from typing import Callable, List, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+_SERIAL_RE = re.compile(rb'"serial_number"\s*:\s*"([^"]*)"')
+_DEVICE_NAME_RE = re.compile(rb'"device_name"\s*:\s*"([^"]*)"')
+
+_STOP = object()
+
+
+def partition_key(payload) -> bytes:
+    """Return the serial number of a raw MQTT payload without decoding the JSON.
+
+    Messages without a serial number fall back to their device name.
+    """
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    match = _SERIAL_RE.search(payload) or _DEVICE_NAME_RE.search(payload)
+    return match.group(1) if match else b""
+
+
+def shard_key(payload) -> bytes:
+    """Return the device name of a raw MQTT payload, falling back to its serial number.
+
+    Zones of a multi zone HVAC system share one device name, and messages
+    without a serial number update all of them, so they must share a worker.
+    """
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    match = _DEVICE_NAME_RE.search(payload) or _SERIAL_RE.search(payload)
+    return match.group(1) if match else b""
+
+
+class ShardedDispatcher:
+    """Hand MQTT messages to a fixed pool of worker threads.
+
+    All messages for one device name, so for every serial number sharing it,
+    land on the same worker and are handled in arrival order. Per-device
+    ordering is kept and no equipment is written by two workers, while paho's
+    network thread only has to find the device name and enqueue.
+    """
+
+    def __init__(self, handler: Callable, workers: int, max_queued: int = 0) -> None:
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self._handler = handler
+        self._queues: List[queue.Queue] = [queue.Queue(max_queued) for _ in range(workers)]
+        self._threads: List[threading.Thread] = []
+
+    @property
+    def workers(self) -> int:
+        return len(self._queues)
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        for index, work in enumerate(self._queues):
+            thread = threading.Thread(
+                target=self._run, args=(work,), name=f"pyeconet-shard-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the workers once the messages already queued have been handled"""
+        for work in self._queues:
+            work.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def shard_for(self, payload) -> int:
+        return zlib.crc32(shard_key(payload)) % len(self._queues)
+
+    def dispatch(self, msg) -> None:
+        """Queue msg on the worker owning its device name"""
+        self._queues[self.shard_for(msg.payload)].put(msg)
+
+    def pending(self) -> List[int]:
+        """Return the number of queued messages per worker"""
+        return [work.qsize() for work in self._queues]
+
+    def _run(self, work: queue.Queue) -> None:
+        while True:
+            msg = work.get()
+            if msg is _STOP:
+                return
+            try:
+                self._handler(msg)
+            except Exception as err:
+                _LOGGER.exception(err)
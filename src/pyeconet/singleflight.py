@@ -0,0 +1,38 @@
+"""Share one in-flight call between concurrent identical requests"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one.
+
+    The first caller starts the call, callers arriving while it runs await the
+    same result (or exception). Once it finishes the next call starts afresh,
+    nothing is cached. A caller being cancelled doesn't cancel the shared call.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        loop = asyncio.get_running_loop()
+        # Futures belong to one loop, keep calls from different loops apart
+        flight_key = (id(loop), key)
+        future = self._calls.get(flight_key)
+        if future is None:
+            future = asyncio.ensure_future(call())
+            self._calls[flight_key] = future
+            future.add_done_callback(lambda done: self._forget(flight_key, done))
+        return await asyncio.shield(future)
+
+    def _forget(self, flight_key: Tuple[int, Hashable], future: asyncio.Future) -> None:
+        if self._calls.get(flight_key) is future:
+            del self._calls[flight_key]
+        if not future.cancelled():
+            # Mark the exception retrieved, every waiter already got it
+            future.exception()
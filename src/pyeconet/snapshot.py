@@ -0,0 +1,251 @@
+"""Compact binary snapshots of live equipment state"""
+import struct
+import time
+import zlib
+from typing import Dict, List, Tuple
+
+from pyeconet.equipment.thermostat import Thermostat
+from pyeconet.equipment.water_heater import WaterHeater
+from pyeconet.errors import InvalidSnapshotError
+from pyeconet.location import Location
+
+MAGIC = b"PECS"
+SNAPSHOT_VERSION = 1
+
+_FLAG_ZLIB = 0x01
+
+_NONE = 0x00
+_FALSE = 0x01
+_TRUE = 0x02
+_INT = 0x03
+_FLOAT = 0x04
+_STR = 0x05
+_LIST = 0x06
+_DICT = 0x07
+
+_DOUBLE = struct.Struct("<d")
+
+_EQUIPMENT_CLASSES = {
+    "WaterHeater": WaterHeater,
+    "Thermostat": Thermostat,
+}
+
+# WaterHeater attributes that aren't part of _equipment_info
+_WATER_HEATER_EXTRAS = (
+    "_energy_usage",
+    "_historical_energy_usage",
+    "_energy_type",
+    "water_usage",
+)
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+class _Encoder:
+    """Tagged binary encoder storing every distinct string once"""
+
+    def __init__(self) -> None:
+        self.strings: Dict[str, int] = {}
+        self.body = bytearray()
+
+    def encode(self, value) -> None:
+        out = self.body
+        if value is None:
+            out.append(_NONE)
+        elif value is True:
+            out.append(_TRUE)
+        elif value is False:
+            out.append(_FALSE)
+        elif isinstance(value, int):
+            out.append(_INT)
+            # Zigzag so small negative numbers stay small
+            _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+        elif isinstance(value, float):
+            out.append(_FLOAT)
+            out += _DOUBLE.pack(value)
+        elif isinstance(value, str):
+            out.append(_STR)
+            index = self.strings.get(value)
+            if index is None:
+                index = self.strings[value] = len(self.strings)
+            _write_varint(out, index)
+        elif isinstance(value, (list, tuple)):
+            out.append(_LIST)
+            _write_varint(out, len(value))
+            for item in value:
+                self.encode(item)
+        elif isinstance(value, dict):
+            out.append(_DICT)
+            _write_varint(out, len(value))
+            for key, item in value.items():
+                self.encode(key)
+                self.encode(item)
+        else:
+            raise TypeError(f"Can't snapshot value of type {type(value).__name__}")
+
+    def finish(self) -> bytes:
+        out = bytearray()
+        _write_varint(out, len(self.strings))
+        for string in self.strings:
+            raw = string.encode("utf-8")
+            _write_varint(out, len(raw))
+            out += raw
+        return bytes(out + self.body)
+
+
+class _Decoder:
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        count, pos = _read_varint(data, 0)
+        strings: List[str] = []
+        for _ in range(count):
+            length, pos = _read_varint(data, pos)
+            strings.append(data[pos:pos + length].decode("utf-8"))
+            pos += length
+        self.strings = strings
+        self.pos = pos
+
+    def decode(self):
+        data = self.data
+        tag = data[self.pos]
+        self.pos += 1
+        if tag == _STR:
+            index, self.pos = _read_varint(data, self.pos)
+            return self.strings[index]
+        if tag == _DICT:
+            length, self.pos = _read_varint(data, self.pos)
+            result = {}
+            for _ in range(length):
+                key = self.decode()
+                result[key] = self.decode()
+            return result
+        if tag == _INT:
+            value, self.pos = _read_varint(data, self.pos)
+            return value >> 1 if not value & 1 else -(value >> 1) - 1
+        if tag == _NONE:
+            return None
+        if tag == _TRUE:
+            return True
+        if tag == _FALSE:
+            return False
+        if tag == _FLOAT:
+            (value,) = _DOUBLE.unpack_from(data, self.pos)
+            self.pos += _DOUBLE.size
+            return value
+        if tag == _LIST:
+            length, self.pos = _read_varint(data, self.pos)
+            return [self.decode() for _ in range(length)]
+        raise InvalidSnapshotError(f"Unknown tag {tag} at offset {self.pos - 1}")
+
+
+def dumps(value, compress: bool = True) -> bytes:
+    """Encode a JSON-like value into the versioned snapshot format"""
+    encoder = _Encoder()
+    encoder.encode(value)
+    body = encoder.finish()
+    flags = 0
+    if compress:
+        body = zlib.compress(body)
+        flags |= _FLAG_ZLIB
+    return MAGIC + bytes((SNAPSHOT_VERSION, flags)) + body
+
+
+def loads(data: bytes):
+    """Decode a value written by dumps"""
+    if len(data) < 6 or data[:4] != MAGIC:
+        raise InvalidSnapshotError("Not a pyeconet snapshot")
+    version, flags = data[4], data[5]
+    if version != SNAPSHOT_VERSION:
+        raise InvalidSnapshotError(f"Unsupported snapshot version: {version}")
+    body = data[6:]
+    try:
+        if flags & _FLAG_ZLIB:
+            body = zlib.decompress(body)
+        return _Decoder(body).decode()
+    except (IndexError, UnicodeDecodeError, struct.error, zlib.error, RecursionError, TypeError) as err:
+        raise InvalidSnapshotError(f"Corrupt snapshot: {err}") from err
+
+
+def snapshot_equipment(api, compress: bool = True) -> bytes:
+    """Serialize the state of every equipment known to api"""
+    equipment = []
+    for equip in api._equipment.values():
+        extras = {}
+        if isinstance(equip, WaterHeater):
+            extras = {name: getattr(equip, name) for name in _WATER_HEATER_EXTRAS}
+        equipment.append(
+            {
+                "class": type(equip).__name__,
+                "info": equip._equipment_info,
+                "location_id": equip.location_id,
+                "parent_serial_number": equip.parent_serial_number,
+                "extras": extras,
+            }
+        )
+    return dumps(
+        {
+            "account_id": api.account_id,
+            "saved_at": time.time(),
+            "locations": [location._location_info for location in api.locations],
+            "equipment": equipment,
+        },
+        compress,
+    )
+
+
+def restore_equipment(api, data: bytes) -> int:
+    """Rebuild api's equipment from a snapshot, returns the number of equipment restored
+
+    The whole snapshot is decoded and checked before api is changed, an
+    InvalidSnapshotError leaves its equipment and locations as they were.
+    """
+    state = loads(data)
+    if not isinstance(state, dict):
+        raise InvalidSnapshotError("Snapshot doesn't hold an equipment state")
+    if api.account_id is not None and state.get("account_id") not in (None, api.account_id):
+        raise InvalidSnapshotError("Snapshot belongs to a different account")
+    try:
+        locations = {}
+        for location_info in state.get("locations", []):
+            location = Location(location_info)
+            locations[location.location_id] = location
+        restored = {}
+        for entry in state["equipment"]:
+            equipment_class = _EQUIPMENT_CLASSES.get(entry["class"])
+            if equipment_class is None:
+                raise InvalidSnapshotError(f"Unknown equipment class: {entry['class']}")
+            equip = equipment_class(entry["info"], api)
+            equip._location_id = entry.get("location_id")
+            equip._parent_serial_number = entry.get("parent_serial_number")
+            for name, value in entry["extras"].items():
+                if name in _WATER_HEATER_EXTRAS:
+                    setattr(equip, name, value)
+            restored[equip.serial_number] = equip
+    except (KeyError, TypeError, AttributeError, ValueError) as err:
+        raise InvalidSnapshotError(f"Malformed snapshot: {err!r}") from err
+    api._location_map.clear()
+    api._location_map.update(locations)
+    if api._metadata_pool is not None:
+        for equip in api._equipment.values():
+            api._metadata_pool.release_equipment(equip)
+    api._equipment.clear()
+    for equip in restored.values():
+        api._add_equipment(equip)
+    return len(restored)
@@ -0,0 +1,127 @@
+"""Per field versions to keep stale or out of order updates from regressing state"""
+import enum
+import logging
+import re
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+_LOGGER = logging.getLogger(__name__)
+
+# Reported messages carry the device's clock, e.g. WIFI_1.0_2020-05-30T14:17:45.282Z
+_DEVICE_TIME_RE = re.compile(r"^WIFI_[^_]*_(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:\.\d{1,6})?)Z$")
+
+
+@enum.unique
+class UpdateSource(enum.Enum):
+    """Define where an update came from"""
+
+    REPORTED = 1
+    DESIRED = 2
+    REST = 3
+
+
+DEFAULT_SOURCE_RANKS: Dict[UpdateSource, int] = {
+    UpdateSource.REPORTED: 2,
+    UpdateSource.DESIRED: 1,
+    UpdateSource.REST: 0,
+}
+
+
+def device_time(transaction_id) -> Optional[float]:
+    """Return the device timestamp of a reported transactionId in epoch seconds, None if it has none"""
+    if not isinstance(transaction_id, str):
+        return None
+    match = _DEVICE_TIME_RE.match(transaction_id)
+    if match is None:
+        return None
+    text = match.group(1)
+    try:
+        stamp = datetime.strptime(text, "%Y-%m-%dT%H:%M:%S.%f" if "." in text else "%Y-%m-%dT%H:%M:%S")
+    except ValueError:
+        return None
+    return stamp.replace(tzinfo=timezone.utc).timestamp()
+
+
+class StalenessPolicy:
+    """Decide whether a write to a field is newer than what the field holds.
+
+    Every applied field remembers the time its value was observed and its
+    source. MQTT messages are observed when paho received them, REST
+    snapshots when their request was sent: the response can't be newer than
+    that, so MQTT updates received while it was in flight win over it.
+
+    A write older than the stored version is rejected. Within tie_window
+    seconds of it, the source rank decides: by default reported state beats
+    desired echoes, which beat REST snapshots.
+
+    Reported messages carry the device's own millisecond timestamp in their
+    transactionId. A reported write to a field last written by a reported
+    message is ordered by those timestamps instead, so messages sent within
+    tie_window of each other, or delivered out of order, apply in the order
+    the device sent them. The device clock is only compared with itself,
+    never with ours.
+
+    Args:
+        tie_window (float): Seconds within which two writes are ranked by source, not time.
+        source_ranks (dict): Rank of each UpdateSource, higher wins ties.
+    """
+
+    def __init__(
+            self, tie_window: float = 1.0, source_ranks: Optional[Dict[UpdateSource, int]] = None
+    ) -> None:
+        self.tie_window = tie_window
+        self.source_ranks = dict(DEFAULT_SOURCE_RANKS if source_ranks is None else source_ranks)
+        self.rejected = 0
+
+    def accepts(
+            self,
+            stored: Optional[Tuple[float, int]],
+            observed: float,
+            rank: int,
+            device_time: Optional[float] = None,
+            stored_device_time: Optional[float] = None,
+    ) -> bool:
+        if stored is None:
+            return True
+        if device_time is not None and stored_device_time is not None:
+            return device_time >= stored_device_time
+        stored_at, stored_rank = stored
+        if observed > stored_at + self.tie_window:
+            return True
+        if observed < stored_at - self.tie_window:
+            return False
+        if rank != stored_rank:
+            return rank > stored_rank
+        return observed >= stored_at
+
+
+class FieldVersions:
+    """Version (observed time, source rank) of each field of one equipment"""
+
+    __slots__ = ("_policy", "_versions", "_device_times")
+
+    def __init__(self, policy: StalenessPolicy) -> None:
+        self._policy = policy
+        self._versions: Dict[str, Tuple[float, int]] = {}
+        # Device timestamp of fields last written by a reported message carrying one
+        self._device_times: Dict[str, float] = {}
+
+    def accept(
+            self, field: str, source: UpdateSource, observed: float, device_time: Optional[float] = None
+    ) -> bool:
+        """Return True and record the write if it isn't stale, called under the equipment write lock"""
+        rank = self._policy.source_ranks.get(source, 0)
+        if not self._policy.accepts(
+                self._versions.get(field), observed, rank, device_time, self._device_times.get(field)
+        ):
+            self._policy.rejected += 1
+            return False
+        self._versions[field] = (observed, rank)
+        if device_time is not None:
+            self._device_times[field] = device_time
+        else:
+            self._device_times.pop(field, None)
+        return True
+
+    def version(self, field: str) -> Optional[Tuple[float, int]]:
+        return self._versions.get(field)
@@ -0,0 +1,84 @@
+"""Shared fixtures built from the example responses"""
+import copy
+import json
+import pathlib
+import time
+
+import pytest
+
+from pyeconet.api import EcoNetApiInterface
+from pyeconet.equipment.thermostat import Thermostat
+from pyeconet.equipment.water_heater import WaterHeater
+
+EXAMPLES = pathlib.Path(__file__).parent.parent / "src" / "pyeconet" / "example_responses"
+
+
+def load_example(name: str) -> dict:
+    with open(EXAMPLES / name, encoding="utf-8") as example:
+        return json.load(example)
+
+
+def locations_response(name: str = "get_locations_water_heater.json") -> dict:
+    return load_example(name)
+
+
+class Message:
+    """Stand-in for a paho MQTTMessage"""
+
+    def __init__(self, payload: dict, reported: bool = True, timestamp: float = None) -> None:
+        kind = "reported" if reported else "desired"
+        self.topic = f"user/account/device/{kind}"
+        self.payload = json.dumps(payload).encode("utf-8")
+        self.timestamp = time.monotonic() if timestamp is None else timestamp
+
+
+class FakeClient:
+    """Stand-in for a connected paho Client, records what is published"""
+
+    class Info:
+        def __init__(self, mid: int) -> None:
+            self.rc = 0
+            self.mid = mid
+
+    def __init__(self) -> None:
+        self.published = []
+
+    def publish(self, topic: str, payload: str, qos: int = 0):
+        self.published.append(json.loads(payload))
+        return self.Info(len(self.published))
+
+
+def make_api() -> EcoNetApiInterface:
+    return EcoNetApiInterface("user@example.com", "password", account_id="account", user_token="token")
+
+
+def add_equipment(api: EcoNetApiInterface, name: str = "get_locations_water_heater.json"):
+    """Load the equipment of an example getUserDataForApp response into api, returns them"""
+    location = copy.deepcopy(locations_response(name)["results"]["locations"][0])
+    api._update_location(location)
+    added = []
+    for info in location["equiptments"]:
+        info, __ = api.check_mode_enum(info)
+        equipment_class = WaterHeater if info.get("device_type") == "WH" else Thermostat
+        equipment = equipment_class(info, api)
+        equipment._location_id = location.get("location_id")
+        api._add_equipment(equipment)
+        added.append(equipment)
+    return added
+
+
+@pytest.fixture
+def api():
+    return make_api()
+
+
+@pytest.fixture
+def water_heater(api):
+    return add_equipment(api)[0]
+
+
+def update(equipment, **fields) -> dict:
+    """Return an MQTT payload for equipment setting fields, @ prefixed"""
+    payload = {"device_name": equipment.device_id, "serial_number": equipment.serial_number}
+    payload.update({f"@{name}": value for name, value in fields.items()})
+    return payload
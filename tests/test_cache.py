@@ -0,0 +1,80 @@
+import asyncio
+import math
+import time
+from datetime import datetime, timedelta
+
+from pyeconet.cache import ResponseCache, is_past_range
+
+USAGE = {"ACTION": "waterheaterUsageReportView", "device_name": "device", "serial_number": "serial"}
+
+
+def test_fresh_responses_are_served_and_expire():
+    cache = ResponseCache(ttls={"waterheaterUsageReportView": 0.01})
+    cache.put("key", USAGE, {"energy": 1})
+    assert cache.get("key") == {"energy": 1}
+    time.sleep(0.02)
+    assert cache.get("key") is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["hit_ratio"] == 0.5
+
+
+def test_actions_without_a_ttl_are_not_cached():
+    cache = ResponseCache()
+    cache.put("key", {"ACTION": "somethingElse"}, {})
+    assert len(cache) == 0
+
+
+def test_past_ranges_never_expire():
+    yesterday = (datetime.now() - timedelta(days=1)).isoformat()
+    tomorrow = (datetime.now() + timedelta(days=1)).isoformat()
+    assert is_past_range({"end_date": yesterday})
+    assert not is_past_range({"end_date": tomorrow})
+    assert not is_past_range({"end_date": "not a date"})
+    assert ResponseCache().ttl_for({**USAGE, "end_date": yesterday}) == math.inf
+    assert ResponseCache().ttl_for({**USAGE, "end_date": tomorrow}) == 300.0
+
+
+def test_least_recently_used_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", USAGE, {"a": 1})
+    cache.put("b", USAGE, {"b": 1})
+    cache.get("a")
+    cache.put("c", USAGE, {"c": 1})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"a": 1}
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_one_equipment():
+    cache = ResponseCache()
+    cache.put('{"serial_number":"one"}', USAGE, {})
+    cache.put('{"serial_number":"two"}', USAGE, {})
+    cache.invalidate("one")
+    assert len(cache) == 1
+    cache.invalidate()
+    assert len(cache) == 0
+
+
+def test_dynamic_actions_are_fetched_once(api):
+    calls = []
+
+    async def fetch(payload):
+        calls.append(payload)
+        return {"energy": len(calls)}
+
+    api._get_dynamic_action = fetch
+    payload = {"ACTION": "waterheaterUsageReportView", "serial_number": "serial", "device_name": "device"}
+
+    async def run():
+        first = await api.get_dynamic_action(payload)
+        # Same payload in another key order
+        second = await api.get_dynamic_action(dict(reversed(list(payload.items()))))
+        return first, second
+
+    assert asyncio.run(run()) == ({"energy": 1}, {"energy": 1})
+    assert len(calls) == 1
+    assert api.response_cache.stats()["hits"] == 1
+
+    api.set_response_cache(None)
+    asyncio.run(api.get_dynamic_action(payload))
+    assert len(calls) == 2
@@ -0,0 +1,50 @@
+import threading
+
+from conftest import Message, update
+
+
+def test_snapshot_keeps_the_state_it_was_taken_from(api, water_heater):
+    snapshot = water_heater.snapshot()
+    assert water_heater.snapshot() is snapshot
+
+    api._process_message(Message(update(water_heater, SETPOINT=120)))
+    assert snapshot.set_point == 132
+    assert water_heater.set_point == 120
+    assert water_heater.snapshot() is not snapshot
+    assert water_heater.snapshot().set_point == 120
+
+
+def test_snapshots_cannot_be_updated(water_heater):
+    snapshot = water_heater.snapshot()
+    assert not snapshot.update_equipment_info(update(water_heater, SETPOINT=120))
+    assert snapshot.set_point == 132
+
+
+def test_updates_never_mutate_published_state(water_heater):
+    before = water_heater._equipment_info
+    setpoint = before["@SETPOINT"]
+    water_heater.update_equipment_info(update(water_heater, SETPOINT=120))
+    assert before["@SETPOINT"] is setpoint
+    assert setpoint["value"] == 132
+    # Limits and value of a field are always read from the same state
+    assert water_heater._equipment_info["@SETPOINT"]["constraints"] is setpoint["constraints"]
+
+
+def test_readers_see_whole_updates(water_heater):
+    stop = threading.Event()
+    torn = []
+
+    def read():
+        while not stop.is_set():
+            snapshot = water_heater.snapshot()
+            values = (snapshot.set_point, snapshot.alert_count)
+            if values[1] and values[0] != values[1]:
+                torn.append(values)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    for value in range(110, 141):
+        water_heater.update_equipment_info(update(water_heater, SETPOINT=value, ALERTCOUNT=value))
+    stop.set()
+    reader.join()
+    assert torn == []
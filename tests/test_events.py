@@ -0,0 +1,102 @@
+import asyncio
+import threading
+
+from conftest import Message, update
+from pyeconet import api as api_module
+from pyeconet.events import CommandAckEvent, EventStream, OverflowPolicy, StateChangeEvent
+
+
+def _state(serial_number, *fields):
+    return StateChangeEvent(serial_number, "device", fields, 0.0)
+
+
+def test_state_changes_and_command_acks_are_streamed(api, water_heater):
+    async def run():
+        stream = api.events()
+        command = api.publish({"@SETPOINT": 125}, water_heater.device_id, water_heater.serial_number)
+        echo = update(water_heater, SETPOINT=125)
+        echo["transactionId"] = command.transaction_id
+        api._process_message(Message(echo, reported=False))
+        # Reported state carries the device's own transaction id
+        reported = update(water_heater, SETPOINT=125)
+        reported["transactionId"] = "WIFI_1.0_2020-05-30T14:17:45.282Z"
+        api._process_message(Message(reported))
+        events = [await stream.__anext__(), await stream.__anext__()]
+        stream.close()
+        return events, stream, command
+
+    events, stream, command = asyncio.run(run())
+    assert {type(event) for event in events} == {CommandAckEvent, StateChangeEvent}
+    assert [event.transaction_id for event in events if isinstance(event, CommandAckEvent)] == [
+        command.transaction_id
+    ]
+    assert all(event.serial_number == water_heater.serial_number for event in events)
+    assert stream not in api._event_streams
+    assert not api._pending_transactions
+
+
+def test_transaction_ids_are_unique_and_expire(api, water_heater, monkeypatch):
+    async def run():
+        stream = api.events()
+        commands = [
+            api.publish(payload, water_heater.device_id, water_heater.serial_number)
+            for payload in ({"@SETPOINT": 120}, {"@AWAY": True})
+        ]
+        pending = dict(api._pending_transactions)
+        monkeypatch.setattr(api_module, "_TRANSACTION_TIMEOUT", -1.0)
+        api._process_message(Message(update(water_heater, SIGNAL=-50)))
+        stream.close()
+        return commands, pending
+
+    commands, pending = asyncio.run(run())
+    assert commands[0].transaction_id != commands[1].transaction_id
+    assert set(pending) == {command.transaction_id for command in commands}
+    assert not api._pending_transactions
+
+
+def test_filters_by_type_and_serial_number():
+    async def run():
+        stream = EventStream(asyncio.get_running_loop(), event_types=[StateChangeEvent], serial_numbers=["a"])
+        stream.offer(_state("b", "@SETPOINT"))
+        stream.offer(CommandAckEvent("a", "device", "transaction", (), 0.0))
+        stream.offer(_state("a", "@SETPOINT"))
+        return list(stream._queue.values())
+
+    assert asyncio.run(run()) == [_state("a", "@SETPOINT")]
+
+
+def test_drop_oldest_keeps_the_newest_events():
+    async def run():
+        stream = EventStream(asyncio.get_running_loop(), maxsize=2)
+        for serial_number in "abc":
+            stream.offer(_state(serial_number, "@SETPOINT"))
+        stream.close()
+        return [event.serial_number async for event in stream], stream.dropped
+
+    assert asyncio.run(run()) == (["b", "c"], 1)
+
+
+def test_coalesce_merges_state_changes_per_device():
+    async def run():
+        stream = EventStream(asyncio.get_running_loop(), maxsize=10, policy=OverflowPolicy.COALESCE)
+        stream.offer(_state("a", "@SETPOINT"))
+        stream.offer(_state("b", "@MODE"))
+        stream.offer(_state("a", "@MODE", "@SETPOINT"))
+        stream.close()
+        return [(event.serial_number, event.fields) async for event in stream]
+
+    assert asyncio.run(run()) == [("a", ("@SETPOINT", "@MODE")), ("b", ("@MODE",))]
+
+
+def test_block_makes_producer_threads_wait_for_the_consumer():
+    async def run():
+        stream = EventStream(asyncio.get_running_loop(), maxsize=1, policy=OverflowPolicy.BLOCK)
+        producer = threading.Thread(target=lambda: [stream.offer(_state(s, "@RUNNING")) for s in "abc"])
+        producer.start()
+        received = []
+        while len(received) < 3:
+            received.append((await stream.__anext__()).serial_number)
+        await asyncio.get_running_loop().run_in_executor(None, producer.join)
+        return received, stream.dropped
+
+    assert asyncio.run(run()) == (["a", "b", "c"], 0)
@@ -0,0 +1,67 @@
+import asyncio
+import copy
+
+from conftest import Message, load_example, update
+from pyeconet.equipment.water_heater import WaterHeater
+from pyeconet.fanout import FanoutStatus
+
+
+def water_heaters(api, count):
+    template = load_example("get_locations_water_heater.json")["results"]["locations"][0]["equiptments"][0]
+    added = []
+    for index in range(count):
+        info = copy.deepcopy(template)
+        info["serial_number"] = f"heater-{index}"
+        equipment = WaterHeater(info, api)
+        api._add_equipment(equipment)
+        added.append(equipment)
+    return added
+
+
+def run_fanout(api, targets, reports, **kwargs):
+    """Fan out a 120 set point, reports(equipment) returns the messages each publish is answered with"""
+
+    async def run():
+        loop = asyncio.get_running_loop()
+
+        def command(equipment):
+            equipment.set_set_point(120)
+            for message in reports(equipment):
+                loop.call_later(0.001, api._process_message, message)
+
+        kwargs.setdefault("window", 0.01)
+        kwargs.setdefault("confirm_timeout", 0.05)
+        return await api.fan_out(command, lambda equipment: equipment.set_point == 120, **kwargs)
+
+    return asyncio.run(run())
+
+
+def test_confirms_on_reported_state(api):
+    targets = water_heaters(api, 3)
+    report = run_fanout(api, targets, lambda equipment: [Message(update(equipment, SETPOINT=120))])
+    assert report.count(FanoutStatus.CONFIRMED) == 3
+    assert report.summary()["publishes"] == 3
+    assert report.progress == 1.0
+
+
+def test_equipment_already_in_state_is_skipped(api):
+    first, second = water_heaters(api, 2)
+    first.update_equipment_info(update(first, SETPOINT=120))
+    report = run_fanout(api, [first, second], lambda equipment: [Message(update(equipment, SETPOINT=120))])
+    assert report.statuses == {"heater-0": FanoutStatus.ALREADY_SET, "heater-1": FanoutStatus.CONFIRMED}
+    assert report.attempts["heater-0"] == 0
+
+
+def test_echoes_and_unrelated_reports_do_not_confirm(api):
+    targets = water_heaters(api, 1)
+
+    def reports(equipment):
+        return [
+            Message(update(equipment, SETPOINT=120), reported=False),
+            Message(update(equipment, SIGNAL=-50)),
+        ]
+
+    report = run_fanout(api, targets, reports, retries=1, retry_window=0.01)
+    assert report.statuses == {"heater-0": FanoutStatus.UNCONFIRMED}
+    assert report.attempts["heater-0"] == 2
+    assert report.failed == ["heater-0"]
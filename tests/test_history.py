@@ -0,0 +1,41 @@
+import pytest
+
+from conftest import Message, add_equipment, update
+from pyeconet.history import EquipmentHistory, FieldHistory
+
+
+def test_ring_buffer_keeps_the_newest_entries_in_order():
+    history = FieldHistory(depth=3)
+    for timestamp in range(5):
+        history.append(float(timestamp), timestamp * 10)
+    assert len(history) == 3
+    assert history.items() == [(2.0, 20), (3.0, 30), (4.0, 40)]
+    assert history.items(since=3.0) == [(3.0, 30), (4.0, 40)]
+    assert history.latest() == (4.0, 40)
+
+
+def test_depth_must_be_positive():
+    with pytest.raises(ValueError):
+        FieldHistory(depth=0)
+
+
+def test_records_values_of_tracked_fields_only_when_they_change():
+    history = EquipmentHistory(["@SETPOINT"], depth=8)
+    history.record({"@SETPOINT": {"value": 120}, "@SIGNAL": -40}, ["@SETPOINT", "@SIGNAL"], 1.0)
+    history.record({"@SETPOINT": {"value": 120}}, ["@SETPOINT"], 2.0)
+    history.record({"@SETPOINT": {"value": 125}}, ["@SETPOINT"], 3.0)
+    assert history.items("@SETPOINT") == [(1.0, 120), (3.0, 125)]
+    assert history.items("@SIGNAL") == []
+    assert history.value_at("@SETPOINT", 2.5) == 120
+    assert history.value_at("@SETPOINT", 0.5) is None
+
+
+def test_equipment_history_follows_mqtt_updates(api):
+    api.enable_history(fields=["@SETPOINT"], depth=4)
+    water_heater = add_equipment(api)[0]
+    start = water_heater.set_point
+    api._process_message(Message(update(water_heater, SETPOINT={"value": start + 1})))
+    api._process_message(Message(update(water_heater, SETPOINT={"value": start + 2})))
+    assert water_heater.history.values("@SETPOINT") == [start, start + 1, start + 2]
+    api.disable_history()
+    assert water_heater.history is None
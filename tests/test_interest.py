@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+from conftest import Message, add_equipment, locations_response, update
+from pyeconet.interest import FieldInterest, InterestPolicy
+
+
+def test_watched_fields_per_equipment_and_global():
+    interest = FieldInterest()
+    assert interest.fields_for("serial") is None
+    interest.watch(["@SETPOINT"], "serial")
+    interest.watch(["@CONNECTED"])
+    assert interest.fields_for("serial") == {"@SETPOINT", "@CONNECTED"}
+    assert interest.fields_for("other") == {"@CONNECTED"}
+    interest.unwatch(serial_number="serial")
+    interest.unwatch(["@CONNECTED"])
+    assert interest.fields_for("serial") is None
+
+
+def test_drop_skips_unwatched_payloads_without_decoding():
+    interest = FieldInterest(InterestPolicy.DROP)
+    interest.watch(["@SETPOINT"], "serial")
+    payload = json.dumps({"serial_number": "serial", "@SIGNAL": -50}).encode("utf-8")
+    assert not interest.wants_payload(payload)
+    assert interest.wants_payload(json.dumps({"serial_number": "serial", "@SETPOINT": 120}))
+    assert interest.wants_payload(json.dumps({"serial_number": "other", "@SIGNAL": -50}))
+    assert interest.wants_payload(json.dumps({"serial_number": "serial", "dialog": {}}))
+    assert FieldInterest(InterestPolicy.STORE).wants_payload(payload)
+
+
+def test_drop_only_lets_echoes_of_pending_commands_through():
+    interest = FieldInterest(InterestPolicy.DROP)
+    interest.watch(["@SETPOINT"], "serial")
+    echo = json.dumps({"transactionId": "ANDROID_1", "serial_number": "serial", "@AWAY": True})
+    reported = json.dumps({"transactionId": "WIFI_1.0_2020-05-30T14:17:45.282Z", "serial_number": "serial", "@SIGNAL": -50})
+    assert interest.wants_payload(echo, {"ANDROID_1"})
+    assert not interest.wants_payload(echo, {"ANDROID_2"})
+    assert not interest.wants_payload(reported, {"ANDROID_1"})
+
+
+def test_store_applies_unwatched_fields_without_callbacks(api, water_heater):
+    callbacks = []
+    updates = []
+    water_heater.set_update_callback(lambda: callbacks.append(None))
+    api.add_update_listener(lambda equipment, fields: updates.append(fields))
+    water_heater.watch_fields(["@SETPOINT"])
+
+    api._process_message(Message(update(water_heater, SIGNAL=-50)))
+    assert water_heater.wifi_signal == -50
+    assert callbacks == [] and updates == []
+
+    api._process_message(Message(update(water_heater, SIGNAL=-40, SETPOINT=120)))
+    assert len(callbacks) == 1
+    assert updates == [["@SETPOINT"]]
+
+
+def test_drop_leaves_unwatched_fields_alone(api, water_heater):
+    api.watch_fields(["@SETPOINT"], water_heater.serial_number, InterestPolicy.DROP)
+    signal = water_heater.wifi_signal
+    api._process_message(Message(update(water_heater, SIGNAL=-50)))
+    assert water_heater.wifi_signal == signal
+
+
+def test_refresh_only_calls_back_for_watched_fields(api, water_heater):
+    callbacks = []
+    water_heater.set_update_callback(lambda: callbacks.append(None))
+    water_heater.watch_fields(["@SETPOINT"])
+    response = locations_response()
+
+    async def get_location():
+        return response["results"]["locations"]
+
+    api._get_location = get_location
+    equipment = response["results"]["locations"][0]["equiptments"][0]
+    equipment["@SIGNAL"] = -50
+    asyncio.run(api.refresh_equipment())
+    assert water_heater.wifi_signal == -50
+    assert callbacks == []
+
+    equipment["@SETPOINT"] = dict(equipment["@SETPOINT"], value=120)
+    asyncio.run(api.refresh_equipment())
+    assert len(callbacks) == 1
+
+
+def test_unwatched_updates_are_still_normalized(api):
+    thermostat = add_equipment(api, "get_locations_hvac.json")[0]
+    thermostat.watch_fields(["@SETPOINT"])
+    api._process_message(Message(update(thermostat, MODE={"status": "Emergency Heat", "value": 0})))
+    assert thermostat._equipment_info["@MODE"]["value"] == 5
+
+
+def test_drop_keeps_dropping_while_commands_await_acks(api, water_heater):
+    api.watch_fields(["@SETPOINT"], water_heater.serial_number, InterestPolicy.DROP)
+    signal = water_heater.wifi_signal
+
+    async def run():
+        stream = api.events()
+        api.publish({"@AWAY": True}, water_heater.device_id, water_heater.serial_number)
+        reported = update(water_heater, SIGNAL=-50)
+        reported["transactionId"] = "WIFI_1.0_2020-05-30T14:17:45.282Z"
+        api._process_message(Message(reported))
+        stream.close()
+
+    asyncio.run(run())
+    assert water_heater.wifi_signal == signal
@@ -0,0 +1,82 @@
+import copy
+import gc
+
+from conftest import Message, load_example, make_api, update
+from pyeconet.equipment.thermostat import Thermostat
+from pyeconet.interning import MetadataPool
+
+
+def thermostat(api, serial_number):
+    info = copy.deepcopy(load_example("get_locations_hvac.json")["results"]["locations"][0]["equiptments"][0])
+    info["serial_number"] = serial_number
+    equipment = Thermostat(api.check_mode_enum(info)[0], api)
+    api._add_equipment(equipment)
+    return equipment
+
+
+def test_identical_models_share_one_constraints_block():
+    api = make_api()
+    pool = MetadataPool()
+    api.set_metadata_pool(pool)
+    first = thermostat(api, "first")
+    alone = pool.stats()
+    second = thermostat(api, "second")
+    assert first._equipment_info["@MODE"]["constraints"] is second._equipment_info["@MODE"]["constraints"]
+    assert pool.stats() == {"blocks": alone["blocks"], "references": 2 * alone["references"]}
+
+    pool.release_equipment(first)
+    pool.release_equipment(second)
+    assert pool.stats() == {"blocks": 0, "references": 0}
+
+
+def test_new_constraints_are_copied_not_written_through():
+    api = make_api()
+    pool = MetadataPool()
+    api.set_metadata_pool(pool)
+    first, second = thermostat(api, "first"), thermostat(api, "second")
+    shared = second._equipment_info["@MODE"]["constraints"]
+    enum_text = list(shared["enumText"])
+    new_mode = {"status": "Off", "value": 0, "constraints": {"enumText": ["Off"], "lowerLimit": 0, "upperLimit": 0}}
+    api._process_message(Message(update(first, MODE=new_mode)))
+
+    assert first._equipment_info["@MODE"]["constraints"]["enumText"] == ["Off"]
+    assert second._equipment_info["@MODE"]["constraints"] is shared
+    assert shared["enumText"] == enum_text
+    assert first.modes != second.modes
+
+
+def test_without_a_pool_every_equipment_keeps_its_own_copy():
+    api = make_api()
+    api.set_metadata_pool(None)
+    first, second = thermostat(api, "first"), thermostat(api, "second")
+    assert first._equipment_info["@MODE"]["constraints"] is not second._equipment_info["@MODE"]["constraints"]
+
+
+def test_interfaces_sharing_a_pool_hold_their_own_references():
+    pool = MetadataPool()
+    first_api, second_api = make_api(), make_api()
+    first_api.set_metadata_pool(pool)
+    second_api.set_metadata_pool(pool)
+    first = thermostat(first_api, "same")
+    alone = pool.stats()
+    thermostat(second_api, "same")
+    assert pool.stats()["references"] == 2 * alone["references"]
+
+    pool.release_equipment(first)
+    assert pool.stats() == alone
+
+
+def test_discarded_equipment_releases_its_references():
+    pool = MetadataPool()
+    api = make_api()
+    api.set_metadata_pool(pool)
+    thermostat(api, "first")
+    alone = pool.stats()
+    thermostat(api, "second")
+    api._equipment.pop("second")
+    gc.collect()
+    assert pool.stats() == alone
+
+    del api
+    gc.collect()
+    assert pool.stats() == {"blocks": 0, "references": 0}
@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+
+
+def _loaded_after(statement: str) -> set:
+    """Return which transport modules are imported after statement, in a fresh interpreter"""
+    script = f"import sys; {statement}; print(' '.join(m for m in ('aiohttp', 'paho', 'ssl') if m in sys.modules))"
+    output = subprocess.check_output([sys.executable, "-c", script], env=dict(os.environ, PYTHONPATH=SRC))
+    return set(output.decode().split())
+
+
+def test_package_import_skips_transports():
+    assert not _loaded_after("import pyeconet") & {"aiohttp", "paho"}
+
+
+def test_equipment_import_skips_transports():
+    assert not _loaded_after("from pyeconet.equipment.water_heater import WaterHeater") & {"aiohttp", "paho"}
+
+
+def test_api_is_resolved_on_first_use():
+    assert "paho" not in _loaded_after("from pyeconet import EcoNetApiInterface")
+
+
+def test_ssl_context_is_created_once():
+    from pyeconet.api import _get_ssl_context
+
+    _get_ssl_context.cache_clear()
+    assert _get_ssl_context() is _get_ssl_context()
+    assert _get_ssl_context.cache_info().misses == 1
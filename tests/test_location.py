@@ -0,0 +1,30 @@
+from conftest import Message, update
+
+
+def test_location_is_built_from_the_response(api, water_heater):
+    location = api.get_location(water_heater.location_id)
+    assert location.name == "Home"
+    assert location.status == "I'm Home"
+    assert list(location.equipment) == [water_heater.serial_number]
+    assert api.locations == [location]
+
+
+def test_aggregates_follow_mqtt_updates(api, water_heater):
+    location = api.get_location(water_heater.location_id)
+    assert (location.running_count, location.disconnected_count, location.alert_count) == (1, 0, 0)
+
+    api._process_message(Message(update(water_heater, RUNNING="", CONNECTED=False, ALERTCOUNT=2)))
+    assert (location.running_count, location.disconnected_count, location.alert_count) == (0, 1, 1)
+
+    api._process_message(Message(update(water_heater, AWAY=True)))
+    assert location.away_count == 1
+    assert location.all_away
+    assert location.summary()["away_equipment"] == 1
+
+
+def test_removed_equipment_no_longer_counts(api, water_heater):
+    location = api.get_location(water_heater.location_id)
+    location.remove_equipment(water_heater.serial_number)
+    assert location.summary()["equipment"] == 0
+    assert location.running_count == 0
+    assert not location.all_away
@@ -0,0 +1,45 @@
+import pytest
+
+from conftest import Message, update
+from pyeconet.metrics import Counter, EcoNetMetrics, Histogram
+
+
+def test_counter_and_histogram_values():
+    counter = Counter("requests", "Requests.", ["endpoint"])
+    counter.inc("auth")
+    counter.inc("auth", amount=2)
+    assert counter.collect() == {("auth",): 3}
+
+    histogram = Histogram("latency", "Latency.", buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    value = histogram.collect()[()]
+    assert value["count"] == 2
+    assert value["sum"] == pytest.approx(0.55)
+
+
+def test_mqtt_messages_are_counted_per_serial_number(api, water_heater):
+    metrics = api.enable_metrics()
+    api._process_message(Message(update(water_heater, SETPOINT={"value": 125})))
+    api._process_message(Message({"device_name": "unknown", "serial_number": "unknown"}))
+    snapshot = metrics.snapshot()
+    assert snapshot["econet_mqtt_messages"]["values"][(water_heater.serial_number,)] == 1
+    assert snapshot["econet_equipment"]["values"][()] == 1
+
+
+def test_parse_errors_and_publishes_are_counted(api, water_heater):
+    metrics = api.enable_metrics()
+    broken = Message({})
+    broken.payload = b"{not json"
+    api._process_message(broken)
+    water_heater.set_set_point(water_heater.set_point + 1)
+    assert metrics.mqtt_errors.collect()[()] == 1
+    assert metrics.mqtt_publishes.collect()[()] == 1
+
+
+def test_openmetrics_exposition_ends_with_eof():
+    metrics = EcoNetMetrics()
+    metrics.mqtt_connected.set(1)
+    text = metrics.to_openmetrics()
+    assert "econet_mqtt_connected 1" in text
+    assert text.endswith("# EOF\n")
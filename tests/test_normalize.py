@@ -0,0 +1,31 @@
+from conftest import Message, add_equipment, update
+from pyeconet.normalize import NormalizationPipeline
+
+ENUM_TEXT = ["Heating", "Cooling", "Auto", "Fan Only", "Off", "Emergency Heat"]
+
+
+def mode(status, value):
+    return {"status": status, "value": value, "constraints": {"enumText": ENUM_TEXT}}
+
+
+def test_value_follows_the_status_text():
+    compiled = NormalizationPipeline().compile({"@MODE": mode("Heating", 0)})
+    assert compiled.apply({"@MODE": {"status": "Emergency Heat", "value": 2}})["@MODE"]["value"] == 5
+    # Friedrich style spellings
+    assert compiled.apply({"@MODE": {"status": "cool", "value": 0}})["@MODE"]["value"] == 1
+    # Unknown statuses are left alone
+    assert compiled.apply({"@MODE": {"status": "Dry", "value": 3}})["@MODE"]["value"] == 3
+
+
+def test_models_with_identical_constraints_share_one_compiled_normalizer():
+    pipeline = NormalizationPipeline()
+    first = pipeline.compile({"@MODE": mode("Heating", 0)})
+    assert pipeline.compile({"@MODE": mode("Auto", 2)}) is first
+    assert pipeline.compile({"@MODE": {"status": "Off", "value": 0, "constraints": {"enumText": ["Off"]}}}) is not first
+    assert pipeline.compile({"@SETPOINT": 70}).fields == ()
+
+
+def test_incoming_updates_are_normalized(api):
+    thermostat = add_equipment(api, "get_locations_hvac.json")[0]
+    api._process_message(Message(update(thermostat, MODE={"status": "Emergency Heat", "value": 0})))
+    assert thermostat._equipment_info["@MODE"]["value"] == 5
@@ -0,0 +1,67 @@
+import time
+
+from conftest import FakeClient, Message, update
+from pyeconet.optimistic import OptimisticState
+from pyeconet.outbox import CommandOutbox
+
+
+def enable(api, timeout=30.0):
+    changes = []
+    api.enable_optimistic_updates(timeout, changes.append)
+    return changes
+
+
+def states(changes):
+    return [(change.field, change.state, change.reason) for change in changes]
+
+
+def test_command_is_applied_until_reported(api, water_heater):
+    changes = enable(api)
+    water_heater.set_set_point(120)
+    assert water_heater.set_point == 120
+    assert api.optimistic.pending(water_heater.serial_number) == {"@SETPOINT": 120}
+
+    # The equipment hasn't acted yet
+    api._process_message(Message(update(water_heater, SETPOINT=132)))
+    assert water_heater.set_point == 120
+
+    api._process_message(Message(update(water_heater, SETPOINT=120)))
+    assert not api.optimistic.is_pending(water_heater.serial_number)
+    assert states(changes) == [
+        ("@SETPOINT", OptimisticState.PENDING, None),
+        ("@SETPOINT", OptimisticState.CONFIRMED, None),
+    ]
+
+
+def test_another_value_wins(api, water_heater):
+    changes = enable(api)
+    water_heater.set_set_point(120)
+    api._process_message(Message(update(water_heater, SETPOINT=125)))
+    assert water_heater.set_point == 125
+    assert states(changes)[-1] == ("@SETPOINT", OptimisticState.ROLLED_BACK, "conflict")
+
+
+def test_timeout_starts_once_delivered(api, water_heater):
+    changes = enable(api, timeout=0.01)
+    water_heater.set_set_point(120)
+    time.sleep(0.02)
+    api.optimistic.expire()
+    # Still queued, nothing was sent yet
+    assert water_heater.set_point == 120
+
+    client = FakeClient()
+    api.outbox.connection_up(client, "user/account/device/desired")
+    api.outbox.published(1)
+    time.sleep(0.05)
+    assert water_heater.set_point == 132
+    assert states(changes)[-1] == ("@SETPOINT", OptimisticState.ROLLED_BACK, "timeout")
+
+
+def test_dropped_command_is_rolled_back(api, water_heater):
+    api.set_command_outbox(CommandOutbox(max_queued=1))
+    changes = enable(api)
+    water_heater.set_set_point(120)
+    api.publish({"@AWAY": True}, water_heater.device_id, water_heater.serial_number)
+    assert water_heater.set_point == 132
+    assert water_heater.away
+    assert ("@SETPOINT", OptimisticState.ROLLED_BACK, "undelivered") in states(changes)
@@ -0,0 +1,128 @@
+import os
+import time
+
+from conftest import FakeClient
+from pyeconet.outbox import CommandOutbox, DeliveryStatus
+
+TOPIC = "user/account/device/desired"
+
+
+def enqueue(outbox, fields, serial_number="serial"):
+    return outbox.enqueue(serial_number, "device", fields, "transaction")
+
+
+def test_queued_commands_are_compacted():
+    outbox = CommandOutbox()
+    first = enqueue(outbox, {"@SETPOINT": 120, "@AWAY": True})
+    second = enqueue(outbox, {"@SETPOINT": 125})
+    third = enqueue(outbox, {"@AWAY": False})
+    other = enqueue(outbox, {"@SETPOINT": 110}, "other")
+    assert first.status is DeliveryStatus.SUPERSEDED
+    assert [command.id for command in outbox.pending()] == [second.id, third.id, other.id]
+
+
+def test_sends_in_order_within_the_in_flight_window():
+    statuses = []
+    outbox = CommandOutbox(max_in_flight=2, status_callback=lambda command: statuses.append(command.status))
+    commands = [enqueue(outbox, {"@SETPOINT": 110}, f"serial-{index}") for index in range(3)]
+    client = FakeClient()
+    outbox.connection_up(client, TOPIC)
+    assert [message["serial_number"] for message in client.published] == ["serial-0", "serial-1"]
+    assert commands[2].status is DeliveryStatus.QUEUED
+
+    outbox.published(commands[0].mid)
+    assert commands[0].status is DeliveryStatus.DELIVERED
+    assert len(client.published) == 3
+    assert DeliveryStatus.DELIVERED in statuses
+
+
+def test_offline_commands_wait_for_a_connection():
+    outbox = CommandOutbox()
+    command = enqueue(outbox, {"@SETPOINT": 110})
+    assert command.status is DeliveryStatus.QUEUED
+    client = FakeClient()
+    outbox.connection_up(client, TOPIC)
+    assert client.published[0]["@SETPOINT"] == 110
+
+
+def test_old_commands_expire_instead_of_being_sent():
+    outbox = CommandOutbox(max_age=0.01)
+    command = enqueue(outbox, {"@SETPOINT": 110})
+    time.sleep(0.02)
+    client = FakeClient()
+    outbox.connection_up(client, TOPIC)
+    assert command.status is DeliveryStatus.EXPIRED
+    assert client.published == []
+
+
+def test_unacknowledged_commands_are_sent_again():
+    outbox = CommandOutbox(ack_timeout=0.01)
+    client = FakeClient()
+    outbox.connection_up(client, TOPIC)
+    command = enqueue(outbox, {"@SETPOINT": 110})
+    outbox.connection_down()
+    time.sleep(0.02)
+    outbox.connection_up(client, TOPIC)
+    assert len(client.published) == 2
+    assert command.status is DeliveryStatus.IN_FLIGHT
+    outbox.published(command.mid)
+    assert command.status is DeliveryStatus.DELIVERED
+
+
+def test_requeue_on_a_new_session():
+    outbox = CommandOutbox()
+    client = FakeClient()
+    outbox.connection_up(client, TOPIC)
+    command = enqueue(outbox, {"@SETPOINT": 110})
+    outbox.connection_down(requeue=True)
+    assert command.status is DeliveryStatus.QUEUED
+    outbox.connection_up(client, TOPIC)
+    assert len(client.published) == 2
+
+
+def test_journal_survives_a_restart(tmp_path):
+    path = str(tmp_path / "outbox.journal")
+    outbox = CommandOutbox(journal_path=path)
+    delivered = enqueue(outbox, {"@AWAY": True}, "one")
+    enqueue(outbox, {"@SETPOINT": 110}, "two")
+    client = FakeClient()
+    outbox.connection_up(client, TOPIC)
+    outbox.published(delivered.mid)
+    outbox.connection_down()
+    outbox.close()
+    # A crash mid write leaves a partial last line
+    with open(path, "a", encoding="utf-8") as journal:
+        journal.write('{"op":"add","id":')
+
+    restarted = CommandOutbox(journal_path=path)
+    assert [(command.serial_number, command.fields) for command in restarted.pending()] == [
+        ("two", {"@SETPOINT": 110})
+    ]
+    restarted.close()
+
+
+def test_journal_is_synced_in_the_background(tmp_path, monkeypatch):
+    syncs = []
+    fsync = os.fsync
+
+    def slow_fsync(fd):
+        syncs.append(fd)
+        time.sleep(0.01)
+        fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", slow_fsync)
+    path = str(tmp_path / "outbox.journal")
+    outbox = CommandOutbox(journal_path=path)
+    syncs.clear()
+    for index in range(100):
+        enqueue(outbox, {"@SETPOINT": 110}, f"serial-{index}")
+    deadline = time.monotonic() + 2
+    written = 0
+    while time.monotonic() < deadline and (written < 100 or not syncs):
+        time.sleep(0.01)
+        with open(path, encoding="utf-8") as journal:
+            written = len(journal.readlines())
+    # On disk without closing the outbox, with far fewer fsyncs than records
+    assert written == 100
+    assert 0 < len(syncs) < 100
+    outbox.close()
@@ -0,0 +1,79 @@
+import asyncio
+
+from pyeconet.polling import PollingPolicy, RestPoller
+from pyeconet.reconnect import ConnectionState
+
+
+class FakeApi:
+    def __init__(self, changes):
+        self._changes = list(changes)
+        self.calls = 0
+
+    async def refresh_equipment(self):
+        self.calls += 1
+        change = self._changes.pop(0) if self._changes else 0
+        if isinstance(change, Exception):
+            raise change
+        return change
+
+
+def test_interval_adapts_to_changes():
+    policy = PollingPolicy(min_interval=10, max_interval=100)
+    assert policy.next_interval(40, 3) == 20
+    assert policy.next_interval(40, 0) == 60
+    assert policy.next_interval(40, None) == 80
+    assert policy.next_interval(15, 1) == 10
+    assert policy.next_interval(90, None) == 100
+
+
+def test_polls_while_mqtt_is_down_and_stops_once_it_is_back():
+    policy = PollingPolicy(grace_period=0, initial_interval=0.01, min_interval=0.01, max_interval=0.01)
+
+    async def run():
+        api = FakeApi([1, RuntimeError("down"), 0])
+        poller = RestPoller(api, policy, asyncio.get_running_loop())
+        poller.connection_changed(ConnectionState.RECONNECTING)
+        await asyncio.sleep(0.1)
+        assert poller.active
+        assert api.calls >= 3
+        poller.connection_changed(ConnectionState.CONNECTED)
+        await asyncio.sleep(0.01)
+        assert not poller.active
+        calls = api.calls
+        await asyncio.sleep(0.05)
+        assert api.calls == calls
+
+    asyncio.run(run())
+
+
+def test_grace_period_delays_polling():
+    async def run():
+        api = FakeApi([])
+        poller = RestPoller(api, PollingPolicy(grace_period=10), asyncio.get_running_loop())
+        poller.connection_changed(ConnectionState.RECONNECTING)
+        await asyncio.sleep(0.05)
+        assert api.calls == 0
+        poller.stop()
+        await asyncio.sleep(0)
+        assert not poller.active
+
+    asyncio.run(run())
+
+
+def test_a_command_shortens_the_interval():
+    policy = PollingPolicy(grace_period=0, initial_interval=600, command_interval=0.01)
+
+    async def run():
+        api = FakeApi([])
+        poller = RestPoller(api, policy, asyncio.get_running_loop())
+        poller.connection_changed(ConnectionState.RECONNECTING)
+        await asyncio.sleep(0.02)
+        assert api.calls == 1
+        poller.command_sent()
+        assert poller.interval == 0.01
+        await asyncio.sleep(0.05)
+        assert api.calls > 1
+        poller.stop()
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
@@ -0,0 +1,61 @@
+import queue
+
+import pytest
+
+from pyeconet.pool import CMD_PUBLISH, MSG_ERROR, MSG_READY, MSG_STATE, MSG_UPDATE, AccountPool
+
+
+def _pool_with_messages(messages):
+    """Run the parent side of a pool over messages as if two workers had sent them"""
+    pool = AccountPool(processes=2)
+    pool.add_account("one@example.com", "password")
+    pool.add_account("two@example.com", "password")
+    pool._worker_of_account = {"one@example.com": 0, "two@example.com": 1}
+    pool._commands = [queue.Queue(), queue.Queue()]
+    pool._pending = 2
+    pool._updates = queue.Queue()
+    for message in messages:
+        pool._updates.put(message)
+    pool._updates.put(None)
+    pool._pump()
+    return pool
+
+
+def test_state_and_updates_build_a_read_only_merged_view():
+    updates = []
+    pool = _pool_with_messages([])
+    pool.set_update_callback(lambda serial, fields: updates.append((serial, fields)))
+    for message in [
+        (MSG_STATE, "two@example.com", "serial", {"@SETPOINT": 120}),
+        (MSG_UPDATE, "serial", {"@SETPOINT": 125}),
+        (MSG_UPDATE, "unknown", {"@SETPOINT": 1}),
+        None,
+    ]:
+        pool._updates.put(message)
+    pool._pump()
+    assert pool.equipment["serial"]["@SETPOINT"] == 125
+    assert pool.account_of("serial") == "two@example.com"
+    assert updates == [("serial", {"@SETPOINT": 125})]
+    with pytest.raises(TypeError):
+        pool.equipment["serial"]["@SETPOINT"] = 1
+
+
+def test_commands_go_to_the_worker_owning_the_device():
+    pool = _pool_with_messages([(MSG_STATE, "two@example.com", "serial", {})])
+    pool.publish("serial", {"@SETPOINT": 125})
+    pool.publish("unknown", {"@SETPOINT": 125})
+    assert pool._commands[0].empty()
+    assert pool._commands[1].get_nowait() == (CMD_PUBLISH, "serial", {"@SETPOINT": 125})
+
+
+def test_ready_once_every_account_loaded_or_failed():
+    pool = _pool_with_messages([(MSG_READY, "one@example.com"), (MSG_ERROR, "two@example.com", "bad password")])
+    assert pool.wait_ready(timeout=0)
+    assert pool.errors == {"two@example.com": "bad password"}
+
+
+def test_accounts_cannot_be_added_once_started():
+    pool = AccountPool(processes=1)
+    pool._procs = [object()]
+    with pytest.raises(RuntimeError):
+        pool.add_account("late@example.com", "password")
@@ -0,0 +1,72 @@
+import asyncio
+
+from pyeconet.reconnect import ConnectionState, ReconnectPolicy, ReconnectSupervisor
+
+
+class FakeClient:
+    def __init__(self):
+        self.delays = []
+
+    def reconnect_delay_set(self, min_delay, max_delay):
+        self.delays.append((min_delay, max_delay))
+
+
+class FakeApi:
+    def __init__(self):
+        self.states = []
+        self.refreshes = 0
+
+    def _set_connection_state(self, state):
+        self.states.append(state)
+
+    async def refresh_equipment(self):
+        self.refreshes += 1
+
+
+def test_backoff_grows_with_equal_jitter_up_to_max_delay():
+    policy = ReconnectPolicy(base_delay=1.0, max_delay=8.0)
+    for attempt, ceiling in [(0, 1.0), (1, 2.0), (2, 4.0), (3, 8.0), (10, 8.0)]:
+        for _ in range(20):
+            assert ceiling / 2 <= policy.backoff(attempt) <= ceiling
+
+
+def test_failed_attempts_back_off_and_reset_on_connect():
+    api, client = FakeApi(), FakeClient()
+    supervisor = ReconnectSupervisor(api, ReconnectPolicy(base_delay=1.0, max_delay=100.0))
+    supervisor.start(client)
+    supervisor.on_connect_fail(client)
+    supervisor.on_connect_fail(client)
+    assert supervisor.attempts == 2
+    assert 2.0 <= client.delays[-1][0] <= 4.0
+    supervisor.on_connect(client, 0)
+    assert supervisor.attempts == 0
+    assert api.states == [
+        ConnectionState.CONNECTING, ConnectionState.RECONNECTING,
+        ConnectionState.RECONNECTING, ConnectionState.CONNECTED,
+    ]
+
+
+def test_unexpected_disconnect_reconnects_and_resyncs():
+    async def run():
+        api, client = FakeApi(), FakeClient()
+        policy = ReconnectPolicy(resync_min_interval=0.05, resync_max_delay=0)
+        supervisor = ReconnectSupervisor(api, policy, asyncio.get_running_loop())
+        supervisor.start(client)
+        supervisor.on_connect(client, 0)
+        refreshes = []
+        for _ in range(3):
+            supervisor.on_disconnect(client, 7)
+            supervisor.on_connect(client, 0)
+            await asyncio.sleep(0.01)
+            refreshes.append(api.refreshes)
+        # The reconnects within resync_min_interval share one postponed resync
+        await asyncio.sleep(0.06)
+        refreshes.append(api.refreshes)
+        supervisor.stop()
+        return api, refreshes
+
+    api, refreshes = asyncio.run(run())
+    # The first connection isn't a gap
+    assert refreshes == [1, 1, 1, 2]
+    assert ConnectionState.RECONNECTING in api.states
+    assert api.states[-1] is ConnectionState.DISCONNECTED
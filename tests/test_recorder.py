@@ -0,0 +1,61 @@
+import asyncio
+
+from conftest import locations_response, make_api
+from pyeconet.recorder import RECORD_MQTT, EcoNetRecorder, EcoNetReplay, read_capture
+
+
+def _record(path, flush_interval=5.0):
+    locations = locations_response()
+    equipment = locations["results"]["locations"][0]["equiptments"][0]
+    recorder = EcoNetRecorder(str(path), flush_interval=flush_interval)
+    recorder.record_locations(locations)
+    recorder.record_mqtt(
+        "user/account/device/reported",
+        f'{{"device_name": "{equipment["device_name"]}", "serial_number": "{equipment["serial_number"]}", '
+        f'"@SETPOINT": {{"value": 125}}}}'.encode("utf-8"),
+    )
+    recorder.close()
+    return equipment["serial_number"]
+
+
+def test_replay_rebuilds_equipment_and_applies_messages(tmp_path):
+    path = tmp_path / "capture.jsonl.gz"
+    serial_number = _record(path)
+    replay = EcoNetReplay(str(path), speed=None)
+    api = make_api()
+    assert asyncio.run(replay.run(api)) == 2
+    assert api._equipment[serial_number].set_point == 125
+
+
+def test_capture_records_are_readable(tmp_path):
+    path = tmp_path / "capture.jsonl"
+    _record(path)
+    kinds = [kind for _, kind, _, _ in read_capture(str(path))]
+    assert kinds[-1] == RECORD_MQTT
+
+
+def test_records_are_flushed_on_interval_and_close(tmp_path):
+    path = tmp_path / "capture.jsonl"
+    recorder = EcoNetRecorder(str(path), flush_interval=3600)
+    recorder.record_mqtt("user/account/device/reported", b"{}")
+    assert path.read_text() == ""
+    recorder.close()
+    assert len(path.read_text().splitlines()) == 2
+
+    recorder = EcoNetRecorder(str(path), flush_interval=0)
+    recorder.record_mqtt("user/account/device/reported", b"{}")
+    assert len(path.read_text().splitlines()) == 4
+    recorder.close()
+
+
+def test_dynamic_action_responses_are_served_in_order(tmp_path):
+    path = tmp_path / "capture.jsonl"
+    recorder = EcoNetRecorder(str(path))
+    payload = {"ACTION": "waterheaterUsageReportView", "device_name": "1"}
+    recorder.record_dynamic_action(payload, {"success": True, "n": 1})
+    recorder.record_dynamic_action(payload, {"success": True, "n": 2})
+    recorder.close()
+    replay = EcoNetReplay(str(path), speed=None)
+    assert replay.dynamic_action_response(payload)["n"] == 1
+    assert replay.dynamic_action_response(payload)["n"] == 2
+    assert replay.dynamic_action_response(payload)["n"] == 2
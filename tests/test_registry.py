@@ -0,0 +1,45 @@
+import pytest
+
+from conftest import Message, add_equipment, locations_response, update
+from pyeconet.equipment import EquipmentType
+from pyeconet.equipment.thermostat import Thermostat
+
+
+@pytest.fixture
+def fleet(api):
+    water_heater = add_equipment(api)[0]
+    # The examples share a serial number
+    info = locations_response("get_locations_hvac.json")["results"]["locations"][0]["equiptments"][0]
+    info["serial_number"] = "thermostat"
+    thermostat = Thermostat(api.check_mode_enum(info)[0], api)
+    thermostat._location_id = water_heater.location_id
+    api._add_equipment(thermostat)
+    return api, water_heater, thermostat
+
+
+def test_query_by_type_and_several_attributes(fleet):
+    api, water_heater, thermostat = fleet
+    registry = api.registry
+    assert registry.by_type(EquipmentType.WATER_HEATER) == [water_heater]
+    assert registry.query(type=EquipmentType.THERMOSTAT, connected=thermostat.connected) == [thermostat]
+    assert set(registry.query(type=[EquipmentType.WATER_HEATER, EquipmentType.THERMOSTAT])) == {
+        water_heater, thermostat
+    }
+    assert registry.count() == 2
+    with pytest.raises(ValueError):
+        registry.query(color="red")
+
+
+def test_indexes_follow_updates(fleet):
+    api, water_heater, _ = fleet
+    connected = water_heater.connected
+    api._process_message(Message(update(water_heater, CONNECTED=not connected)))
+    assert water_heater in api.registry.query(connected=not connected)
+    assert water_heater not in api.registry.query(connected=connected)
+
+
+def test_removed_equipment_leaves_the_indexes(fleet):
+    api, water_heater, _ = fleet
+    del api.registry[water_heater.serial_number]
+    assert api.registry.by_type(EquipmentType.WATER_HEATER) == []
+    assert EquipmentType.WATER_HEATER not in api.registry.keys_of("type")
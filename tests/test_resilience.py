@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from conftest import make_api
+from pyeconet.errors import CircuitOpenError, GenericHTTPError
+from pyeconet.resilience import (
+    DEFAULT_REST_RESILIENCE,
+    CircuitBreaker,
+    CircuitState,
+    RestPolicy,
+    RestResilience,
+    RetryBudget,
+    is_retryable,
+)
+
+
+def failing(status):
+    async def attempt():
+        raise GenericHTTPError(status)
+
+    return attempt
+
+
+def test_only_cloud_and_network_failures_are_retried():
+    assert is_retryable(GenericHTTPError(503))
+    assert is_retryable(asyncio.TimeoutError())
+    assert not is_retryable(GenericHTTPError(400))
+    assert not is_retryable(CircuitOpenError("getUserDataForApp", 10.0))
+
+
+def test_retries_until_success():
+    resilience = RestResilience(RestPolicy(retries=2, base_delay=0))
+    results = [GenericHTTPError(503), GenericHTTPError(502), "ok"]
+
+    async def attempt():
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    assert asyncio.run(resilience.call("endpoint", attempt)) == "ok"
+    assert resilience.retries == 2
+
+
+def test_client_errors_are_not_retried():
+    resilience = RestResilience(RestPolicy(base_delay=0))
+    with pytest.raises(GenericHTTPError):
+        asyncio.run(resilience.call("endpoint", failing(400)))
+    assert resilience.retries == 0
+    assert resilience.circuits() == {"endpoint": CircuitState.CLOSED}
+
+
+def test_retry_budget_runs_out():
+    budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=2)
+    assert budget.withdraw()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+def test_circuit_opens_fails_fast_and_recovers():
+    resilience = RestResilience(RestPolicy(retries=0, failure_threshold=2, reset_timeout=0.05))
+    for __ in range(2):
+        with pytest.raises(GenericHTTPError):
+            asyncio.run(resilience.call("endpoint", failing(503)))
+    with pytest.raises(CircuitOpenError) as raised:
+        asyncio.run(resilience.call("endpoint", failing(503)))
+    endpoint, seconds = raised.value.args
+    assert endpoint == "endpoint" and 0 < seconds <= 0.05
+    assert resilience.rejected == 1
+
+    async def succeed():
+        return "ok"
+
+    asyncio.run(asyncio.sleep(0.06))
+    assert resilience.circuits()["endpoint"] is CircuitState.HALF_OPEN
+    assert asyncio.run(resilience.call("endpoint", succeed)) == "ok"
+    assert resilience.circuits()["endpoint"] is CircuitState.CLOSED
+
+
+def test_half_open_allows_a_single_trial():
+    breaker = CircuitBreaker("endpoint", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    breaker.before_request()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state is CircuitState.HALF_OPEN
+
+
+def test_cancelled_trial_gives_the_slot_back():
+    resilience = RestResilience(RestPolicy(retries=0, failure_threshold=1, reset_timeout=0))
+    with pytest.raises(GenericHTTPError):
+        asyncio.run(resilience.call("endpoint", failing(503)))
+
+    async def cancelled():
+        task = asyncio.ensure_future(resilience.call("endpoint", lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        async def succeed():
+            return "ok"
+
+        return await resilience.call("endpoint", succeed)
+
+    assert asyncio.run(cancelled()) == "ok"
+
+
+def test_interfaces_share_one_retry_budget_by_default(api):
+    other = make_api()
+    assert api.rest_resilience is other.rest_resilience is DEFAULT_REST_RESILIENCE
+    private = RestResilience()
+    other.set_rest_resilience(private)
+    assert other.rest_resilience is private
+    assert api.rest_resilience is DEFAULT_REST_RESILIENCE
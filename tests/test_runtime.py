@@ -0,0 +1,61 @@
+import copy
+
+import pytest
+
+from conftest import Message, locations_response, update
+from pyeconet.equipment.water_heater import WaterHeater
+from pyeconet.runtime import HOUR, RuntimeAccumulator
+
+
+def test_runs_accumulate_runtime_cycles_and_duty_cycle():
+    runtime = RuntimeAccumulator(short_cycle_seconds=300)
+    runtime.update(False, 0.0)
+    runtime.update(True, 600.0)
+    runtime.update(False, 1200.0)
+    runtime.update(True, 1500.0)
+    runtime.update(False, 1600.0)
+    assert runtime.total_runtime == 700.0
+    assert runtime.total_cycles == 2
+    assert runtime.total_short_cycles == 1
+    assert runtime.last_cycle_seconds == 100.0
+    assert runtime.runtime(HOUR, now=1800.0) == pytest.approx(700.0)
+    assert runtime.duty_cycle(HOUR, now=1800.0) == pytest.approx(700.0 / 1800.0)
+
+
+def test_current_run_counts_towards_the_window():
+    runtime = RuntimeAccumulator()
+    runtime.update(True, 0.0)
+    assert runtime.running
+    assert runtime.runtime(HOUR, now=120.0) == pytest.approx(120.0)
+    assert runtime.cycles(HOUR, now=120.0) == 0
+
+
+def test_short_cycling_is_flagged():
+    runtime = RuntimeAccumulator(short_cycle_seconds=300, short_cycle_limit=3)
+    for start in range(0, 1800, 600):
+        runtime.update(True, float(start))
+        runtime.update(False, float(start + 60))
+    assert runtime.is_short_cycling(now=1800.0)
+    assert not runtime.is_short_cycling(now=1800.0 + 2 * HOUR)
+
+
+def test_running_state_is_tracked_from_mqtt(api, water_heater):
+    api.enable_runtime_tracking()
+    api._process_message(Message(update(water_heater, RUNNING="Running")))
+    assert water_heater.runtime.running
+    api._process_message(Message(update(water_heater, RUNNING="")))
+    assert not water_heater.runtime.running
+    assert water_heater.runtime.total_cycles == 1
+
+
+def test_missing_running_field_is_not_running(api):
+    location = copy.deepcopy(locations_response()["results"]["locations"][0])
+    info = location["equiptments"][0]
+    info.pop("@RUNNING", None)
+    api._update_location(location)
+    api.enable_runtime_tracking()
+    water_heater = WaterHeater(info, api)
+    water_heater._location_id = location["location_id"]
+    api._add_equipment(water_heater)
+    assert not water_heater.runtime.running
+    assert api.get_location(location["location_id"]).running_count == 0
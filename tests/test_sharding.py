@@ -0,0 +1,55 @@
+import json
+import threading
+
+import pytest
+
+from conftest import Message
+from pyeconet.sharding import ShardedDispatcher, partition_key, shard_key
+
+
+def _message(**payload):
+    return Message(payload)
+
+
+def test_partition_key_prefers_serial_number_and_shard_key_device_name():
+    payload = json.dumps({"device_name": "dev", "serial_number": "serial"}).encode()
+    assert partition_key(payload) == b"serial"
+    assert shard_key(payload) == b"dev"
+    assert shard_key(b'{"serial_number": "serial"}') == b"serial"
+    assert shard_key(b"{}") == b""
+
+
+def test_zones_and_device_wide_messages_share_a_worker():
+    dispatcher = ShardedDispatcher(lambda msg: None, 8)
+    zone = _message(device_name="hvac", serial_number="zone-1")
+    other_zone = _message(device_name="hvac", serial_number="zone-2")
+    signal = _message(device_name="hvac", **{"@SIGNAL": -40})
+    shards = {dispatcher.shard_for(msg.payload) for msg in (zone, other_zone, signal)}
+    assert len(shards) == 1
+
+
+def test_messages_of_one_device_are_handled_in_order_on_one_thread():
+    handled = {}
+    lock = threading.Lock()
+
+    def handler(msg):
+        payload = json.loads(msg.payload)
+        with lock:
+            handled.setdefault(payload["device_name"], []).append(
+                (payload["sequence"], threading.current_thread().name)
+            )
+
+    dispatcher = ShardedDispatcher(handler, 4)
+    dispatcher.start()
+    for sequence in range(200):
+        dispatcher.dispatch(_message(device_name=f"device-{sequence % 10}", sequence=sequence))
+    dispatcher.stop()
+    assert sum(len(values) for values in handled.values()) == 200
+    for values in handled.values():
+        assert [sequence for sequence, _ in values] == sorted(sequence for sequence, _ in values)
+        assert len({thread for _, thread in values}) == 1
+
+
+def test_workers_must_be_positive():
+    with pytest.raises(ValueError):
+        ShardedDispatcher(lambda msg: None, 0)
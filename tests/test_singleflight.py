@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from pyeconet.singleflight import SingleFlight
+
+
+def counted(result=None, error=None):
+    calls = []
+
+    async def call():
+        calls.append(None)
+        await asyncio.sleep(0.01)
+        if error is not None:
+            raise error
+        return result
+
+    return call, calls
+
+
+def test_concurrent_calls_share_one_flight():
+    flights = SingleFlight()
+    call, calls = counted("equipment")
+
+    async def run():
+        results = await asyncio.gather(*(flights.do("equipment", call) for __ in range(5)))
+        assert len(flights) == 0
+        return results
+
+    assert asyncio.run(run()) == ["equipment"] * 5
+    assert len(calls) == 1
+
+
+def test_results_are_not_cached_and_keys_are_separate():
+    flights = SingleFlight()
+    call, calls = counted("equipment")
+
+    async def run():
+        await asyncio.gather(flights.do("a", call), flights.do("b", call))
+        await flights.do("a", call)
+
+    asyncio.run(run())
+    assert len(calls) == 3
+
+
+def test_every_waiter_gets_the_exception():
+    flights = SingleFlight()
+    call, calls = counted(error=RuntimeError("cloud down"))
+
+    async def run():
+        return await asyncio.gather(*(flights.do("key", call) for __ in range(3)), return_exceptions=True)
+
+    errors = asyncio.run(run())
+    assert [str(error) for error in errors] == ["cloud down"] * 3
+    assert len(calls) == 1
+
+
+def test_cancelled_waiter_does_not_cancel_the_flight():
+    flights = SingleFlight()
+    call, calls = counted("equipment")
+
+    async def run():
+        first = asyncio.ensure_future(flights.do("key", call))
+        second = asyncio.ensure_future(flights.do("key", call))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == "equipment"
+    assert len(calls) == 1
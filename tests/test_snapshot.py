@@ -0,0 +1,63 @@
+import pytest
+
+from conftest import make_api
+from pyeconet import snapshot
+from pyeconet.errors import InvalidSnapshotError
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_values_round_trip(compress):
+    value = {"a": [1, -2, 3.5, None, True, False, "text", {"nested": ["text"]}], "big": 2 ** 40}
+    assert snapshot.loads(snapshot.dumps(value, compress)) == value
+
+
+def test_equipment_and_locations_round_trip(api, water_heater):
+    water_heater.update_equipment_info({"device_name": water_heater.device_id, "@SETPOINT": {"value": 125}})
+    data = api.save_snapshot()
+
+    restored = make_api()
+    assert restored.restore_snapshot(data) == 1
+    equipment = restored._equipment[water_heater.serial_number]
+    assert equipment.set_point == 125
+    assert equipment._equipment_info == water_heater._equipment_info
+    assert [location.location_id for location in restored.locations] == [
+        location.location_id for location in api.locations
+    ]
+    assert list(restored.get_location(water_heater.location_id).equipment) == [water_heater.serial_number]
+
+
+def test_snapshot_of_another_account_is_refused(api, water_heater):
+    data = api.save_snapshot()
+    other = make_api()
+    other._account_id = "other"
+    with pytest.raises(InvalidSnapshotError):
+        other.restore_snapshot(data)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"",
+        b"PECS",
+        b"JUNK\x01\x00",
+        snapshot.MAGIC + bytes((99, 0)),
+        snapshot.dumps([1, 2]),
+        snapshot.dumps({"equipment": [{"class": "Nope", "info": {}, "extras": {}}]}),
+        snapshot.dumps({"equipment": [{"info": {}}]}),
+        snapshot.dumps({"equipment": 5}),
+        snapshot.dumps({"locations": [1], "equipment": []}),
+        snapshot.MAGIC + bytes((snapshot.SNAPSHOT_VERSION, 0)) + b"\x00\x07\x05",
+    ],
+)
+def test_invalid_snapshots_leave_state_untouched(api, water_heater, data):
+    with pytest.raises(InvalidSnapshotError):
+        api.restore_snapshot(data)
+    assert list(api._equipment) == [water_heater.serial_number]
+    assert len(api.locations) == 1
+
+
+def test_truncated_snapshot_is_invalid(api, water_heater):
+    data = api.save_snapshot(compress=False)
+    for length in (len(data) // 2, len(data) - 1):
+        with pytest.raises(InvalidSnapshotError):
+            snapshot.loads(data[:length])
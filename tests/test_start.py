@@ -0,0 +1,63 @@
+import asyncio
+import logging
+
+from conftest import FakeClient, Message, locations_response
+
+
+class Cloud:
+    """Serves getUserDataForApp, delivering messages over MQTT while the request is in flight"""
+
+    def __init__(self, api, messages=()) -> None:
+        self.api = api
+        self.messages = list(messages)
+        self.requests = 0
+        self.connects = 0
+        api._get_location = self.get_location
+        api._connect = self.connect
+
+    def connect(self, *args) -> None:
+        self.connects += 1
+        self.api._mqtt_client = FakeClient()
+
+    async def get_location(self):
+        self.requests += 1
+        for message in self.messages:
+            self.api._on_message(self.api._mqtt_client, None, message)
+        self.messages = []
+        await asyncio.sleep(0)
+        return locations_response()["results"]["locations"]
+
+
+def device_name():
+    return locations_response()["results"]["locations"][0]["equiptments"][0]["device_name"]
+
+
+def message(value):
+    return Message({"device_name": device_name(), "serial_number": "Q032012345", "@SETPOINT": value})
+
+
+def test_messages_received_while_loading_are_applied_in_order(api):
+    cloud = Cloud(api, [message(120), message(125)])
+    asyncio.run(api.start())
+    (water_heater,) = api._equipment.values()
+    assert water_heater.set_point == 125
+    assert cloud.requests == 1 and cloud.connects == 1
+    assert api._early_messages is None
+
+
+def test_overflow_refreshes_the_equipment(api, caplog):
+    cloud = Cloud(api, [message(value) for value in (115, 120, 125)])
+    with caplog.at_level(logging.WARNING):
+        asyncio.run(api.start(max_early_messages=2))
+    assert cloud.requests == 2
+    assert "Dropped 1 MQTT messages" in caplog.text
+
+
+def test_starting_again_refreshes_instead_of_replacing(api):
+    cloud = Cloud(api)
+    asyncio.run(api.start())
+    (water_heater,) = api._equipment.values()
+    asyncio.run(api.start())
+    assert list(api._equipment.values()) == [water_heater]
+    assert cloud.connects == 1
+    assert cloud.requests == 2
@@ -0,0 +1,76 @@
+from conftest import Message, update
+from pyeconet.versioning import FieldVersions, StalenessPolicy, UpdateSource, device_time
+
+
+def test_policy_orders_by_time_then_source():
+    policy = StalenessPolicy(tie_window=1.0)
+    stored = (100.0, 1)
+    assert policy.accepts(None, 0.0, 0)
+    assert policy.accepts(stored, 102.0, 0)
+    assert not policy.accepts(stored, 98.0, 2)
+    # Within the tie window the higher rank wins
+    assert policy.accepts(stored, 99.5, 2)
+    assert not policy.accepts(stored, 100.5, 0)
+    assert policy.accepts(stored, 100.5, 1)
+
+
+def test_field_versions_count_rejections():
+    policy = StalenessPolicy()
+    versions = FieldVersions(policy)
+    assert versions.accept("@SETPOINT", UpdateSource.REPORTED, 100.0)
+    assert not versions.accept("@SETPOINT", UpdateSource.REST, 100.0)
+    assert versions.accept("@AWAY", UpdateSource.REST, 100.0)
+    assert versions.version("@SETPOINT") == (100.0, 2)
+    assert policy.rejected == 1
+
+
+def test_out_of_order_messages_do_not_regress_state(api, water_heater):
+    api._process_message(Message(update(water_heater, SETPOINT=120), timestamp=100.0))
+    api._process_message(Message(update(water_heater, SETPOINT=125), timestamp=90.0))
+    assert water_heater.set_point == 120
+    # A desired echo right after the report loses the tie
+    api._process_message(Message(update(water_heater, SETPOINT=130), reported=False, timestamp=100.2))
+    assert water_heater.set_point == 120
+    assert api.staleness_policy.rejected == 2
+
+
+def test_rest_snapshot_older_than_mqtt_is_ignored(water_heater):
+    water_heater.update_equipment_info(update(water_heater, SETPOINT=120), source=UpdateSource.REPORTED, observed=100.0)
+    water_heater.update_equipment_info(update(water_heater, SETPOINT=110), source=UpdateSource.REST, observed=95.0)
+    assert water_heater.set_point == 120
+
+
+def test_without_a_policy_the_last_write_wins(api, water_heater):
+    api.set_staleness_policy(None)
+    api._process_message(Message(update(water_heater, SETPOINT=120), timestamp=100.0))
+    api._process_message(Message(update(water_heater, SETPOINT=125), timestamp=90.0))
+    assert water_heater.set_point == 125
+
+
+def test_device_time_is_parsed_from_reported_transaction_ids():
+    assert device_time("WIFI_1.0_2020-05-30T14:17:45.282Z") == 1590848265.282
+    assert device_time("WIFI_1.0_2020-05-30T14:17:45Z") == 1590848265.0
+    assert device_time("ANDROID_2020-05-31T12:56:42") is None
+    assert device_time(None) is None
+
+
+def reported(water_heater, value, stamp):
+    payload = update(water_heater, SETPOINT=value)
+    payload["transactionId"] = f"WIFI_1.0_2020-05-30T14:17:{stamp}Z"
+    return payload
+
+
+def test_reported_messages_are_ordered_by_device_time(api, water_heater):
+    # Received in the reverse order, within the tie window
+    api._process_message(Message(reported(water_heater, 125, "45.900"), timestamp=100.0))
+    api._process_message(Message(reported(water_heater, 120, "45.282"), timestamp=100.1))
+    assert water_heater.set_point == 125
+    api._process_message(Message(reported(water_heater, 130, "46.001"), timestamp=100.2))
+    assert water_heater.set_point == 130
+
+
+def test_device_time_is_not_compared_with_other_sources(api, water_heater):
+    api._process_message(Message(update(water_heater, SETPOINT=120), reported=False, timestamp=100.0))
+    # A device clock far behind ours still wins on receive time
+    api._process_message(Message(reported(water_heater, 125, "45.282"), timestamp=100.5))
+    assert water_heater.set_point == 125